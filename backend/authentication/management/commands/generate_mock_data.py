@@ -11,6 +11,7 @@ from skills.models import Skill
 from random import randint, choice
 import random
 from faker import Faker
+from datetime import timedelta
 
 fake = Faker()
 User = get_user_model()
@@ -61,7 +62,7 @@ class Command(BaseCommand):
 
             # Wallet
             wallet, _ = Wallet.objects.get_or_create(user=user)
-            wallet.balance = randint(20, 200)
+            wallet.balance = randint(20, 200) * 60
             wallet.save()
 
             # Transactions
@@ -73,7 +74,7 @@ class Command(BaseCommand):
                         sender=user,
                         receiver=receiver,
                         transaction_type=choice(["debit", "credit"]),
-                        amount=round(random.uniform(1.0, 5.0), 2),
+                        amount=randint(60, 300),
                         reason="Mock transaction"
                     )
 
@@ -101,6 +102,9 @@ class Command(BaseCommand):
             skill_instance = Skill.objects.get(name=skill_name)
             other_user = choice(users)
             hours = random.uniform(1, 5)
+            scheduled_time = fake.future_datetime()
+            if Booking.objects.find_conflict(other_user, scheduled_time, scheduled_time + timedelta(hours=hours)):
+                continue
             availability_slot = AvailabilitySlot.objects.create(
                 booked_for=other_user,
                 weekday=randint(0, 6),
@@ -113,7 +117,7 @@ class Command(BaseCommand):
                 booked_by=user,
                 booked_for=other_user,
                 status=choice(["pending", "confirmed", "completed", "cancelled"]),
-                scheduled_time=fake.future_datetime(),
+                scheduled_time=scheduled_time,
                 duration=hours * 60,
                 cancel_reason=fake.sentence() if random.choice([True, False]) else None,
                 availability=availability_slot
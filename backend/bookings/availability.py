@@ -0,0 +1,188 @@
+"""
+Free-time arithmetic over weekly AvailabilitySlot recurrences and bookings.
+
+Within the materialized horizon, availability is read from
+AvailabilityOccurrence with a range scan; beyond it the weekly slots are
+expanded on the fly. Times are handled as integer minutes from Monday 00:00 UTC of the week the
+search window starts in, and intervals as half-open (start, end) pairs kept
+sorted and non-overlapping, so merging and subtracting them are single
+linear sweeps. Slot times carry no timezone and are read as UTC.
+"""
+import heapq
+from collections import defaultdict
+from datetime import datetime, time, timedelta, timezone
+from django.conf import settings
+from django.utils.timezone import now
+from .models import ACTIVE_STATUS, AvailabilityOccurrence, AvailabilitySlot, Booking
+
+DAY = 24 * 60
+WEEK = 7 * DAY
+
+
+def week_anchor(moment):
+    """Monday 00:00 UTC of the week containing ``moment``."""
+    day = moment.astimezone(timezone.utc).date()
+    return datetime.combine(day - timedelta(days=day.weekday()), time(), tzinfo=timezone.utc)
+
+
+def to_minutes(moment, anchor, round_up=False):
+    seconds = (moment - anchor).total_seconds()
+    return -int(-seconds // 60) if round_up else int(seconds // 60)
+
+
+def merge(intervals):
+    """Sort intervals and join the ones that overlap or touch."""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def slot_interval(weekday, start_time, end_time):
+    """A weekly slot as (start, end) minutes from Monday 00:00; overnight slots end the next day."""
+    start = weekday * DAY + start_time.hour * 60 + start_time.minute
+    end = weekday * DAY + end_time.hour * 60 + end_time.minute
+    if end <= start:
+        end += DAY
+    return start, end
+
+
+def find_overlap(intervals):
+    """Return two overlapping weekly intervals from ``intervals`` (wrapping Sunday into Monday), or None."""
+    shifted = [(start - WEEK, end - WEEK) for start, end in intervals if end > WEEK]
+    previous = None
+    for interval in sorted(intervals + shifted):
+        if previous is not None and interval[0] < previous[1]:
+            return previous, interval
+        if previous is None or interval[1] > previous[1]:
+            previous = interval
+    return None
+
+
+def weekly_availability(providers, weekdays=None):
+    """Map provider id -> merged weekly intervals in minutes from Monday 00:00."""
+    weekly = defaultdict(list)
+    slots = AvailabilitySlot.objects.filter(booked_for__in=providers)
+    if weekdays is not None:
+        slots = slots.filter(weekday__in=weekdays)
+    rows = slots.values_list('booked_for_id', 'weekday', 'start_time', 'end_time')
+    for provider_id, weekday, start_time, end_time in rows.iterator(chunk_size=5000):
+        weekly[provider_id].append(slot_interval(weekday, start_time, end_time))
+    return {provider_id: merge(intervals) for provider_id, intervals in weekly.items()}
+
+
+def materialized_until():
+    """How far ahead AvailabilityOccurrence can be trusted, leaving a day of slack for the daily roll."""
+    return now() + timedelta(weeks=settings.AVAILABILITY_HORIZON_WEEKS) - timedelta(days=1)
+
+
+def occurrence_intervals(providers, window_start, window_end, anchor):
+    """Map provider id -> merged minute intervals of their availability occurrences inside the window."""
+    intervals = defaultdict(list)
+    low, high = to_minutes(window_start, anchor, round_up=True), to_minutes(window_end, anchor)
+    rows = AvailabilityOccurrence.objects.filter(
+        # No occurrence is longer than a day, which bounds the range scan on start
+        provider__in=providers, start__gte=window_start - timedelta(days=1), start__lt=window_end, end__gt=window_start,
+    ).values_list('provider_id', 'start', 'end')
+    for provider_id, start, end in rows.iterator(chunk_size=5000):
+        intervals[provider_id].append((max(to_minutes(start, anchor), low), min(to_minutes(end, anchor), high)))
+    return {provider_id: merge(provider_intervals) for provider_id, provider_intervals in intervals.items()}
+
+
+def busy_intervals(providers, window_start, window_end, anchor):
+    """Map provider id -> sorted minute intervals of their active bookings inside the window."""
+    busy = defaultdict(list)
+    rows = (
+        Booking.objects.filter(ACTIVE_STATUS, booked_for__in=providers, scheduled_time__lt=window_end, ends_at__gt=window_start)
+        .order_by('booked_for_id', 'scheduled_time')
+        .values_list('booked_for_id', 'scheduled_time', 'ends_at')
+    )
+    for provider_id, start, end in rows.iterator(chunk_size=5000):
+        busy[provider_id].append((to_minutes(start, anchor), to_minutes(end, anchor, round_up=True)))
+    return busy
+
+
+def occurrences(weekly, low, high):
+    """Yield ``weekly`` repeated week after week, merged across week boundaries and clipped to [low, high)."""
+    current = None
+    for week in range(low // WEEK - 1, high // WEEK + 1):
+        offset = week * WEEK
+        for start, end in weekly:
+            start, end = max(start + offset, low), min(end + offset, high)
+            if start >= end:
+                continue
+            if current and start <= current[1]:
+                current = (current[0], max(current[1], end))
+                continue
+            if current:
+                yield current
+            current = (start, end)
+    if current:
+        yield current
+
+
+def subtract(free, busy):
+    """Remove sorted ``busy`` intervals from sorted, merged ``free`` intervals."""
+    i = 0
+    for start, end in free:
+        while i < len(busy) and busy[i][1] <= start:
+            i += 1
+        j = i
+        while j < len(busy) and busy[j][0] < end:
+            if busy[j][0] > start:
+                yield start, busy[j][0]
+            start = max(start, busy[j][1])
+            j += 1
+        if start < end:
+            yield start, end
+
+
+def start_times(free, duration, step):
+    """Yield every start time on the ``step`` grid where ``duration`` fits inside a free interval."""
+    for start, end in free:
+        candidate = -(-start // step) * step
+        while candidate + duration <= end:
+            yield candidate
+            candidate += step
+
+
+def _tagged(provider_id, times):
+    for start in times:
+        yield start, provider_id
+
+
+def free_start_times(providers, window_start, window_end, duration, step):
+    """
+    Yield (start, provider_id) for every bookable start time of ``providers``
+    in the window, ordered by start time and then provider.
+
+    Every stage is a generator and the providers' streams are merged lazily,
+    so reading one page only expands as much of each provider's week as it
+    takes to reach that page.
+    """
+    anchor = week_anchor(window_start)
+    low, high = to_minutes(window_start, anchor, round_up=True), to_minutes(window_end, anchor)
+    duration, step = int(duration.total_seconds()) // 60, int(step.total_seconds()) // 60
+
+    if window_end <= materialized_until():
+        available = occurrence_intervals(providers, window_start, window_end, anchor)
+    else:
+        # Short windows only need their own weekdays (and the day before, for slots running past midnight)
+        days = range(low // DAY - 1, -(-high // DAY))
+        weekdays = sorted({day % 7 for day in days}) if len(days) < 7 else None
+        available = {
+            provider_id: occurrences(intervals, low, high)
+            for provider_id, intervals in weekly_availability(providers, weekdays).items()
+        }
+
+    busy = busy_intervals(providers, window_start, window_end, anchor)
+    streams = [
+        _tagged(provider_id, start_times(subtract(intervals, busy.get(provider_id, [])), duration, step))
+        for provider_id, intervals in available.items()
+    ]
+    for start, provider_id in heapq.merge(*streams):
+        yield anchor + timedelta(minutes=start), provider_id
@@ -0,0 +1,126 @@
+"""
+Weekly availability as a bitmap: one bit per 15-minute cell of the week
+(7 * 24 * 4 = 672 bits, 84 bytes), Monday 00:00 UTC first. A cell is set
+when one of the provider's AvailabilitySlots covers all of it.
+
+Bitmaps are stored in AvailabilityBitmap, rebuilt whenever a slot is
+written, and cached as plain ints so "is P available at T" and "when are A
+and B both available" are bit operations instead of range queries.
+"""
+from datetime import time, timedelta, timezone
+from django.core.cache import cache
+from django.utils.timezone import now
+from .availability import slot_interval
+from .models import AvailabilityBitmap, AvailabilitySlot
+
+CELL_MINUTES = 15
+CELLS_PER_DAY = 24 * 60 // CELL_MINUTES
+CELLS = 7 * CELLS_PER_DAY
+FULL_WEEK = (1 << CELLS) - 1
+BITMAP_BYTES = CELLS // 8
+
+CACHE_TIMEOUT = 24 * 60 * 60
+
+
+def _cache_key(provider_id):
+    return f"availability_bitmap:{provider_id}"
+
+
+def cell_range(start_cell, end_cell):
+    """Bits for cells [start_cell, end_cell), wrapping from Sunday into Monday."""
+    if end_cell <= start_cell:
+        return 0
+    if end_cell - start_cell >= CELLS:
+        return FULL_WEEK
+    bits = ((1 << (end_cell - start_cell)) - 1) << (start_cell % CELLS)
+    return (bits | (bits >> CELLS)) & FULL_WEEK
+
+
+def slot_bits(weekday, start_time, end_time):
+    start, end = slot_interval(weekday, start_time, end_time)
+    return cell_range(-(-start // CELL_MINUTES), end // CELL_MINUTES)
+
+
+def slots_to_bits(slots):
+    """Fold (weekday, start_time, end_time) rows into one bitmap."""
+    bits = 0
+    for weekday, start_time, end_time in slots:
+        bits |= slot_bits(weekday, start_time, end_time)
+    return bits
+
+
+def window_bits(moment, duration):
+    """Bits for the cells touched by [moment, moment + duration)."""
+    moment = moment.astimezone(timezone.utc)
+    start = moment.weekday() * 24 * 60 + moment.hour * 60 + moment.minute
+    end = start + -(-duration // timedelta(minutes=1))
+    return cell_range(start // CELL_MINUTES, -(-end // CELL_MINUTES))
+
+
+def to_bytes(bits):
+    return bits.to_bytes(BITMAP_BYTES, 'big')
+
+
+def from_bytes(data):
+    return int.from_bytes(bytes(data), 'big')
+
+
+def rebuild_bitmap(provider_id):
+    """Recompute a provider's bitmap from their slots, store it and refresh the cache."""
+    bits = slots_to_bits(AvailabilitySlot.objects.filter(booked_for_id=provider_id).values_list('weekday', 'start_time', 'end_time'))
+    # Update first: when a provider is deleted their slots go before the user
+    # row does, and creating a fresh bitmap then would point at a deleted user
+    if not AvailabilityBitmap.objects.filter(provider_id=provider_id).update(bits=to_bytes(bits), updated_at=now()) and bits:
+        AvailabilityBitmap.objects.create(provider_id=provider_id, bits=to_bytes(bits))
+    cache.set(_cache_key(provider_id), bits, CACHE_TIMEOUT)
+    return bits
+
+
+def get_bitmaps(provider_ids):
+    """Map provider id -> bitmap, from the cache where possible and one query for the rest."""
+    provider_ids = list(provider_ids)
+    cached = cache.get_many([_cache_key(provider_id) for provider_id in provider_ids])
+    bitmaps = {}
+    missing = []
+    for provider_id in provider_ids:
+        bits = cached.get(_cache_key(provider_id))
+        if bits is None:
+            missing.append(provider_id)
+        else:
+            bitmaps[provider_id] = bits
+
+    if missing:
+        loaded = {provider_id: 0 for provider_id in missing}
+        for provider_id, data in AvailabilityBitmap.objects.filter(provider_id__in=missing).values_list('provider_id', 'bits'):
+            loaded[provider_id] = from_bytes(data)
+        cache.set_many({_cache_key(provider_id): bits for provider_id, bits in loaded.items()}, CACHE_TIMEOUT)
+        bitmaps.update(loaded)
+    return bitmaps
+
+
+def free_at(provider_ids, moment, duration=timedelta(minutes=CELL_MINUTES)):
+    """The providers whose weekly availability covers [moment, moment + duration)."""
+    mask = window_bits(moment, duration)
+    bitmaps = get_bitmaps(provider_ids)
+    return [provider_id for provider_id in provider_ids if bitmaps[provider_id] & mask == mask]
+
+
+def to_intervals(bits):
+    """Turn a bitmap back into (weekday, start_time, end_time) runs, split at midnight."""
+    intervals = []
+    cell = 0
+    while cell < CELLS:
+        if not bits >> cell & 1:
+            cell += 1
+            continue
+        start = cell
+        day_end = (start // CELLS_PER_DAY + 1) * CELLS_PER_DAY
+        while cell < day_end and bits >> cell & 1:
+            cell += 1
+        intervals.append((start // CELLS_PER_DAY, _cell_time(start % CELLS_PER_DAY), _cell_time(cell % CELLS_PER_DAY)))
+    return intervals
+
+
+def _cell_time(cell):
+    minutes = cell * CELL_MINUTES
+    return time(minutes // 60, minutes % 60)
@@ -0,0 +1,115 @@
+"""
+Per-user iCalendar (.ics) feeds.
+
+Calendar clients poll feeds every few minutes, so a feed is identified by
+its CalendarFeed.version: the version is the strong ETag and the rendered
+body is cached under it. A poll with a current If-None-Match costs one indexed lookup of the
+feed row. Rendering only depends on the feed row (never on the current
+time), so a version always renders to the same bytes.
+"""
+from datetime import timedelta, timezone
+from django.core.cache import cache
+from django.db.models import F, Q
+from django.utils.timezone import now
+from .availability import slot_interval, week_anchor
+from .constants import BookingStatus
+from .models import AvailabilitySlot, Booking, CalendarFeed
+
+CACHE_TIMEOUT = 24 * 60 * 60
+# Bookings that ended up to this long before the feed last changed stay in it
+PAST_WINDOW = timedelta(days=30)
+PRODID = "-//TimeBank//Bookings//EN"
+
+
+def _cache_key(feed):
+    return f"calendar_feed:{feed.pk}:{feed.version}"
+
+
+def bump_calendars(user_ids):
+    """Invalidate the feeds of ``user_ids`` after their bookings or availability changed."""
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    if user_ids:
+        CalendarFeed.objects.filter(user_id__in=user_ids).update(version=F('version') + 1, updated_at=now())
+
+
+def etag(feed):
+    return f'"{feed.pk}-{feed.version}"'
+
+
+def _escape(text):
+    return str(text).replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+
+def _fold(line):
+    """Split a content line into 75-octet pieces as RFC 5545 requires."""
+    data = line.encode()
+    pieces = []
+    while len(data) > 75:
+        cut = 75 if not pieces else 74
+        # Do not cut a UTF-8 sequence in half
+        while data[cut] & 0xC0 == 0x80:
+            cut -= 1
+        pieces.append(data[:cut].decode())
+        data = data[cut:]
+    pieces.append(data.decode())
+    return "\r\n ".join(pieces)
+
+
+def _stamp(moment):
+    return moment.astimezone(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def _event(uid, stamp, start, end, summary, *extra):
+    return [
+        "BEGIN:VEVENT",
+        f"UID:{uid}",
+        f"DTSTAMP:{stamp}",
+        f"DTSTART:{_stamp(start)}",
+        f"DTEND:{_stamp(end)}",
+        f"SUMMARY:{_escape(summary)}",
+        *extra,
+        "END:VEVENT",
+    ]
+
+
+def render_feed(feed):
+    """The feed's bookings and weekly availability as an iCalendar document."""
+    user_id = feed.user_id
+    stamp = _stamp(feed.updated_at)
+    lines = ["BEGIN:VCALENDAR", "VERSION:2.0", f"PRODID:{PRODID}", "CALSCALE:GREGORIAN", "X-WR-CALNAME:TimeBank sessions"]
+
+    bookings = (
+        Booking.objects.filter(Q(booked_by_id=user_id) | Q(booked_for_id=user_id))
+        .filter(status__in=BookingStatus.ACTIVE, ends_at__gt=feed.updated_at - PAST_WINDOW)
+        .order_by('scheduled_time', 'id')
+        .values_list('id', 'status', 'scheduled_time', 'ends_at', 'skill__name', 'booked_by_id', 'booked_by__username', 'booked_for__username')
+    )
+    for booking_id, status, start, end, skill_name, booked_by_id, booked_by, booked_for in bookings:
+        other = booked_for if booked_by_id == user_id else booked_by
+        lines += _event(
+            f"booking-{booking_id}@timebank", stamp, start, end, f"{skill_name} with {other}",
+            f"STATUS:{'CONFIRMED' if status == BookingStatus.CONFIRMED else 'TENTATIVE'}",
+        )
+
+    # Slot times are UTC; each slot repeats weekly from the week the feed last changed
+    anchor = week_anchor(feed.updated_at)
+    slots = AvailabilitySlot.objects.filter(booked_for_id=user_id).order_by('weekday', 'start_time', 'id')
+    for slot_id, weekday, start_time, end_time in slots.values_list('id', 'weekday', 'start_time', 'end_time'):
+        start, end = slot_interval(weekday, start_time, end_time)
+        lines += _event(
+            f"availability-{slot_id}@timebank", stamp, anchor + timedelta(minutes=start), anchor + timedelta(minutes=end),
+            "Available for bookings", "RRULE:FREQ=WEEKLY", "TRANSP:TRANSPARENT",
+        )
+
+    lines.append("END:VCALENDAR")
+    return "".join(_fold(line) + "\r\n" for line in lines)
+
+
+def get_feed_body(feed):
+    """The rendered feed for the feed row's current version, from the cache where possible."""
+    key = _cache_key(feed)
+    body = cache.get(key)
+    if body is None:
+        body = render_feed(feed)
+        cache.set(key, body, CACHE_TIMEOUT)
+    return body
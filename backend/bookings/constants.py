@@ -11,3 +11,6 @@ class BookingStatus:
         (COMPLETED, 'Completed'),
         (CANCELLED, 'Cancelled'),
     ]
+
+    # Statuses that hold the provider's time
+    ACTIVE = (PENDING, CONFIRMED)
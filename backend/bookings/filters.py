@@ -0,0 +1,35 @@
+import django_filters
+from django.db.models import Q
+from .constants import BookingStatus
+from .models import Booking
+
+
+class BookingFilter(django_filters.FilterSet):
+    """
+    Filters for the caller's booking lists. Every combination is served by
+    an index: (booked_for, status, scheduled_time) and
+    (booked_by, scheduled_time) for the two roles, (skill, scheduled_time)
+    for a skill and (booked_by, booked_for, scheduled_time) for a
+    counterpart.
+    """
+    ROLE_CHOICES = [('provider', 'Provider'), ('client', 'Client')]
+
+    role = django_filters.ChoiceFilter(choices=ROLE_CHOICES, method='filter_role', help_text="Only bookings where the caller is the provider (booked_for) or the client (booked_by)")
+    status = django_filters.MultipleChoiceFilter(choices=BookingStatus.CHOICES)
+    skill = django_filters.NumberFilter(field_name='skill_id')
+    counterpart = django_filters.NumberFilter(method='filter_counterpart', help_text="Only bookings between the caller and this user")
+    scheduled_after = django_filters.IsoDateTimeFilter(field_name='scheduled_time', lookup_expr='gte')
+    scheduled_before = django_filters.IsoDateTimeFilter(field_name='scheduled_time', lookup_expr='lt')
+
+    class Meta:
+        model = Booking
+        fields = ['role', 'status', 'skill', 'counterpart', 'scheduled_after', 'scheduled_before']
+
+    def filter_role(self, queryset, name, value):
+        if value == 'provider':
+            return queryset.filter(booked_for=self.request.user)
+        return queryset.filter(booked_by=self.request.user)
+
+    def filter_counterpart(self, queryset, name, value):
+        user = self.request.user
+        return queryset.filter(Q(booked_by=user, booked_for_id=value) | Q(booked_for=user, booked_by_id=value))
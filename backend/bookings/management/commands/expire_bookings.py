@@ -0,0 +1,26 @@
+import time
+from django.core.management.base import BaseCommand
+from bookings.transitions import expire_pending_bookings
+
+
+class Command(BaseCommand):
+    help = (
+        "Cancel pending bookings whose scheduled time has passed and free their slots. "
+        "Run once from cron, or with --loop as a long-running scheduler."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000, help="Bookings expired per UPDATE.")
+        parser.add_argument('--loop', action='store_true', help="Keep running, sweeping every --interval seconds.")
+        parser.add_argument('--interval', type=int, default=60, help="Seconds between sweeps with --loop.")
+
+    def handle(self, *args, **options):
+        while True:
+            expired = expire_pending_bookings(batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f"Expired {expired} pending bookings."))
+            if not options['loop']:
+                return
+            try:
+                time.sleep(options['interval'])
+            except KeyboardInterrupt:
+                return
@@ -0,0 +1,36 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from bookings.ratings import rebuild_ratings
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Recompute the per-provider and per-skill rating aggregates from the reviews."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help="Providers rebuilt per transaction.")
+        parser.add_argument('--user', type=int, action='append', help="Only rebuild these provider ids.")
+
+    def handle(self, *args, **options):
+        if options['user']:
+            chunks = [options['user']]
+        else:
+            chunks = self._chunks(options['chunk_size'])
+
+        users = skills = 0
+        for provider_ids in chunks:
+            rebuilt_users, rebuilt_skills = rebuild_ratings(provider_ids)
+            users += rebuilt_users
+            skills += rebuilt_skills
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt ratings for {users} providers and {skills} skills."))
+
+    def _chunks(self, chunk_size):
+        # Keyset over user ids so each chunk is one index range scan
+        last_id = 0
+        while True:
+            ids = list(User.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:chunk_size])
+            if not ids:
+                return
+            yield ids
+            last_id = ids[-1]
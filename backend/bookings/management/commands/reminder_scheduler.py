@@ -0,0 +1,38 @@
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from bookings.reminders import ReminderScheduler
+
+
+class Command(BaseCommand):
+    help = (
+        "Send session reminders BOOKING_REMINDER_LEAD_MINUTES before confirmed bookings start. "
+        "Runs as a long-lived process; needs the shared (Redis) cache to hear about booking changes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tick', type=int, default=30, help="Seconds between ticks.")
+        parser.add_argument('--lookahead', type=int, default=60, help="Minutes of upcoming reminders kept in memory.")
+        parser.add_argument('--resync', type=int, default=15, help="Minutes between full reloads of the lookahead window.")
+        parser.add_argument('--batch-size', type=int, default=500, help="Reminders claimed and sent per batch.")
+        parser.add_argument('--once', action='store_true', help="Run a single tick and exit.")
+
+    def handle(self, *args, **options):
+        tick = timedelta(seconds=options['tick'])
+        scheduler = ReminderScheduler(
+            tick=tick,
+            lookahead=timedelta(minutes=options['lookahead']),
+            resync=timedelta(minutes=options['resync']),
+            batch_size=options['batch_size'],
+        )
+        while True:
+            started = time.monotonic()
+            sent = scheduler.tick_once()
+            if sent or options['once']:
+                self.stdout.write(self.style.SUCCESS(f"Sent {sent} reminders ({len(scheduler.wheel)} scheduled)."))
+            if options['once']:
+                return
+            try:
+                time.sleep(max(0, tick.total_seconds() - (time.monotonic() - started)))
+            except KeyboardInterrupt:
+                return
@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from bookings.occurrences import roll_forward
+
+
+class Command(BaseCommand):
+    help = (
+        "Drop past availability occurrences and materialize every slot for the next "
+        "AVAILABILITY_HORIZON_WEEKS. Run daily."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help="Occurrences inserted per statement.")
+
+    def handle(self, *args, **options):
+        deleted, created = roll_forward(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Removed {deleted} past occurrences, created {created} "
+            f"(horizon {settings.AVAILABILITY_HORIZON_WEEKS} weeks)."
+        ))
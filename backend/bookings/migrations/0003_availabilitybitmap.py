@@ -0,0 +1,52 @@
+# Weekly availability bitmaps (672 15-minute cells per provider), built
+# from the existing AvailabilitySlot rows.
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+CELL_MINUTES = 15
+CELLS = 7 * 24 * 60 // CELL_MINUTES
+
+
+def build_bitmaps(apps, schema_editor):
+    AvailabilitySlot = apps.get_model('bookings', 'AvailabilitySlot')
+    AvailabilityBitmap = apps.get_model('bookings', 'AvailabilityBitmap')
+
+    bitmaps = {}
+    for provider_id, weekday, start_time, end_time in AvailabilitySlot.objects.values_list('booked_for_id', 'weekday', 'start_time', 'end_time').iterator():
+        start = weekday * 24 * 60 + start_time.hour * 60 + start_time.minute
+        end = weekday * 24 * 60 + end_time.hour * 60 + end_time.minute
+        if end <= start:
+            end += 24 * 60
+        first, last = -(-start // CELL_MINUTES), end // CELL_MINUTES
+        bits = 0
+        for cell in range(first, last):
+            bits |= 1 << (cell % CELLS)
+        bitmaps[provider_id] = bitmaps.get(provider_id, 0) | bits
+
+    AvailabilityBitmap.objects.bulk_create(
+        [AvailabilityBitmap(provider_id=provider_id, bits=bits.to_bytes(CELLS // 8, 'big')) for provider_id, bits in bitmaps.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0002_booking_overlap'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AvailabilityBitmap',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bits', models.BinaryField(max_length=84)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('provider', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='availability_bitmap', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(build_bitmaps, migrations.RunPython.noop),
+    ]
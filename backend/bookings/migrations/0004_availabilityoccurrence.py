@@ -0,0 +1,74 @@
+# Materialized availability occurrences, filled for the configured horizon
+# from the existing slots. `manage.py roll_availability` keeps them current.
+
+from datetime import datetime, time, timedelta, timezone
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Exists, OuterRef
+from django.utils.timezone import now
+
+
+def fill_occurrences(apps, schema_editor):
+    AvailabilitySlot = apps.get_model('bookings', 'AvailabilitySlot')
+    AvailabilityOccurrence = apps.get_model('bookings', 'AvailabilityOccurrence')
+    Booking = apps.get_model('bookings', 'Booking')
+
+    start = now()
+    end = start + timedelta(weeks=settings.AVAILABILITY_HORIZON_WEEKS)
+    today = start.astimezone(timezone.utc).date()
+    monday = datetime.combine(today - timedelta(days=today.weekday() + 7), time(), tzinfo=timezone.utc)
+
+    batch = []
+    for slot_id, provider_id, weekday, start_time, end_time in AvailabilitySlot.objects.values_list(
+            'id', 'booked_for_id', 'weekday', 'start_time', 'end_time').iterator():
+        week = monday
+        while True:
+            occurrence_start = datetime.combine(week.date() + timedelta(days=weekday), start_time, tzinfo=timezone.utc)
+            if occurrence_start >= end:
+                break
+            occurrence_end = datetime.combine(occurrence_start.date(), end_time, tzinfo=timezone.utc)
+            if occurrence_end <= occurrence_start:
+                occurrence_end += timedelta(days=1)
+            if occurrence_end > start:
+                batch.append(AvailabilityOccurrence(slot_id=slot_id, provider_id=provider_id, start=occurrence_start, end=occurrence_end))
+            week += timedelta(weeks=1)
+        if len(batch) >= 5000:
+            AvailabilityOccurrence.objects.bulk_create(batch)
+            batch = []
+    AvailabilityOccurrence.objects.bulk_create(batch)
+
+    AvailabilityOccurrence.objects.update(is_booked=Exists(Booking.objects.filter(
+        booked_for=OuterRef('provider'), status__in=['pending', 'confirmed'],
+        scheduled_time__lt=OuterRef('end'), ends_at__gt=OuterRef('start'),
+    )))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0003_availabilitybitmap'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AvailabilityOccurrence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.DateTimeField()),
+                ('end', models.DateTimeField()),
+                ('is_booked', models.BooleanField(default=False, help_text='Overlaps a pending or confirmed booking')),
+                ('provider', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='availability_occurrences', to=settings.AUTH_USER_MODEL)),
+                ('slot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='occurrences', to='bookings.availabilityslot')),
+            ],
+            options={
+                'indexes': [
+                    models.Index(fields=['start', 'provider'], name='occurrence_start_provider_idx'),
+                    models.Index(fields=['provider', 'start'], name='occurrence_provider_start_idx'),
+                ],
+                'constraints': [models.UniqueConstraint(fields=('slot', 'start'), name='occurrence_unique_slot_start')],
+            },
+        ),
+        migrations.RunPython(fill_occurrences, migrations.RunPython.noop),
+    ]
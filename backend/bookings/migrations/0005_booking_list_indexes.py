@@ -0,0 +1,21 @@
+# Composite indexes behind the paginated booking lists.
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0004_availabilityoccurrence'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['booked_by', 'scheduled_time'], name='booking_client_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['booked_for', 'status', 'scheduled_time'], name='booking_provider_status_idx'),
+        ),
+    ]
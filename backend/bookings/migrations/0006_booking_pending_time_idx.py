@@ -0,0 +1,21 @@
+# Partial index for the expiry sweep over pending bookings that have started.
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0005_booking_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(
+                condition=models.Q(('status', 'pending')),
+                fields=['scheduled_time'],
+                name='booking_pending_time_idx',
+            ),
+        ),
+    ]
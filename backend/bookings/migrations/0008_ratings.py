@@ -0,0 +1,80 @@
+# Denormalized rating aggregates per provider and per skill, filled from the
+# existing reviews, and 1-5 validation on Review.rating.
+
+import django.core.validators
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def fill_ratings(apps, schema_editor):
+    Review = apps.get_model('bookings', 'Review')
+    UserRating = apps.get_model('bookings', 'UserRating')
+    SkillRating = apps.get_model('bookings', 'SkillRating')
+    reviews = Review.objects.filter(rating__gte=1, rating__lte=5)
+    counts = dict(
+        count=Count('id'),
+        total=Sum('rating'),
+        **{f'stars_{stars}': Count('id', filter=Q(rating=stars)) for stars in range(1, 6)},
+    )
+    UserRating.objects.bulk_create(
+        [UserRating(user_id=row.pop('booking__booked_for_id'), **row)
+         for row in reviews.values('booking__booked_for_id').annotate(**counts).order_by()],
+        batch_size=1000,
+    )
+    SkillRating.objects.bulk_create(
+        [SkillRating(skill_id=row.pop('booking__skill_id'), **row)
+         for row in reviews.values('booking__skill_id').annotate(**counts).order_by()],
+        batch_size=1000,
+    )
+
+
+def rating_fields():
+    return [
+        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+        ('count', models.PositiveIntegerField(default=0)),
+        ('total', models.PositiveIntegerField(default=0, help_text='Sum of all ratings')),
+        ('stars_1', models.PositiveIntegerField(default=0)),
+        ('stars_2', models.PositiveIntegerField(default=0)),
+        ('stars_3', models.PositiveIntegerField(default=0)),
+        ('stars_4', models.PositiveIntegerField(default=0)),
+        ('stars_5', models.PositiveIntegerField(default=0)),
+        ('updated_at', models.DateTimeField(auto_now=True)),
+    ]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0007_calendarfeed'),
+        ('skills', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='review',
+            name='rating',
+            field=models.IntegerField(validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(5)]),
+        ),
+        migrations.CreateModel(
+            name='SkillRating',
+            fields=rating_fields() + [
+                ('skill', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='rating', to='skills.skill')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='UserRating',
+            fields=rating_fields() + [
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='rating', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.RunPython(fill_ratings, migrations.RunPython.noop),
+    ]
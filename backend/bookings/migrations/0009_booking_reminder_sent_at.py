@@ -0,0 +1,27 @@
+# Track which bookings have had their session reminder sent, and index the
+# ones still waiting for it by start time.
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0008_ratings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='reminder_sent_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(
+                condition=models.Q(('reminder_sent_at__isnull', True), ('status', 'confirmed')),
+                fields=['scheduled_time'],
+                name='booking_reminder_due_idx',
+            ),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Composite indexes behind the skill and counterpart booking filters.
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0009_booking_reminder_sent_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['skill', 'scheduled_time'], name='booking_skill_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['booked_by', 'booked_for', 'scheduled_time'], name='booking_pair_time_idx'),
+        ),
+    ]
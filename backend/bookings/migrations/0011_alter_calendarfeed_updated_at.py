@@ -0,0 +1,18 @@
+# CalendarFeed.updated_at no longer doubles as the feed's Last-Modified.
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0010_booking_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='calendarfeed',
+            name='updated_at',
+            field=models.DateTimeField(auto_now_add=True, help_text='When version was last bumped'),
+        ),
+    ]
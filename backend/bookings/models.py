@@ -1,43 +1,212 @@
+import secrets
+from datetime import timedelta
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from django.db.models.expressions import RawSQL
 from django.conf import settings
 from bookings.constants import BookingStatus
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
+RATING_MIN, RATING_MAX = 1, 5
 
-class Booking(models.Model):
+def _literal(value):
+    return RawSQL(f"'{value}'", (), output_field=models.CharField())
+
+
+# Status conditions with the values spelled out as literals: SQLite only picks a
+# partial index when the query repeats its condition verbatim, not as bound
+# params. The column side stays an ordinary lookup, so it is qualified with
+# whatever alias the booking table gets in joins and subqueries.
+ACTIVE_STATUS = models.Q(status__in=[_literal(status) for status in BookingStatus.ACTIVE])
+PENDING_STATUS = models.Q(status=_literal(BookingStatus.PENDING))
+REMINDER_DUE = models.Q(status=_literal(BookingStatus.CONFIRMED), reminder_sent_at__isnull=True)
+
+
+class TrackedFieldsMixin:
+    """
+    Remember the column values an instance was loaded (or last saved) with,
+    so save() writes only the columns that changed. Saving an unchanged
+    instance issues no query at all. Pass update_fields explicitly to
+    bypass the tracking.
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = instance._tracked_values()
+        return instance
+
+    def _tracked_values(self):
+        # Deferred fields are not in __dict__ and are left alone
+        return {
+            field.attname: getattr(self, field.attname)
+            for field in self._meta.concrete_fields
+            if not field.primary_key and field.attname in self.__dict__
+        }
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        current = self._tracked_values()
+        fields = kwargs.get('fields')
+        if fields is None:
+            self._loaded_values = current
+        else:
+            # Fields that were not refreshed keep their earlier snapshot
+            refreshed = {self._meta.get_field(name).attname for name in fields}
+            self._loaded_values = {
+                **(getattr(self, '_loaded_values', None) or {}),
+                **{name: value for name, value in current.items() if name in refreshed},
+            }
+
+    def changed_fields(self):
+        """Attnames whose value differs from the database row (all of them for unsaved instances)."""
+        loaded = getattr(self, '_loaded_values', None)
+        current = self._tracked_values()
+        if self._state.adding or loaded is None:
+            return set(current)
+        return {name for name, value in current.items() if name not in loaded or loaded[name] != value}
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and getattr(self, '_loaded_values', None) is not None and kwargs.get('update_fields') is None:
+            changed = self.changed_fields()
+            if changed:
+                changed |= {field.attname for field in self._meta.concrete_fields if getattr(field, 'auto_now', False)}
+            kwargs['update_fields'] = changed
+        super().save(*args, **kwargs)
+        self._loaded_values = self._tracked_values()
+
+
+class BookingQuerySet(models.QuerySet):
+    def find_conflict(self, booked_for, start, end, exclude=None):
+        """
+        Return an active booking of ``booked_for`` overlapping [start, end), or None.
+
+        A provider's active bookings never overlap each other, so only the
+        one starting last before ``end`` can overlap: that is a single seek on
+        booking_provider_active_idx instead of a scan of the provider's bookings.
+        """
+        bookings = self.filter(ACTIVE_STATUS, booked_for=booked_for, scheduled_time__lt=end)
+        if exclude is not None:
+            bookings = bookings.exclude(pk=exclude)
+        previous = bookings.order_by('-scheduled_time').only('id', 'scheduled_time', 'ends_at').first()
+        if previous is not None and previous.ends_at > start:
+            return previous
+        return None
+
+
+class Booking(TrackedFieldsMixin, models.Model):
     skill = models.ForeignKey('skills.Skill', on_delete=models.CASCADE, related_name='bookings')
     booked_by = models.ForeignKey(User, related_name='bookings_made', on_delete=models.CASCADE)
     booked_for = models.ForeignKey(User, related_name='bookings_received', on_delete=models.CASCADE)
     status = models.CharField(max_length=10, choices=BookingStatus.CHOICES, default=BookingStatus.PENDING)
     scheduled_time = models.DateTimeField()
     duration = models.PositiveIntegerField(help_text="Duration in minutes")
+    ends_at = models.DateTimeField(editable=False, help_text="scheduled_time + duration, kept in sync on save")
     created_at = models.DateTimeField(auto_now_add=True)
     cancel_reason = models.TextField(blank=True, null=True)
     availability = models.ForeignKey('AvailabilitySlot', on_delete=models.CASCADE, related_name='bookings', null=True, blank=True)
+    reminder_sent_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = BookingQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Overlap checks look up a provider's active bookings by start time;
+            # on Postgres the booking_no_overlap exclusion constraint backs this up
+            models.Index(
+                fields=['booked_for', 'scheduled_time'],
+                name='booking_provider_active_idx',
+                condition=models.Q(status__in=BookingStatus.ACTIVE),
+            ),
+            # Booking lists: a client's bookings by time, a provider's by status and time
+            models.Index(fields=['booked_by', 'scheduled_time'], name='booking_client_time_idx'),
+            models.Index(fields=['booked_for', 'status', 'scheduled_time'], name='booking_provider_status_idx'),
+            # Booking filters by skill and by counterpart
+            models.Index(fields=['skill', 'scheduled_time'], name='booking_skill_time_idx'),
+            models.Index(fields=['booked_by', 'booked_for', 'scheduled_time'], name='booking_pair_time_idx'),
+            # Expiry sweeps pending bookings whose start has passed
+            models.Index(
+                fields=['scheduled_time'],
+                name='booking_pending_time_idx',
+                condition=models.Q(status=BookingStatus.PENDING),
+            ),
+            # The reminder scheduler loads confirmed, not yet reminded bookings by start time
+            models.Index(
+                fields=['scheduled_time'],
+                name='booking_reminder_due_idx',
+                condition=models.Q(status=BookingStatus.CONFIRMED, reminder_sent_at__isnull=True),
+            ),
+        ]
 
     def __str__(self):
         return f"{self.booked_by} booked {self.booked_for} for {self.skill}"
 
     def save(self, *args, **kwargs):
-        if self.availability:
-            self.availability.is_booked = self.status not in [BookingStatus.CANCELLED, BookingStatus.COMPLETED]
-            self.availability.save()
+        self.ends_at = self.scheduled_time + timedelta(minutes=self.duration)
+        if not self._state.adding and 'scheduled_time' in self.changed_fields():
+            # A rescheduled session gets a fresh reminder
+            self.reminder_sent_at = None
+        # Only touch the slot when something that decides its is_booked flag moved
+        if self.availability_id and self.changed_fields() & {'status', 'availability_id'}:
+            is_booked = self.status not in [BookingStatus.CANCELLED, BookingStatus.COMPLETED]
+            if self.availability.is_booked != is_booked:
+                self.availability.is_booked = is_booked
+                self.availability.save()
         super().save(*args, **kwargs)
 
 
 class Review(models.Model):
     booking = models.OneToOneField("Booking", on_delete=models.CASCADE, related_name="review")
     reviewer = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
-    rating = models.IntegerField()
+    rating = models.IntegerField(validators=[MinValueValidator(RATING_MIN), MaxValueValidator(RATING_MAX)])
     comment = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return f"Review by {self.reviewer.username} for booking {self.booking.id}"
+
+
+class RatingAggregate(models.Model):
+    """Review count, rating sum and star histogram, kept up to date by bookings.ratings."""
+    count = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0, help_text="Sum of all ratings")
+    stars_1 = models.PositiveIntegerField(default=0)
+    stars_2 = models.PositiveIntegerField(default=0)
+    stars_3 = models.PositiveIntegerField(default=0)
+    stars_4 = models.PositiveIntegerField(default=0)
+    stars_5 = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        abstract = True
+
+    @property
+    def average(self):
+        return round(self.total / self.count, 2) if self.count else None
+
+    @property
+    def histogram(self):
+        return {stars: getattr(self, f'stars_{stars}') for stars in range(RATING_MIN, RATING_MAX + 1)}
+
+
+class UserRating(RatingAggregate):
+    """Ratings received by a provider across all their reviewed bookings."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='rating')
+
+    def __str__(self):
+        return f"{self.user} rated {self.average} ({self.count} reviews)"
+
+
+class SkillRating(RatingAggregate):
+    skill = models.OneToOneField('skills.Skill', on_delete=models.CASCADE, related_name='rating')
+
+    def __str__(self):
+        return f"{self.skill} rated {self.average} ({self.count} reviews)"
+
     
-class AvailabilitySlot(models.Model):
+class AvailabilitySlot(TrackedFieldsMixin, models.Model):
     WEEKDAYS = [
         (0, 'Monday'), (1, 'Tuesday'), (2, 'Wednesday'),
         (3, 'Thursday'), (4, 'Friday'), (5, 'Saturday'), (6, 'Sunday'),
@@ -53,4 +222,58 @@ class AvailabilitySlot(models.Model):
         unique_together = ['booked_for', 'weekday', 'start_time', 'end_time']
 
     def __str__(self):
-        return f"{self.booked_for.username} - {self.get_weekday_display()} {self.start_time}-{self.end_time}"
\ No newline at end of file
+        return f"{self.booked_for.username} - {self.get_weekday_display()} {self.start_time}-{self.end_time}"
+
+class AvailabilityBitmap(models.Model):
+    """A provider's weekly availability in 15-minute cells, kept in sync by bookings.bitmaps."""
+    provider = models.OneToOneField(User, on_delete=models.CASCADE, related_name='availability_bitmap')
+    bits = models.BinaryField(max_length=84)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Availability bitmap of {self.provider}"
+
+
+class AvailabilityOccurrence(models.Model):
+    """
+    One concrete UTC occurrence of a weekly AvailabilitySlot, materialized
+    for the next AVAILABILITY_HORIZON_WEEKS by bookings.occurrences.
+    """
+    slot = models.ForeignKey(AvailabilitySlot, on_delete=models.CASCADE, related_name='occurrences')
+    provider = models.ForeignKey(User, on_delete=models.CASCADE, related_name='availability_occurrences')
+    start = models.DateTimeField()
+    end = models.DateTimeField()
+    is_booked = models.BooleanField(default=False, help_text="Overlaps a pending or confirmed booking")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['slot', 'start'], name='occurrence_unique_slot_start'),
+        ]
+        indexes = [
+            models.Index(fields=['start', 'provider'], name='occurrence_start_provider_idx'),
+            models.Index(fields=['provider', 'start'], name='occurrence_provider_start_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.provider} available {self.start:%Y-%m-%d %H:%M}-{self.end:%H:%M}"
+
+
+
+def _feed_token():
+    return secrets.token_urlsafe(32)
+
+
+class CalendarFeed(models.Model):
+    """
+    A user's private iCalendar feed. ``version`` is bumped whenever one of
+    their bookings or availability slots changes; it names the cached
+    rendering and is the feed's ETag, so polls in between are answered with
+    304 Not Modified from this row alone.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='calendar_feed')
+    token = models.CharField(max_length=64, unique=True, default=_feed_token)
+    version = models.PositiveBigIntegerField(default=1)
+    updated_at = models.DateTimeField(auto_now_add=True, help_text="When version was last bumped")
+
+    def __str__(self):
+        return f"Calendar feed for {self.user} (v{self.version})"
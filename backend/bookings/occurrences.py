@@ -0,0 +1,94 @@
+"""
+Concrete availability occurrences.
+
+AvailabilitySlot is a weekly recurrence; AvailabilityOccurrence holds its
+concrete UTC start/end times for the next AVAILABILITY_HORIZON_WEEKS so
+calendars and searches can use an indexed range scan instead of
+re-expanding every slot. Occurrences are regenerated per slot when it is
+saved, their ``is_booked`` flags are refreshed when a provider's bookings
+change, and ``manage.py roll_availability`` extends the horizon daily.
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils.timezone import now
+from .availability import WEEK, slot_interval, week_anchor
+from .models import ACTIVE_STATUS, AvailabilityOccurrence, AvailabilitySlot, Booking
+
+
+def horizon():
+    return now() + timedelta(weeks=settings.AVAILABILITY_HORIZON_WEEKS)
+
+
+def slot_occurrences(slot_id, provider_id, weekday, start_time, end_time, window_start, window_end):
+    """Build (unsaved) occurrences of one slot that overlap [window_start, window_end)."""
+    start_offset, end_offset = slot_interval(weekday, start_time, end_time)
+    anchor = week_anchor(window_start) - timedelta(weeks=1)
+    occurrences = []
+    while True:
+        start = anchor + timedelta(minutes=start_offset)
+        if start >= window_end:
+            return occurrences
+        end = anchor + timedelta(minutes=end_offset)
+        if end > window_start:
+            occurrences.append(AvailabilityOccurrence(slot_id=slot_id, provider_id=provider_id, start=start, end=end))
+        anchor += timedelta(minutes=WEEK)
+
+
+def refresh_booked(occurrences):
+    """Recompute ``is_booked`` for an occurrence queryset with one UPDATE."""
+    overlapping = Booking.objects.filter(
+        ACTIVE_STATUS, booked_for=OuterRef('provider'), scheduled_time__lt=OuterRef('end'), ends_at__gt=OuterRef('start'),
+    )
+    return occurrences.update(is_booked=Exists(overlapping))
+
+
+def refresh_provider(provider_id):
+    """Refresh the booked flags of a provider's upcoming occurrences after their bookings changed."""
+    return refresh_booked(AvailabilityOccurrence.objects.filter(provider_id=provider_id, end__gt=now()))
+
+
+def regenerate_slot(slot):
+    """Replace a slot's upcoming occurrences after it was created or edited."""
+    start, end = now(), horizon()
+    # Read the stored values back: the instance may still hold unparsed input (e.g. time strings)
+    row = AvailabilitySlot.objects.values_list('id', 'booked_for_id', 'weekday', 'start_time', 'end_time').get(pk=slot.pk)
+    with transaction.atomic():
+        AvailabilityOccurrence.objects.filter(slot=slot, end__gt=start).delete()
+        AvailabilityOccurrence.objects.bulk_create(slot_occurrences(*row, start, end))
+        refresh_booked(AvailabilityOccurrence.objects.filter(slot=slot, end__gt=start))
+
+
+def regenerate_provider(provider_id):
+    """Replace all of a provider's upcoming occurrences, e.g. after slots were bulk created."""
+    start, end = now(), horizon()
+    rows = AvailabilitySlot.objects.filter(booked_for_id=provider_id).values_list('id', 'booked_for_id', 'weekday', 'start_time', 'end_time')
+    with transaction.atomic():
+        AvailabilityOccurrence.objects.filter(provider_id=provider_id, end__gt=start).delete()
+        AvailabilityOccurrence.objects.bulk_create([occurrence for row in rows for occurrence in slot_occurrences(*row, start, end)])
+        refresh_provider(provider_id)
+
+
+def roll_forward(batch_size=5000):
+    """
+    Drop past occurrences and materialize every slot up to the horizon.
+    Existing occurrences are kept (the unique (slot, start) constraint skips
+    them), so this only writes the newly uncovered days. Returns
+    (deleted, created).
+    """
+    start, end = now(), horizon()
+    deleted, _ = AvailabilityOccurrence.objects.filter(end__lte=start).delete()
+
+    before = AvailabilityOccurrence.objects.count()
+    batch = []
+    rows = AvailabilitySlot.objects.values_list('id', 'booked_for_id', 'weekday', 'start_time', 'end_time')
+    for row in rows.iterator(chunk_size=batch_size):
+        batch.extend(slot_occurrences(*row, start, end))
+        if len(batch) >= batch_size:
+            AvailabilityOccurrence.objects.bulk_create(batch, batch_size=batch_size, ignore_conflicts=True)
+            batch = []
+    AvailabilityOccurrence.objects.bulk_create(batch, batch_size=batch_size, ignore_conflicts=True)
+
+    refresh_booked(AvailabilityOccurrence.objects.filter(end__gt=start))
+    return deleted, AvailabilityOccurrence.objects.count() - before
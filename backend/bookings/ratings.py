@@ -0,0 +1,67 @@
+"""
+Denormalized rating aggregates.
+
+Every review counts towards the provider it was written about (the
+booking's ``booked_for``) and the booked skill. ``apply_review`` adjusts
+their UserRating and SkillRating rows with F() increments (the Review
+signals call it for single rows); ``rebuild_ratings`` recomputes them from
+the Review table in provider chunks.
+"""
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from skills.models import Skill
+from utils.counters import increment
+from .models import RATING_MAX, RATING_MIN, Review, SkillRating, UserRating
+
+STAR_FIELDS = {stars: f'stars_{stars}' for stars in range(RATING_MIN, RATING_MAX + 1)}
+
+
+def apply_review(provider_id, skill_id, rating, sign=1):
+    """Add a rating to (or with sign=-1, remove it from) the provider's and the skill's aggregates."""
+    if rating not in STAR_FIELDS:
+        return
+    delta = {'count': sign, 'total': sign * rating, STAR_FIELDS[rating]: sign}
+    # Always user first, then skill, so concurrent reviews lock rows in the same order
+    increment(UserRating, {'user_id': provider_id}, delta)
+    increment(SkillRating, {'skill_id': skill_id}, delta)
+
+
+def _aggregates(reviews, key):
+    return (
+        reviews.values(key)
+        .annotate(
+            count=Count('id'),
+            total=Sum('rating'),
+            **{field: Count('id', filter=Q(rating=stars)) for stars, field in STAR_FIELDS.items()},
+        )
+        .order_by()
+    )
+
+
+def rebuild_ratings(provider_ids, batch_size=1000):
+    """
+    Recompute the rating rows of ``provider_ids`` from their reviews, and
+    those of the skills they own or were reviewed for from all of the
+    skills' reviews.
+    """
+    reviews = Review.objects.filter(rating__gte=RATING_MIN, rating__lte=RATING_MAX)
+    provider_reviews = reviews.filter(booking__booked_for_id__in=provider_ids)
+    # Skill rows are deleted and recreated by this same set of ids, so a skill
+    # whose owner is not the reviewed provider (or is unset) cannot be left behind
+    skill_ids = set(provider_reviews.values_list('booking__skill_id', flat=True).distinct())
+    skill_ids.update(Skill.objects.filter(user_id__in=provider_ids).values_list('id', flat=True))
+    user_ratings = [
+        UserRating(user_id=row.pop('booking__booked_for_id'), **row)
+        for row in _aggregates(provider_reviews, 'booking__booked_for_id')
+    ]
+    skill_ratings = [
+        SkillRating(skill_id=row.pop('booking__skill_id'), **row)
+        for row in _aggregates(reviews.filter(booking__skill_id__in=skill_ids), 'booking__skill_id')
+    ]
+
+    with transaction.atomic():
+        UserRating.objects.filter(user_id__in=provider_ids).delete()
+        SkillRating.objects.filter(skill_id__in=skill_ids).delete()
+        UserRating.objects.bulk_create(user_ratings, batch_size=batch_size)
+        SkillRating.objects.bulk_create(skill_ratings, batch_size=batch_size)
+    return len(user_ratings), len(skill_ratings)
@@ -0,0 +1,193 @@
+"""
+Session reminders.
+
+``manage.py reminder_scheduler`` runs a ReminderScheduler: a hashed timing
+wheel of the confirmed bookings whose reminder falls due within the next
+``lookahead``. Each tick it
+
+* re-reads the bookings queued by the booking_changed signal (confirmed,
+  cancelled or rescheduled elsewhere) and moves them in the wheel,
+* loads the next tick's worth of bookings with a range scan on
+  booking_reminder_due_idx,
+* claims the bookings in the current bucket and notifies both participants
+  in batches.
+
+Every tick touches one bucket and one thin slice of the index, so its cost
+does not grow with the number of bookings. The change queue lives in the
+shared cache (Redis in production); anything it misses is picked up by the
+periodic resync, and every booking is re-checked when it is claimed.
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.timezone import now
+from notifications.services import notify_users
+from .models import REMINDER_DUE, Booking
+
+SEQUENCE_KEY = "booking_reminders:sequence"
+CHANGE_TIMEOUT = 60 * 60
+
+
+def _change_key(sequence):
+    return f"booking_reminders:change:{sequence}"
+
+
+def record_changes(booking_ids):
+    """Queue bookings whose status or time changed for the reminder scheduler."""
+    booking_ids = list(booking_ids)
+    if not booking_ids:
+        return
+    cache.add(SEQUENCE_KEY, 0, None)
+    # Reserve one sequence number per booking with a single INCR
+    last = cache.incr(SEQUENCE_KEY, len(booking_ids))
+    first = last - len(booking_ids) + 1
+    cache.set_many({_change_key(first + i): booking_id for i, booking_id in enumerate(booking_ids)}, CHANGE_TIMEOUT)
+
+
+def read_changes(after):
+    """Return (booking ids queued after sequence ``after``, the latest sequence)."""
+    latest = cache.get(SEQUENCE_KEY, 0)
+    if latest <= after:
+        return set(), latest
+    queued = cache.get_many([_change_key(sequence) for sequence in range(after + 1, latest + 1)])
+    return set(queued.values()), latest
+
+
+class TimingWheel:
+    """
+    Hashed timing wheel: ``size`` buckets of ``tick`` each, indexed by
+    absolute tick number modulo ``size``. Scheduling and cancelling are
+    O(1); advancing visits only the buckets of the ticks that passed.
+    """
+
+    def __init__(self, tick, size, start):
+        self.tick_seconds = int(tick.total_seconds())
+        self.size = size
+        # The last tick advanced past: the first advance() covers ``start`` itself
+        self.cursor = self._tick(start) - 1
+        self.buckets = [{} for _ in range(size)]
+        self.positions = {}
+
+    def _tick(self, moment):
+        return int(moment.timestamp()) // self.tick_seconds
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __contains__(self, key):
+        return key in self.positions
+
+    def schedule(self, key, due):
+        """Put ``key`` in the bucket of ``due`` (the next tick if ``due`` has passed), replacing any earlier entry."""
+        self.cancel(key)
+        due_tick = max(self._tick(due), self.cursor + 1)
+        index = due_tick % self.size
+        self.buckets[index][key] = due_tick
+        self.positions[key] = index
+
+    def cancel(self, key):
+        index = self.positions.pop(key, None)
+        if index is not None:
+            del self.buckets[index][key]
+
+    def clear(self):
+        for bucket in self.buckets:
+            bucket.clear()
+        self.positions.clear()
+
+    def advance(self, moment):
+        """Move the wheel to ``moment`` and return the keys that fell due."""
+        target = self._tick(moment)
+        due = []
+        # After a long pause every bucket is visited once, not once per missed tick
+        for tick in range(self.cursor + 1, min(target, self.cursor + self.size) + 1):
+            bucket = self.buckets[tick % self.size]
+            ready = [key for key, due_tick in bucket.items() if due_tick <= target]
+            for key in ready:
+                del bucket[key]
+                del self.positions[key]
+            due.extend(ready)
+        self.cursor = max(self.cursor, target)
+        return due
+
+
+class ReminderScheduler:
+    def __init__(self, tick=timedelta(seconds=30), lookahead=timedelta(hours=1), resync=timedelta(minutes=15),
+                 batch_size=500, lead=None, clock=now):
+        self.tick = tick
+        self.lookahead = lookahead
+        self.resync = resync
+        self.batch_size = batch_size
+        self.lead = lead if lead is not None else timedelta(minutes=settings.BOOKING_REMINDER_LEAD_MINUTES)
+        self.clock = clock
+        # Reminders are at most lookahead ahead, so one revolution is enough
+        self.wheel = TimingWheel(tick, int(lookahead / tick) + 2, clock())
+        self.loaded_until = None
+        self.synced_at = None
+        self.sequence = cache.get(SEQUENCE_KEY, 0)
+
+    def _load(self, start, end):
+        """Schedule every booking whose reminder is due in [start, end)."""
+        rows = Booking.objects.filter(
+            REMINDER_DUE, scheduled_time__gte=start + self.lead, scheduled_time__lt=end + self.lead,
+        ).values_list('id', 'scheduled_time')
+        for booking_id, scheduled_time in rows.iterator(chunk_size=self.batch_size):
+            self.wheel.schedule(booking_id, scheduled_time - self.lead)
+
+    def _apply_changes(self, current):
+        changed, self.sequence = read_changes(self.sequence)
+        if not changed:
+            return
+        for booking_id in changed:
+            self.wheel.cancel(booking_id)
+        # Re-read them: only those still waiting for a reminder inside the loaded window go back in
+        rows = Booking.objects.filter(
+            REMINDER_DUE, pk__in=changed, scheduled_time__gte=current, scheduled_time__lt=self.loaded_until + self.lead,
+        ).values_list('id', 'scheduled_time')
+        for booking_id, scheduled_time in rows:
+            self.wheel.schedule(booking_id, scheduled_time - self.lead)
+
+    def tick_once(self):
+        """Run one tick. Returns the number of bookings reminded."""
+        current = self.clock()
+        until = current + self.lookahead
+        if self.loaded_until is None or current - self.synced_at >= self.resync:
+            # Full (re)load, including reminders that are overdue for sessions that have not started
+            self.wheel.clear()
+            self.sequence = cache.get(SEQUENCE_KEY, 0)
+            self._load(current - self.lead, until)
+            self.synced_at = current
+        else:
+            self._apply_changes(current)
+            self._load(self.loaded_until, until)
+        self.loaded_until = max(self.loaded_until or until, until)
+
+        due = self.wheel.advance(current)
+        sent = 0
+        for i in range(0, len(due), self.batch_size):
+            sent += self._send(due[i:i + self.batch_size], current)
+        return sent
+
+    def _send(self, booking_ids, current):
+        with transaction.atomic():
+            bookings = list(
+                Booking.objects.select_for_update(skip_locked=True, of=('self',))
+                .filter(REMINDER_DUE, pk__in=booking_ids, scheduled_time__gt=current)
+                .select_related('skill', 'booked_by', 'booked_for')
+            )
+            # Moved later since it was loaded and the change was missed: put it back
+            early = [booking for booking in bookings if booking.scheduled_time - self.lead > current + self.tick]
+            for booking in early:
+                self.wheel.schedule(booking.pk, booking.scheduled_time - self.lead)
+            bookings = [booking for booking in bookings if booking not in early]
+            Booking.objects.filter(pk__in=[booking.pk for booking in bookings]).update(reminder_sent_at=current)
+
+        notifications = []
+        for booking in bookings:
+            start = f"{booking.scheduled_time:%Y-%m-%d %H:%M} UTC"
+            notifications.append((booking.booked_by, f"Reminder: your {booking.skill.name} session with {booking.booked_for.username} starts at {start}."))
+            notifications.append((booking.booked_for, f"Reminder: your {booking.skill.name} session with {booking.booked_by.username} starts at {start}."))
+        if notifications:
+            notify_users(notifications, 'reminder', email_subject="Upcoming session reminder")
+        return len(bookings)
@@ -1,10 +1,40 @@
+from contextlib import contextmanager
+from django.db import IntegrityError, transaction
 from django.utils.timezone import now
-from datetime import timedelta, timezone
-from bookings.models import AvailabilitySlot, Booking, BookingStatus,Review
+from datetime import time, timedelta, timezone
+from bookings.models import AvailabilityOccurrence, AvailabilitySlot, Booking, BookingStatus,Review
 from rest_framework import serializers
 from datetime import timedelta
 
 from skills.serializers import SkillSerializer
+from .availability import DAY, find_overlap, slot_interval
+from .bitmaps import rebuild_bitmap
+from .calendar import bump_calendars
+from .occurrences import regenerate_provider
+
+
+def minutes_to_time(minutes):
+    minutes %= DAY
+    return time(minutes // 60, minutes % 60)
+
+
+def describe_interval(interval):
+    start, end = interval
+    weekday = dict(AvailabilitySlot.WEEKDAYS)[start // DAY % 7]
+    return f"{weekday} {minutes_to_time(start):%H:%M}-{minutes_to_time(end):%H:%M}"
+
+
+@contextmanager
+def overlap_guard():
+    """
+    Turn a violation of the booking_no_overlap constraint (two overlapping
+    bookings racing past validate() on Postgres) into a validation error.
+    """
+    try:
+        with transaction.atomic():
+            yield
+    except IntegrityError:
+        raise serializers.ValidationError("booked_for has another booking that overlaps with this time.")
 
 
 class BookingCreateSerializer(serializers.ModelSerializer):
@@ -40,16 +70,8 @@ class BookingCreateSerializer(serializers.ModelSerializer):
         #     raise serializers.ValidationError("booked_for is not available during the selected time.")
 
         # Prevent overlapping bookings
-        # overlap = Booking.objects.filter(
-        #     booked_for=booked_for,
-        #     scheduled_time__lt=end_time,
-        #     status__in=[BookingStatus.PENDING, BookingStatus.CONFIRMED]
-        # ).filter(
-        #     scheduled_time__gte=scheduled_time - timedelta(minutes=duration)
-        # ).exists()
-
-        # if overlap:
-        #     raise serializers.ValidationError("booked_for has another booking that overlaps with this time.")
+        if Booking.objects.find_conflict(booked_for, scheduled_time, end_time) is not None:
+            raise serializers.ValidationError("booked_for has another booking that overlaps with this time.")
 
         availability_id = data.get('availability_id')
         try:
@@ -63,12 +85,11 @@ class BookingCreateSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         booked_by = self.context['request'].user
         validated_data.pop("booked_by", None)
-        availability = validated_data.pop('availability')
-        booking = Booking.objects.create(booked_by=booked_by, status=BookingStatus.PENDING, **validated_data)
-        availability.is_booked = True
-        availability.save()
-        return booking
-        
+        validated_data.pop('availability_id', None)
+        # Booking.save marks the slot as booked
+        with overlap_guard():
+            return Booking.objects.create(booked_by=booked_by, status=BookingStatus.PENDING, **validated_data)
+
 
 class BookingActionSerializer(serializers.ModelSerializer):
     cancel_reason = serializers.CharField(required=False, allow_blank=True)
@@ -112,6 +133,10 @@ class BookingDetailSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class BookingBulkCompleteSerializer(serializers.Serializer):
+    booking_ids = serializers.ListField(child=serializers.IntegerField(min_value=1), min_length=1, max_length=200)
+
+
 class BookingRescheduleSerializer(serializers.ModelSerializer):
     class Meta:
         model = Booking
@@ -122,12 +147,17 @@ class BookingRescheduleSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Only pending or confirmed bookings can be rescheduled.")
         if data['scheduled_time'] <= now():
             raise serializers.ValidationError("Scheduled time must be in the future.")
+
+        end_time = data['scheduled_time'] + timedelta(minutes=data.get('duration', self.instance.duration))
+        if Booking.objects.find_conflict(self.instance.booked_for_id, data['scheduled_time'], end_time, exclude=self.instance.pk) is not None:
+            raise serializers.ValidationError("booked_for has another booking that overlaps with this time.")
         return data
 
     def update(self, instance, validated_data):
         instance.scheduled_time = validated_data.get('scheduled_time', instance.scheduled_time)
         instance.duration = validated_data.get('duration', instance.duration)
-        instance.save()
+        with overlap_guard():
+            instance.save()
         return instance
 
 
@@ -137,6 +167,12 @@ class ReviewSerializer(serializers.ModelSerializer):
         fields = ['id', 'booking', 'reviewer', 'rating', 'comment', 'created_at']
         read_only_fields = ['id', 'reviewer', 'created_at', 'booking']
 
+class RatingSerializer(serializers.Serializer):
+    count = serializers.IntegerField()
+    average = serializers.FloatField(allow_null=True)
+    histogram = serializers.DictField(child=serializers.IntegerField())
+
+
 class ReviewListSerializer(serializers.ModelSerializer):
     class Meta:
         model = Review
@@ -156,6 +192,133 @@ class AvailabilitySlotSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
+class AvailabilitySlotInputSerializer(serializers.Serializer):
+    weekday = serializers.ChoiceField(choices=AvailabilitySlot.WEEKDAYS)
+    start_time = serializers.TimeField()
+    end_time = serializers.TimeField()
+
+
+class AvailabilityTemplateSerializer(serializers.Serializer):
+    """A recurrence template, e.g. Mon-Fri 09:00-12:00 in 30-minute slots."""
+    weekdays = serializers.ListField(child=serializers.ChoiceField(choices=AvailabilitySlot.WEEKDAYS), allow_empty=False)
+    start_time = serializers.TimeField()
+    end_time = serializers.TimeField()
+    slot_minutes = serializers.IntegerField(min_value=5, max_value=24 * 60, required=False,
+                                            help_text="Split the range into slots of this length; omit for one slot per day")
+
+    def validate(self, data):
+        start, end = slot_interval(0, data['start_time'], data['end_time'])
+        if data.get('slot_minutes', 0) > end - start:
+            raise serializers.ValidationError({"slot_minutes": "Must not be longer than the range from start_time to end_time."})
+        return data
+
+    def expand(self, data):
+        start, end = slot_interval(0, data['start_time'], data['end_time'])
+        length = data.get('slot_minutes') or end - start
+        slots = []
+        for weekday in data['weekdays']:
+            cursor = start
+            while cursor + length <= end:
+                # Pieces of an overnight range that start after midnight fall on the next day
+                slots.append(((weekday + cursor // DAY) % 7, minutes_to_time(cursor), minutes_to_time(cursor + length)))
+                cursor += length
+        return slots
+
+
+class AvailabilityBulkCreateSerializer(serializers.Serializer):
+    MAX_SLOTS = 500
+
+    slots = AvailabilitySlotInputSerializer(many=True, required=False)
+    template = AvailabilityTemplateSerializer(required=False)
+
+    def validate(self, data):
+        if ('slots' in data) == ('template' in data):
+            raise serializers.ValidationError("Provide either slots or a template.")
+        if 'template' in data:
+            requested = self.fields['template'].expand(data['template'])
+        else:
+            requested = [(slot['weekday'], slot['start_time'], slot['end_time']) for slot in data['slots']]
+        requested = list(dict.fromkeys(requested))
+        if len(requested) > self.MAX_SLOTS:
+            raise serializers.ValidationError(f"At most {self.MAX_SLOTS} slots can be created at once.")
+
+        # Check overlaps in memory against each other and the user's existing slots;
+        # slots that already exist verbatim are skipped rather than rejected
+        user = self.context['request'].user
+        existing = set(AvailabilitySlot.objects.filter(booked_for=user).values_list('weekday', 'start_time', 'end_time'))
+        new = [slot for slot in requested if slot not in existing]
+        overlap = find_overlap([slot_interval(*slot) for slot in new + list(existing)])
+        if overlap:
+            raise serializers.ValidationError(
+                "Slots overlap: " + " and ".join(describe_interval(interval) for interval in overlap) + "."
+            )
+
+        data['new'] = new
+        data['skipped'] = len(requested) - len(new)
+        return data
+
+    def create(self, validated_data):
+        user = self.context['request'].user
+        new = validated_data['new']
+        with transaction.atomic():
+            AvailabilitySlot.objects.bulk_create(
+                [AvailabilitySlot(booked_for=user, weekday=weekday, start_time=start, end_time=end) for weekday, start, end in new],
+                ignore_conflicts=True,
+            )
+            # bulk_create skips post_save, so refresh the derived availability here
+            rebuild_bitmap(user.id)
+            regenerate_provider(user.id)
+            bump_calendars([user.id])
+        wanted = set(new)
+        return [
+            slot for slot in AvailabilitySlot.objects.filter(booked_for=user).order_by('weekday', 'start_time')
+            if (slot.weekday, slot.start_time, slot.end_time) in wanted
+        ]
+
+
+class AvailabilityOccurrenceSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = AvailabilityOccurrence
+        fields = ['id', 'slot', 'start', 'end', 'is_booked']
+
+
+class FreeSlotSearchSerializer(serializers.Serializer):
+    """Query parameters of the free-slot search."""
+    MAX_WINDOW = timedelta(days=31)
+
+    skill = serializers.CharField(required=False, help_text="Skill name (case-insensitive)")
+    tag = serializers.CharField(required=False)
+    start = serializers.DateTimeField()
+    end = serializers.DateTimeField()
+    duration = serializers.IntegerField(min_value=15, max_value=8 * 60, help_text="Minutes")
+    step = serializers.IntegerField(min_value=5, max_value=60, default=30, help_text="Minutes between candidate start times")
+    page_size = serializers.IntegerField(min_value=1, max_value=200, default=50)
+    after = serializers.CharField(required=False, help_text="Cursor from the previous page")
+
+    def validate_after(self, value):
+        try:
+            start, provider_id = value.rsplit('_', 1)
+            return serializers.DateTimeField().to_internal_value(start), int(provider_id)
+        except (ValueError, serializers.ValidationError):
+            raise serializers.ValidationError("Invalid cursor.")
+
+    def validate(self, data):
+        if not data.get('skill') and not data.get('tag'):
+            raise serializers.ValidationError("Provide a skill or a tag.")
+        data['start'] = max(data['start'], now())
+        if data['end'] <= data['start']:
+            raise serializers.ValidationError("end must be after start and in the future.")
+        if data['end'] - data['start'] > self.MAX_WINDOW:
+            raise serializers.ValidationError("The search window can be at most 31 days.")
+        return data
+
+
+class FreeAtSerializer(serializers.Serializer):
+    providers = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=500)
+    at = serializers.DateTimeField()
+    duration = serializers.IntegerField(min_value=1, max_value=8 * 60, default=15, help_text="Minutes")
+
+
 class BookingCancelSerializer(serializers.ModelSerializer):
     cancel_reason = serializers.CharField(required=True)
 
@@ -168,12 +331,6 @@ class BookingCancelSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError({"status": "Status must be CANCELLED when cancelling."})
         return data
 
-    def update(self, instance, validated_data):
-        instance.status = BookingStatus.CANCELLED
-        instance.cancel_reason = validated_data.get('cancel_reason')
-        instance.save()
-        return instance
-
 class BookingStatusOnlySerializer(serializers.ModelSerializer):
     class Meta:
         model = Booking
@@ -183,9 +340,3 @@ class BookingStatusOnlySerializer(serializers.ModelSerializer):
         if data.get('status') == BookingStatus.CANCELLED:
             raise serializers.ValidationError({"status": "Use the cancel endpoint to cancel a booking."})
         return data
-
-    def update(self, instance, validated_data):
-        instance.status = validated_data.get('status', instance.status)
-        instance.cancel_reason = None  # Clear any existing cancel reason
-        instance.save()
-        return instance
@@ -1,8 +1,29 @@
-from django.db.models.signals import post_save
-from django.dispatch import receiver
-from .models import Booking
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+from .bitmaps import rebuild_bitmap
+from .calendar import bump_calendars
+from .occurrences import refresh_provider, regenerate_slot
+from .models import AvailabilitySlot, Booking, Review
+from .ratings import apply_review
+from .reminders import record_changes
 from notifications.models import Notification
 
+# Sent (after commit) with ``booking_ids`` when bookings change status or
+# time, including through the UPDATE-based transitions that skip post_save
+booking_changed = Signal()
+
+# Columns whose change can move a booking's interval or take it in or out of the active set
+BOOKING_TIME_FIELDS = {'status', 'scheduled_time', 'duration', 'ends_at', 'booked_for', 'booked_for_id'}
+
+# Columns the calendar feeds show
+BOOKING_CALENDAR_FIELDS = BOOKING_TIME_FIELDS | {'skill', 'skill_id', 'booked_by', 'booked_by_id'}
+
+
+def _only_is_booked(update_fields):
+    # Slots flip is_booked on every booking; that does not change their times
+    return update_fields is not None and set(update_fields) <= {'is_booked'}
+
 @receiver(post_save, sender=Booking)
 def booking_created(sender, instance, created, **kwargs):
     if created:
@@ -18,3 +39,67 @@ def booking_created(sender, instance, created, **kwargs):
             type='booking_status',
             content=f"Your booking was {instance.status} by {instance.booked_for.username}."
         )
+
+
+@receiver(post_save, sender=AvailabilitySlot)
+@receiver(post_delete, sender=AvailabilitySlot)
+def availability_slot_changed(sender, instance, **kwargs):
+    if _only_is_booked(kwargs.get('update_fields')):
+        return
+    rebuild_bitmap(instance.booked_for_id)
+    bump_calendars([instance.booked_for_id])
+
+
+@receiver(post_save, sender=AvailabilitySlot)
+def availability_slot_saved(sender, instance, **kwargs):
+    # Deleted slots take their occurrences with them (on_delete=CASCADE)
+    if _only_is_booked(kwargs.get('update_fields')):
+        return
+    regenerate_slot(instance)
+
+
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+def booking_times_changed(sender, instance, **kwargs):
+    update_fields = kwargs.get('update_fields')
+    if update_fields is not None and not BOOKING_TIME_FIELDS & set(update_fields):
+        return
+    refresh_provider(instance.booked_for_id)
+
+
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+def booking_calendars_changed(sender, instance, **kwargs):
+    update_fields = kwargs.get('update_fields')
+    if update_fields is not None and not BOOKING_CALENDAR_FIELDS & set(update_fields):
+        return
+    bump_calendars([instance.booked_by_id, instance.booked_for_id])
+
+
+@receiver(post_save, sender=Review)
+def review_created(sender, instance, created, **kwargs):
+    if created:
+        booking = instance.booking
+        apply_review(booking.booked_for_id, booking.skill_id, instance.rating)
+
+
+@receiver(post_delete, sender=Review)
+def review_deleted(sender, instance, **kwargs):
+    # Reviews go before their booking when it is deleted, so the row is still there
+    row = Booking.objects.filter(pk=instance.booking_id).values_list('booked_for_id', 'skill_id').first()
+    if row is not None:
+        apply_review(*row, instance.rating, sign=-1)
+
+
+@receiver(post_save, sender=Booking)
+def booking_saved(sender, instance, **kwargs):
+    update_fields = kwargs.get('update_fields')
+    if update_fields is not None and not {'status', 'scheduled_time'} & set(update_fields):
+        return
+    booking_ids = [instance.pk]
+    transaction.on_commit(lambda: booking_changed.send(sender=Booking, booking_ids=booking_ids))
+
+
+@receiver(booking_changed)
+def queue_reminder_changes(sender, booking_ids, **kwargs):
+    record_changes(booking_ids)
@@ -1,3 +1,754 @@
-from django.test import TestCase
+from datetime import time, timedelta
+from importlib import import_module
+from itertools import combinations, product
+from io import StringIO
+from unittest.mock import patch
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, models
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils.http import http_date
+from django.utils.timezone import now
+from notifications.models import Notification
+from rest_framework.test import APIClient
+from skills.models import Skill
+from wallet.models import Transaction, Wallet
+from wallet.ledger import ledger_balance
+from wallet.utils import place_hold
+from . import bitmaps
+from .filters import BookingFilter
+from .models import ACTIVE_STATUS, AvailabilityOccurrence, AvailabilitySlot, Booking, BookingStatus, Review, SkillRating, UserRating
+from .ratings import rebuild_ratings
+from .reminders import ReminderScheduler, TimingWheel
+from .transitions import cancel_booking, complete_booking, confirm_booking, expire_pending_bookings
 
-# Create your tests here.
+User = get_user_model()
+
+
+class BookingActionAPITestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client_user = User.objects.create_user(username="client", email="client@example.com", password="testpass")
+        self.provider = User.objects.create_user(username="provider", email="provider@example.com", password="testpass")
+        self.skill = Skill.objects.create(user=self.provider, name="Guitar", location="remote")
+        self.client.force_authenticate(user=self.provider)
+
+    def make_booking(self, status=BookingStatus.CONFIRMED, duration=60):
+        booking = Booking.objects.create(
+            skill=self.skill, booked_by=self.client_user, booked_for=self.provider, status=status,
+            scheduled_time=now() + timedelta(days=1), duration=duration,
+        )
+        if status == BookingStatus.CONFIRMED:
+            place_hold(booking)
+        return booking
+
+    def test_complete_replays_with_idempotency_key(self):
+        booking = self.make_booking()
+        url = f"/bookings/{booking.id}/complete/"
+        first = self.client.patch(url, {"status": "completed"}, format="json", HTTP_IDEMPOTENCY_KEY="done-1")
+        replay = self.client.patch(url, {"status": "completed"}, format="json", HTTP_IDEMPOTENCY_KEY="done-1")
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(replay.json(), first.json())
+        self.assertEqual(Transaction.objects.count(), 2)
+        self.assertEqual(Wallet.objects.get(user=self.provider).balance, 660)
+
+    def test_confirm_runs_wallet_side_effect_once(self):
+        booking = self.make_booking(status=BookingStatus.PENDING)
+        url = f"/bookings/{booking.id}/confirm/"
+        self.assertEqual(self.client.patch(url, {"status": "confirmed"}, format="json").status_code, 200)
+        self.assertEqual(self.client.patch(url, {"status": "confirmed"}, format="json").status_code, 400)
+        self.assertEqual(Wallet.objects.get(user=self.client_user).held, 60)
+
+    def test_transition_only_applies_once(self):
+        booking = self.make_booking()
+        stale = Booking.objects.get(pk=booking.pk)
+        self.assertEqual(complete_booking(booking), 1)
+        self.assertEqual(complete_booking(stale), 0)
+        self.assertEqual(Transaction.objects.count(), 2)
+
+    def test_failed_side_effect_rolls_back_status(self):
+        """An unaffordable confirmation leaves the booking pending"""
+        booking = self.make_booking(status=BookingStatus.PENDING, duration=6000)
+        response = self.client.patch(f"/bookings/{booking.id}/confirm/", {"status": "confirmed"}, format="json")
+        self.assertEqual(response.status_code, 400)
+        booking.refresh_from_db()
+        self.assertEqual(booking.status, BookingStatus.PENDING)
+
+    def test_cancel_releases_hold(self):
+        booking = self.make_booking()
+        self.client.force_authenticate(user=self.client_user)
+        response = self.client.patch(f"/bookings/{booking.id}/cancel/", {"status": "cancelled", "cancel_reason": "Sick"}, format="json")
+        self.assertEqual(response.json()["status"], "cancelled")
+        self.assertEqual(Wallet.objects.get(user=self.client_user).held, 0)
+
+
+class BookingOverlapTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client_user = User.objects.create_user(username="client", email="client@example.com", password="testpass")
+        self.provider = User.objects.create_user(username="provider", email="provider@example.com", password="testpass")
+        self.skill = Skill.objects.create(user=self.provider, name="Guitar", location="remote")
+        self.start = (now() + timedelta(days=2)).replace(hour=10, minute=0, second=0, microsecond=0)
+        self.existing = Booking.objects.create(
+            skill=self.skill, booked_by=self.client_user, booked_for=self.provider,
+            scheduled_time=self.start, duration=60,
+        )
+        self.client.force_authenticate(user=self.client_user)
+
+    def request_booking(self, offset_minutes, duration=60):
+        slot = AvailabilitySlot.objects.create(booked_for=self.provider, weekday=self.start.weekday(),
+                                               start_time=f"{8 + offset_minutes // 60:02d}:{offset_minutes % 60:02d}", end_time="20:00")
+        return self.client.post("/bookings/", {
+            "booked_for": self.provider.id, "skill": self.skill.id, "availability_id": slot.id,
+            "scheduled_time": (self.start + timedelta(minutes=offset_minutes)).isoformat(), "duration": duration,
+        }, format="json")
+
+    def test_find_conflict(self):
+        self.assertEqual(Booking.objects.find_conflict(self.provider, self.start + timedelta(minutes=30), self.start + timedelta(hours=2)), self.existing)
+        self.assertIsNone(Booking.objects.find_conflict(self.provider, self.start + timedelta(hours=1), self.start + timedelta(hours=2)))
+        self.assertIsNone(Booking.objects.find_conflict(self.provider, self.start, self.start + timedelta(hours=1), exclude=self.existing.pk))
+
+    def test_status_conditions_name_the_booking_column(self):
+        """ACTIVE_STATUS stays unambiguous when joined to another table with a status column"""
+        place_hold(Booking.objects.create(
+            skill=self.skill, booked_by=self.client_user, booked_for=self.provider, status=BookingStatus.CONFIRMED,
+            scheduled_time=self.start + timedelta(hours=2), duration=60,
+        ))
+        held = Booking.objects.filter(ACTIVE_STATUS, wallet_hold__status="held")
+        self.assertEqual(held.get().status, BookingStatus.CONFIRMED)
+
+    def test_create_rejects_overlap(self):
+        self.assertEqual(self.request_booking(30).status_code, 400)
+        self.assertEqual(self.request_booking(60).status_code, 201)
+
+    def test_cancelled_bookings_do_not_conflict(self):
+        Booking.objects.filter(pk=self.existing.pk).update(status=BookingStatus.CANCELLED)
+        self.assertEqual(self.request_booking(0).status_code, 201)
+
+    def test_migration_refuses_existing_overlaps(self):
+        check_no_overlaps = import_module("bookings.migrations.0002_booking_overlap").check_no_overlaps
+        for booked_for, offset in ((self.provider, 90), (self.client_user, 30)):
+            Booking.objects.create(skill=self.skill, booked_by=self.client_user, booked_for=booked_for,
+                                   scheduled_time=self.start + timedelta(minutes=offset), duration=60)
+        check_no_overlaps(apps, None)
+
+        overlapping = Booking.objects.create(skill=self.skill, booked_by=self.client_user, booked_for=self.provider,
+                                             scheduled_time=self.start + timedelta(minutes=30), duration=60)
+        with self.assertRaisesMessage(RuntimeError, f"{self.existing.id} and {overlapping.id}"):
+            check_no_overlaps(apps, None)
+        self.assertFalse(Booking.objects.filter(status=BookingStatus.CANCELLED).exists())
+
+    def test_reschedule_rejects_overlap(self):
+        other = Booking.objects.create(
+            skill=self.skill, booked_by=self.client_user, booked_for=self.provider,
+            scheduled_time=self.start + timedelta(hours=3), duration=60,
+        )
+        url = f"/bookings/{other.id}/reschedule/"
+        response = self.client.patch(url, {"scheduled_time": (self.start + timedelta(minutes=45)).isoformat()}, format="json")
+        self.assertEqual(response.status_code, 400)
+        response = self.client.patch(url, {"scheduled_time": (self.start + timedelta(minutes=60)).isoformat()}, format="json")
+        self.assertEqual(response.status_code, 200)
+        other.refresh_from_db()
+        self.assertEqual(other.ends_at, self.start + timedelta(hours=2))
+
+
+class FreeSlotSearchTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client_user = User.objects.create_user(username="client", email="client@example.com", password="testpass")
+        self.client.force_authenticate(user=self.client_user)
+        self.monday = (now() + timedelta(days=7 - now().weekday())).replace(hour=0, minute=0, second=0, microsecond=0)
+        self.providers = []
+        for i in range(2):
+            provider = User.objects.create_user(username=f"provider{i}", email=f"provider{i}@example.com", password="testpass")
+            Skill.objects.create(user=provider, name="Guitar", location="remote", is_offered=True, tags=["music"] if i else [])
+            AvailabilitySlot.objects.create(booked_for=provider, weekday=0, start_time="09:00", end_time="12:00")
+            self.providers.append(provider)
+        skill = Skill.objects.get(user=self.providers[0])
+        Booking.objects.create(skill=skill, booked_by=self.client_user, booked_for=self.providers[0],
+                               scheduled_time=self.monday + timedelta(hours=10), duration=60)
+
+    def search(self, **params):
+        params = {"start": self.monday.isoformat(), "end": (self.monday + timedelta(days=1)).isoformat(), "duration": 60, **params}
+        return self.client.get("/bookings/availability/search/", params)
+
+    def test_bookings_are_subtracted(self):
+        results = self.search(skill="guitar").json()["results"]
+        starts = [(r["provider"], r["start"][11:16]) for r in results if r["provider"] == self.providers[0].id]
+        self.assertEqual(starts, [(self.providers[0].id, "09:00"), (self.providers[0].id, "11:00")])
+        self.assertEqual(len(results), 7)
+        self.assertEqual(results, sorted(results, key=lambda r: (r["start"], r["provider"])))
+
+    def test_tag_filter_and_cursor(self):
+        first = self.search(tag="music", page_size=3).json()
+        self.assertEqual({r["provider"] for r in first["results"]}, {self.providers[1].id})
+        second = self.client.get(first["next"]).json()
+        self.assertEqual([r["start"][11:16] for r in first["results"] + second["results"]], ["09:00", "09:30", "10:00", "10:30", "11:00"])
+        self.assertIsNone(second["next"])
+
+    @override_settings(AVAILABILITY_HORIZON_WEEKS=0)
+    def test_expands_slots_beyond_horizon(self):
+        """Windows past the materialized occurrences give the same answer from the weekly slots"""
+        with override_settings(AVAILABILITY_HORIZON_WEEKS=8):
+            materialized = self.search(skill="guitar").json()["results"]
+        self.assertEqual(self.search(skill="guitar").json()["results"], materialized)
+
+    def test_requires_skill_or_tag(self):
+        self.assertEqual(self.search().status_code, 400)
+
+
+class AvailabilityBitmapTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.alice = User.objects.create_user(username="alice", email="alice@example.com", password="testpass")
+        self.bob = User.objects.create_user(username="bob", email="bob@example.com", password="testpass")
+        self.client.force_authenticate(user=self.alice)
+        # Tuesday 17:00-19:00 and 18:30-20:00
+        AvailabilitySlot.objects.create(booked_for=self.alice, weekday=1, start_time="17:00", end_time="19:00")
+        self.slot = AvailabilitySlot.objects.create(booked_for=self.bob, weekday=1, start_time="18:30", end_time="20:00")
+        self.tuesday = (now() + timedelta(days=(1 - now().weekday()) % 7)).replace(hour=18, minute=0, second=0, microsecond=0)
+
+    def test_slot_bits(self):
+        self.assertEqual(bitmaps.slot_bits(0, time(0, 0), time(0, 30)), 0b11)
+        # Sunday 23:00 to Monday 00:30 wraps around the week
+        self.assertEqual(bitmaps.slot_bits(6, time(23, 0), time(0, 30)), 0b11 | 0b1111 << (bitmaps.CELLS - 4))
+
+    def test_free_at(self):
+        response = self.client.post("/bookings/availability/free-at/", {
+            "providers": [self.alice.id, self.bob.id], "at": self.tuesday.isoformat(), "duration": 60,
+        }, format="json")
+        self.assertEqual(response.json()["free"], [self.alice.id])
+
+        self.slot.start_time = time(18, 0)
+        self.slot.save()
+        self.assertEqual(bitmaps.free_at([self.alice.id, self.bob.id], self.tuesday, timedelta(hours=1)), [self.alice.id, self.bob.id])
+
+        self.slot.delete()
+        self.assertEqual(bitmaps.free_at([self.bob.id], self.tuesday), [])
+
+    def test_overlap(self):
+        response = self.client.get(f"/bookings/availability/overlap/{self.bob.id}/")
+        self.assertEqual(response.json(), [{"weekday": 1, "start_time": "18:30:00", "end_time": "19:00:00"}])
+
+
+class AvailabilityOccurrenceTestCase(TestCase):
+    def setUp(self):
+        self.client_user = User.objects.create_user(username="client", email="client@example.com", password="testpass")
+        self.provider = User.objects.create_user(username="provider", email="provider@example.com", password="testpass")
+        self.skill = Skill.objects.create(user=self.provider, name="Guitar", location="remote")
+        self.slot = AvailabilitySlot.objects.create(booked_for=self.provider, weekday=2, start_time="09:00", end_time="12:00")
+
+    def test_slot_writes_regenerate_occurrences(self):
+        occurrences = AvailabilityOccurrence.objects.filter(slot=self.slot)
+        self.assertIn(occurrences.count(), (8, 9))
+        self.assertTrue(all(o.start.weekday() == 2 and o.start.hour == 9 and o.end.hour == 12 for o in occurrences))
+
+        self.slot.end_time = time(10, 0)
+        self.slot.save()
+        self.assertEqual({o.end.hour for o in occurrences.all()}, {10})
+
+    def test_bookings_flag_occurrences(self):
+        occurrence = AvailabilityOccurrence.objects.order_by("start").last()
+        booking = Booking.objects.create(skill=self.skill, booked_by=self.client_user, booked_for=self.provider,
+                                         scheduled_time=occurrence.start + timedelta(minutes=30), duration=30)
+        occurrence.refresh_from_db()
+        self.assertTrue(occurrence.is_booked)
+
+        cancel_booking(booking, "Changed plans")
+        occurrence.refresh_from_db()
+        self.assertFalse(occurrence.is_booked)
+
+    def test_roll_availability(self):
+        AvailabilityOccurrence.objects.all().delete()
+        out = StringIO()
+        call_command("roll_availability", stdout=out)
+        self.assertIn(AvailabilityOccurrence.objects.count(), (8, 9))
+        self.assertIn("Removed 0 past occurrences", out.getvalue())
+
+    def test_calendar_lists_occurrences(self):
+        response = APIClient().get(f"/bookings/availability/user/{self.provider.id}/occurrences/")
+        page = response.json()
+        self.assertEqual(len(page["results"]), 1)
+        self.assertIsNone(page["next"])
+
+
+class AvailabilityBulkCreateTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.provider = User.objects.create_user(username="provider", email="provider@example.com", password="testpass")
+        self.client.force_authenticate(user=self.provider)
+
+    def test_template_expands_into_slots(self):
+        response = self.client.post("/bookings/availability/bulk/", {
+            "template": {"weekdays": [0, 1, 2, 3, 4], "start_time": "09:00", "end_time": "12:00", "slot_minutes": 30},
+        }, format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["created"], 30)
+        self.assertEqual(AvailabilitySlot.objects.filter(booked_for=self.provider).count(), 30)
+        # Derived availability is refreshed even though bulk_create skips signals
+        self.assertEqual(AvailabilityOccurrence.objects.filter(provider=self.provider).values("slot").distinct().count(), 30)
+        self.assertEqual(bitmaps.get_bitmaps([self.provider.id])[self.provider.id], bitmaps.slot_bits(0, time(9), time(12)) * sum(1 << (96 * d) for d in range(5)))
+
+        # Re-posting the same template is a no-op
+        response = self.client.post("/bookings/availability/bulk/", {
+            "template": {"weekdays": [0], "start_time": "09:00", "end_time": "10:00", "slot_minutes": 30},
+        }, format="json")
+        self.assertEqual((response.json()["created"], response.json()["skipped"]), (0, 2))
+
+    def test_overnight_template_moves_pieces_after_midnight_to_the_next_day(self):
+        response = self.client.post("/bookings/availability/bulk/", {
+            "template": {"weekdays": [6], "start_time": "23:00", "end_time": "01:00", "slot_minutes": 60},
+        }, format="json")
+        self.assertEqual(response.status_code, 201)
+        slots = AvailabilitySlot.objects.filter(booked_for=self.provider).order_by("start_time")
+        self.assertEqual(list(slots.values_list("weekday", "start_time", "end_time")), [(0, time(0), time(1)), (6, time(23), time(0))])
+
+    def test_template_rejects_slot_longer_than_range(self):
+        response = self.client.post("/bookings/availability/bulk/", {
+            "template": {"weekdays": [0], "start_time": "09:00", "end_time": "10:00", "slot_minutes": 90},
+        }, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("slot_minutes", str(response.json()))
+
+    def test_overlaps_are_rejected(self):
+        AvailabilitySlot.objects.create(booked_for=self.provider, weekday=6, start_time="23:00", end_time="01:00")
+        response = self.client.post("/bookings/availability/bulk/", {"slots": [
+            {"weekday": 2, "start_time": "09:00", "end_time": "10:00"},
+            {"weekday": 0, "start_time": "00:30", "end_time": "02:00"},
+        ]}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Sunday 23:00-01:00", str(response.json()))
+        self.assertEqual(AvailabilitySlot.objects.filter(booked_for=self.provider).count(), 1)
+
+
+class BookingDirtyFieldsTestCase(TestCase):
+    def setUp(self):
+        self.client_user = User.objects.create_user(username="client", email="client@example.com", password="testpass")
+        self.provider = User.objects.create_user(username="provider", email="provider@example.com", password="testpass")
+        self.skill = Skill.objects.create(user=self.provider, name="Guitar", location="remote")
+        self.slot = AvailabilitySlot.objects.create(booked_for=self.provider, weekday=0, start_time=time(9), end_time=time(12))
+        Booking.objects.create(
+            skill=self.skill, booked_by=self.client_user, booked_for=self.provider, availability=self.slot,
+            scheduled_time=now() + timedelta(days=1), duration=60,
+        )
+        self.booking = Booking.objects.get()
+
+    def test_creating_booking_marks_slot_booked(self):
+        self.slot.refresh_from_db()
+        self.assertTrue(self.slot.is_booked)
+
+    def test_unchanged_save_writes_nothing(self):
+        with self.assertNumQueries(0):
+            self.booking.save()
+
+    def test_unrelated_change_leaves_slot_alone(self):
+        self.booking.cancel_reason = "Running late"
+        with self.assertNumQueries(1):
+            self.booking.save()
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.cancel_reason, "Running late")
+
+    def test_status_change_frees_slot(self):
+        self.booking.status = BookingStatus.CANCELLED
+        self.booking.save()
+        self.slot.refresh_from_db()
+        self.assertFalse(self.slot.is_booked)
+
+    def test_refresh_from_db_resets_snapshot(self):
+        Booking.objects.filter(pk=self.booking.pk).update(cancel_reason="Changed elsewhere")
+        self.booking.refresh_from_db()
+        self.booking.cancel_reason = None
+        self.booking.save()
+        self.assertIsNone(Booking.objects.get(pk=self.booking.pk).cancel_reason)
+
+
+class BookingListTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client_user = User.objects.create_user(username="client", email="client@example.com", password="testpass")
+        self.provider = User.objects.create_user(username="provider", email="provider@example.com", password="testpass")
+        self.skill = Skill.objects.create(user=self.provider, name="Guitar", location="remote")
+        start = now() + timedelta(days=1)
+        for i in range(15):
+            Booking.objects.create(
+                skill=self.skill, booked_by=self.client_user, booked_for=self.provider, duration=60,
+                status=BookingStatus.CONFIRMED if i % 3 == 0 else BookingStatus.PENDING,
+                scheduled_time=start + timedelta(hours=2 * i),
+            )
+        self.client.force_authenticate(user=self.client_user)
+
+    def test_my_bookings_are_cursor_paginated(self):
+        with self.assertNumQueries(1):
+            first = self.client.get("/bookings/my/bookings/").json()
+        self.assertEqual(len(first["results"]), 10)
+        self.assertEqual(first["results"][0]["booked_for"], "provider")
+        self.assertEqual(first["results"][0]["skill"]["name"], "Guitar")
+        second = self.client.get(first["next"]).json()
+        self.assertEqual(len(second["results"]), 5)
+        self.assertIsNone(second["next"])
+        times = [booking["scheduled_time"] for booking in first["results"] + second["results"]]
+        self.assertEqual(times, sorted(times, reverse=True))
+
+    def test_list_filters_by_status_and_date(self):
+        after = Booking.objects.order_by("scheduled_time")[10].scheduled_time
+        for url in ("/bookings/list/", "/bookings/my/bookings/"):
+            with self.subTest(url=url):
+                # One query per page, however many rows and related objects it lists
+                with self.assertNumQueries(1):
+                    response = self.client.get(url, {"status": "confirmed"})
+                self.assertEqual(len(response.json()["results"]), 5)
+
+                response = self.client.get(url, {"scheduled_after": after.isoformat(), "status": "pending"})
+                self.assertEqual(len(response.json()["results"]), 4)
+
+                response = self.client.get(url, {"status": "unknown"})
+                self.assertEqual(response.status_code, 400)
+
+
+class ExpireBookingsTestCase(TestCase):
+    def setUp(self):
+        self.client_user = User.objects.create_user(username="client", email="client@example.com", password="testpass")
+        self.provider = User.objects.create_user(username="provider", email="provider@example.com", password="testpass")
+        self.skill = Skill.objects.create(user=self.provider, name="Guitar", location="remote")
+
+    def make_booking(self, scheduled_time, status=BookingStatus.PENDING, weekday=0):
+        slot = AvailabilitySlot.objects.create(booked_for=self.provider, weekday=weekday, start_time=time(9), end_time=time(12))
+        return Booking.objects.create(
+            skill=self.skill, booked_by=self.client_user, booked_for=self.provider, availability=slot,
+            status=status, scheduled_time=scheduled_time, duration=60,
+        )
+
+    def test_expires_stale_pending_bookings_in_batches(self):
+        stale = [self.make_booking(now() - timedelta(days=1, hours=2 * i), weekday=i) for i in range(3)]
+        confirmed = self.make_booking(now() - timedelta(days=5), status=BookingStatus.CONFIRMED, weekday=3)
+        upcoming = self.make_booking(now() + timedelta(days=1), weekday=4)
+        Notification.objects.all().delete()
+
+        out = StringIO()
+        call_command("expire_bookings", "--batch-size", "2", stdout=out)
+        self.assertIn("Expired 3", out.getvalue())
+
+        for booking in stale:
+            booking.refresh_from_db()
+            self.assertEqual((booking.status, booking.cancel_reason), (BookingStatus.CANCELLED, "Expired"))
+            self.assertFalse(AvailabilitySlot.objects.get(pk=booking.availability_id).is_booked)
+        self.assertEqual(Booking.objects.get(pk=confirmed.pk).status, BookingStatus.CONFIRMED)
+        self.assertEqual(Booking.objects.get(pk=upcoming.pk).status, BookingStatus.PENDING)
+        self.assertEqual(Notification.objects.filter(user=self.client_user, type="booking_status").count(), 3)
+
+        call_command("expire_bookings", stdout=out)
+        self.assertIn("Expired 0", out.getvalue())
+
+    def test_interrupted_run_notifies_every_committed_batch(self):
+        for i in range(3):
+            self.make_booking(now() - timedelta(days=1, hours=2 * i), weekday=i)
+        Notification.objects.all().delete()
+
+        with patch("bookings.transitions.announce", side_effect=[None, RuntimeError("worker killed")]):
+            with self.assertRaises(RuntimeError):
+                expire_pending_bookings(batch_size=2)
+        self.assertEqual(Booking.objects.filter(status=BookingStatus.CANCELLED).count(), 2)
+        self.assertEqual(Notification.objects.filter(user=self.client_user, type="booking_status").count(), 2)
+
+
+class CalendarFeedTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client_user = User.objects.create_user(username="client", email="client@example.com", password="testpass")
+        self.provider = User.objects.create_user(username="provider", email="provider@example.com", password="testpass")
+        self.skill = Skill.objects.create(user=self.provider, name="Guitar, acoustic", location="remote")
+        AvailabilitySlot.objects.create(booked_for=self.provider, weekday=6, start_time=time(23), end_time=time(1))
+        self.booking = Booking.objects.create(
+            skill=self.skill, booked_by=self.client_user, booked_for=self.provider,
+            scheduled_time=now() + timedelta(days=1), duration=60,
+        )
+        self.client.force_authenticate(user=self.provider)
+        self.url = self.client.get("/bookings/calendar/").json()["url"]
+        self.client.force_authenticate(user=None)
+
+    def test_feed_lists_bookings_and_availability(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/calendar; charset=utf-8")
+        body = response.content.decode()
+        self.assertIn(f"UID:booking-{self.booking.id}@timebank", body)
+        self.assertIn("SUMMARY:Guitar\\, acoustic with client", body)
+        self.assertIn("RRULE:FREQ=WEEKLY", body)
+        self.assertTrue(body.endswith("END:VCALENDAR\r\n"))
+
+    def test_unchanged_feed_is_not_modified_without_booking_queries(self):
+        first = self.client.get(self.url)
+        with self.assertNumQueries(1):
+            again = self.client.get(self.url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(again.status_code, 304)
+
+    def test_booking_change_invalidates_feed(self):
+        first = self.client.get(self.url)
+        cancel_booking(self.booking, "Sick")
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], first["ETag"])
+        self.assertNotIn(f"booking-{self.booking.id}@", response.content.decode())
+
+    def test_change_within_the_same_second_is_not_hidden_by_if_modified_since(self):
+        first = self.client.get(self.url)
+        self.assertFalse(first.has_header("Last-Modified"))
+        # A client that only sends If-Modified-Since, from the same second as a bump
+        since = http_date(now().timestamp() + 1)
+        cancel_booking(self.booking, "Sick")
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=since)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(f"booking-{self.booking.id}@", response.content.decode())
+
+    def test_rotated_token_stops_old_url(self):
+        self.client.force_authenticate(user=self.provider)
+        new_url = self.client.post("/bookings/calendar/").json()["url"]
+        self.client.force_authenticate(user=None)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.assertEqual(self.client.get(new_url).status_code, 200)
+
+
+class RatingAggregateTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client_user = User.objects.create_user(username="client", email="client@example.com", password="testpass")
+        self.provider = User.objects.create_user(username="provider", email="provider@example.com", password="testpass")
+        self.skill = Skill.objects.create(user=self.provider, name="Guitar", location="remote")
+        self.client.force_authenticate(user=self.provider)
+
+    def review(self, rating):
+        booking = Booking.objects.create(
+            skill=self.skill, booked_by=self.client_user, booked_for=self.provider, status=BookingStatus.COMPLETED,
+            scheduled_time=now() - timedelta(days=Booking.objects.count() + 1), duration=60,
+        )
+        return self.client.post(f"/bookings/{booking.id}/review/", {"rating": rating, "comment": "Great"}, format="json")
+
+    def test_reviews_update_aggregates(self):
+        for rating in (5, 4, 5):
+            self.assertEqual(self.review(rating).status_code, 201)
+        summary = self.client.get(f"/bookings/ratings/user/{self.provider.id}/").json()
+        self.assertEqual(summary, {"count": 3, "average": 4.67, "histogram": {"1": 0, "2": 0, "3": 0, "4": 1, "5": 2}})
+        self.assertEqual(self.client.get(f"/bookings/ratings/skill/{self.skill.id}/").json()["count"], 3)
+
+        Review.objects.filter(rating=4).delete()
+        self.assertEqual(UserRating.objects.get(user=self.provider).histogram, {1: 0, 2: 0, 3: 0, 4: 0, 5: 2})
+
+    def test_out_of_range_rating_is_rejected(self):
+        self.assertEqual(self.review(6).status_code, 400)
+        self.assertFalse(UserRating.objects.exists())
+
+    def test_rebuild_command_matches_incremental_aggregates(self):
+        for rating in (1, 3, 3):
+            self.review(rating)
+        expected = SkillRating.objects.values("count", "total", "stars_1", "stars_3").get()
+        SkillRating.objects.update(count=0, total=0, stars_1=0, stars_3=0)
+        UserRating.objects.all().delete()
+
+        out = StringIO()
+        call_command("rebuild_ratings", "--chunk-size", "1", stdout=out)
+        self.assertIn("1 providers and 1 skills", out.getvalue())
+        self.assertEqual(SkillRating.objects.values("count", "total", "stars_1", "stars_3").get(), expected)
+        self.assertEqual(UserRating.objects.get(user=self.provider).average, 2.33)
+
+    def test_rebuild_handles_skills_owned_by_someone_else(self):
+        """Skill rows are rebuilt by the reviewed skills, whoever owns them"""
+        Skill.objects.filter(pk=self.skill.pk).update(user=None)
+        for rating in (2, 4):
+            self.review(rating)
+        rebuild_ratings([self.provider.id])
+        self.assertEqual(SkillRating.objects.get(skill=self.skill).average, 3)
+        self.assertEqual(UserRating.objects.get(user=self.provider).count, 2)
+
+
+class BookingBulkCompleteTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.provider = User.objects.create_user(username="provider", email="provider@example.com", password="testpass")
+        self.skill = Skill.objects.create(user=self.provider, name="Guitar", location="remote")
+        self.attendees = [
+            User.objects.create_user(username=f"attendee{i}", email=f"attendee{i}@example.com", password="testpass")
+            for i in range(3)
+        ]
+        self.start = now() + timedelta(days=1)
+        self.client.force_authenticate(user=self.provider)
+
+    def make_booking(self, user, status=BookingStatus.CONFIRMED, hold=True, duration=60, offset=0):
+        booking = Booking.objects.create(
+            skill=self.skill, booked_by=user, booked_for=self.provider, status=status,
+            scheduled_time=self.start + timedelta(hours=2 * offset), duration=duration,
+        )
+        if hold:
+            place_hold(booking)
+        return booking
+
+    def test_group_session_completes_in_one_batch(self):
+        group = [self.make_booking(user, offset=i) for i, user in enumerate(self.attendees)]
+        pending = self.make_booking(self.attendees[0], status=BookingStatus.PENDING, hold=False, offset=5)
+        ids = [booking.id for booking in group] + [pending.id]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post("/bookings/complete/bulk/", {"booking_ids": ids}, format="json")
+        self.assertEqual(response.json(), {"completed": ids[:3], "skipped": [pending.id]})
+        self.assertEqual(Booking.objects.filter(status=BookingStatus.COMPLETED).count(), 3)
+        self.assertEqual(Wallet.objects.get(user=self.provider).balance, 780)
+        for user in self.attendees:
+            wallet = Wallet.objects.get(user=user)
+            self.assertEqual((wallet.balance, wallet.held), (540, 0))
+        self.assertEqual(Transaction.objects.filter(booking__in=group).count(), 6)
+        self.assertEqual(self.provider.stats.sessions_completed, 3)
+
+    def test_unaffordable_attendee_fails_the_whole_batch(self):
+        paid = self.make_booking(self.attendees[0])
+        # Confirmed before holds existed and too long for the wallet
+        broke = self.make_booking(self.attendees[1], hold=False, duration=700, offset=1)
+        response = self.client.post("/bookings/complete/bulk/", {"booking_ids": [paid.id, broke.id]}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Booking.objects.filter(status=BookingStatus.COMPLETED).exists())
+        self.assertEqual(Wallet.objects.get(user=self.attendees[0]).held, 60)
+        self.assertFalse(Transaction.objects.exists())
+
+    @override_settings(WALLET_LEDGER_JOURNAL=True)
+    def test_journal_mode_posts_ledger_pairs(self):
+        group = [self.make_booking(user, offset=i) for i, user in enumerate(self.attendees)]
+        response = self.client.post("/bookings/complete/bulk/", {"booking_ids": [booking.id for booking in group]}, format="json")
+        self.assertEqual(len(response.json()["completed"]), 3)
+        self.assertEqual(ledger_balance(self.provider.wallet.pk), 780)
+        self.assertEqual(ledger_balance(self.attendees[0].wallet.pk), 540)
+        self.assertEqual(Wallet.objects.get(user=self.attendees[0]).held, 0)
+
+
+class ReminderSchedulerTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client_user = User.objects.create_user(username="client", email="client@example.com", password="testpass")
+        self.provider = User.objects.create_user(username="provider", email="provider@example.com", password="testpass")
+        self.skill = Skill.objects.create(user=self.provider, name="Guitar", location="remote")
+        self.current = now()
+
+    def make_booking(self, minutes_ahead, status=BookingStatus.CONFIRMED):
+        return Booking.objects.create(
+            skill=self.skill, booked_by=self.client_user, booked_for=self.provider, status=status,
+            scheduled_time=self.current + timedelta(minutes=minutes_ahead), duration=30,
+        )
+
+    def scheduler(self):
+        return ReminderScheduler(lead=timedelta(minutes=60), clock=lambda: self.current)
+
+    def test_timing_wheel_fires_due_keys_once(self):
+        wheel = TimingWheel(timedelta(seconds=30), 10, self.current)
+        wheel.schedule("a", self.current + timedelta(seconds=60))
+        wheel.schedule("b", self.current + timedelta(seconds=90))
+        wheel.schedule("c", self.current - timedelta(minutes=5))
+        wheel.cancel("b")
+        self.assertEqual(wheel.advance(self.current + timedelta(seconds=30)), ["c"])
+        self.assertEqual(wheel.advance(self.current + timedelta(minutes=10)), ["a"])
+        self.assertEqual(len(wheel), 0)
+
+    def test_reminds_due_confirmed_bookings_once(self):
+        due = self.make_booking(45)
+        self.make_booking(45, status=BookingStatus.PENDING)
+        later = self.make_booking(180)
+        Notification.objects.all().delete()
+        scheduler = self.scheduler()
+
+        self.assertEqual(scheduler.tick_once(), 1)
+        self.assertEqual(Notification.objects.filter(type="reminder").count(), 2)
+        self.assertIsNotNone(Booking.objects.get(pk=due.pk).reminder_sent_at)
+        self.assertEqual(scheduler.tick_once(), 0)
+
+        # Two hours later the second booking falls due, loaded one tick at a time
+        for _ in range(240):
+            self.current += timedelta(seconds=30)
+            scheduler.tick_once()
+        self.assertIsNotNone(Booking.objects.get(pk=later.pk).reminder_sent_at)
+        self.assertEqual(Notification.objects.filter(type="reminder").count(), 4)
+
+    def test_picks_up_bookings_confirmed_after_loading(self):
+        scheduler = self.scheduler()
+        scheduler.tick_once()
+        booking = self.make_booking(90, status=BookingStatus.PENDING)
+        with self.captureOnCommitCallbacks(execute=True):
+            confirm_booking(booking)
+
+        self.current += timedelta(minutes=30, seconds=30)
+        self.assertEqual(scheduler.tick_once(), 1)
+
+    def test_rescheduling_resets_reminder(self):
+        booking = self.make_booking(30)
+        self.scheduler().tick_once()
+        booking.refresh_from_db()
+        booking.scheduled_time += timedelta(days=1)
+        booking.save()
+        self.assertIsNone(Booking.objects.get(pk=booking.pk).reminder_sent_at)
+
+
+class BookingFilterTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client_user = User.objects.create_user(username="client", email="client@example.com", password="testpass")
+        self.provider = User.objects.create_user(username="provider", email="provider@example.com", password="testpass")
+        self.other = User.objects.create_user(username="other", email="other@example.com", password="testpass")
+        self.guitar = Skill.objects.create(user=self.provider, name="Guitar", location="remote")
+        self.piano = Skill.objects.create(user=self.client_user, name="Piano", location="remote")
+        start = now() + timedelta(days=1)
+        for i, (skill, booked_by, booked_for) in enumerate([
+            (self.guitar, self.client_user, self.provider),
+            (self.guitar, self.other, self.provider),
+            (self.piano, self.provider, self.client_user),
+            (self.piano, self.other, self.client_user),
+        ]):
+            Booking.objects.create(
+                skill=skill, booked_by=booked_by, booked_for=booked_for, duration=60,
+                status=BookingStatus.CONFIRMED if i % 2 else BookingStatus.PENDING,
+                scheduled_time=start + timedelta(hours=2 * i),
+            )
+        self.client.force_authenticate(user=self.provider)
+
+    def ids(self, **params):
+        return sorted(booking["id"] for booking in self.client.get("/bookings/list/", params).json()["results"])
+
+    def test_filters(self):
+        self.assertEqual(len(self.ids()), 3)
+        self.assertEqual(len(self.ids(role="provider")), 2)
+        self.assertEqual(len(self.ids(role="client")), 1)
+        self.assertEqual(len(self.ids(skill=self.piano.id)), 1)
+        self.assertEqual(len(self.ids(counterpart=self.client_user.id)), 2)
+        self.assertEqual(len(self.ids(status=["pending", "confirmed"], role="provider")), 2)
+        self.assertEqual(len(self.ids(status="confirmed", counterpart=self.other.id)), 1)
+
+    def test_every_filter_combination_uses_an_index(self):
+        request = RequestFactory().get("/bookings/list/")
+        request.user = self.provider
+        base = Booking.objects.filter(models.Q(booked_by=self.provider) | models.Q(booked_for=self.provider))
+        values = {
+            "status": ["confirmed"],
+            "skill": self.guitar.id,
+            "counterpart": self.client_user.id,
+            "scheduled_after": now().isoformat(),
+            "scheduled_before": (now() + timedelta(days=7)).isoformat(),
+        }
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                # Tiny test tables would otherwise always be scanned sequentially
+                cursor.execute("SET enable_seqscan = off")
+            for role, size in product([None, "provider", "client"], range(len(values) + 1)):
+                for names in combinations(values, size):
+                    data = {name: values[name] for name in names}
+                    if role:
+                        data["role"] = role
+                    filterset = BookingFilter(data, queryset=base, request=request)
+                    self.assertTrue(filterset.is_valid(), filterset.errors)
+                    plan = filterset.qs.order_by("-scheduled_time", "-id")[:11].explain()
+                    with self.subTest(filters=data):
+                        if connection.vendor == "postgresql":
+                            self.assertNotIn("Seq Scan", plan)
+                        else:
+                            full_scans = [line for line in plan.splitlines() if "SCAN bookings_booking" in line and "INDEX" not in line]
+                            self.assertEqual(full_scans, [], plan)
@@ -0,0 +1,177 @@
+"""
+Booking state machine.
+
+Every status change is a single conditional UPDATE
+(``UPDATE ... WHERE id = ? AND status IN (...)``). Only the request whose
+UPDATE changed the row runs the side effects (wallet, availability, stats),
+so two concurrent confirms or completes can never both charge the wallet.
+"""
+from django.db import transaction
+from django.utils.timezone import now
+from leaderboard.services import update_user_stats
+from notifications.models import Notification
+from wallet.utils import process_booking_cancellation, process_booking_completion, process_booking_confirmation, process_bulk_booking_completion
+from .calendar import bump_calendars
+from .constants import BookingStatus
+from .models import PENDING_STATUS, AvailabilityOccurrence, AvailabilitySlot, Booking
+from .occurrences import refresh_booked, refresh_provider
+from .signals import booking_changed
+
+# Target status -> statuses it may be reached from
+TRANSITIONS = {
+    BookingStatus.CONFIRMED: (BookingStatus.PENDING,),
+    BookingStatus.CANCELLED: (BookingStatus.PENDING, BookingStatus.CONFIRMED),
+    BookingStatus.COMPLETED: (BookingStatus.CONFIRMED,),
+}
+
+
+def _free_availability(booking):
+    if booking.availability_id:
+        AvailabilitySlot.objects.filter(pk=booking.availability_id).update(is_booked=False)
+
+
+def _on_confirm(booking):
+    process_booking_confirmation(booking)
+
+
+def _on_cancel(booking):
+    process_booking_cancellation(booking)
+    _free_availability(booking)
+    refresh_provider(booking.booked_for_id)
+
+
+def _on_complete(booking):
+    process_booking_completion(booking)
+    _free_availability(booking)
+    refresh_provider(booking.booked_for_id)
+    transaction.on_commit(lambda: update_user_stats(booking.booked_for))
+
+
+SIDE_EFFECTS = {
+    BookingStatus.CONFIRMED: _on_confirm,
+    BookingStatus.CANCELLED: _on_cancel,
+    BookingStatus.COMPLETED: _on_complete,
+}
+
+
+def announce(booking_ids):
+    """Send booking_changed for ``booking_ids`` once the current transaction commits."""
+    booking_ids = list(booking_ids)
+    transaction.on_commit(lambda: booking_changed.send(sender=Booking, booking_ids=booking_ids))
+
+
+def transition(booking, to_status, **fields):
+    """
+    Move ``booking`` to ``to_status`` and run that transition's side effects.
+
+    Returns the number of rows changed: 0 if the booking was no longer in an
+    allowed source status (someone else got there first), 1 otherwise. If a
+    side effect fails (e.g. insufficient balance) the status change is rolled
+    back with it.
+    """
+    with transaction.atomic():
+        changed = Booking.objects.filter(pk=booking.pk, status__in=TRANSITIONS[to_status]).update(status=to_status, **fields)
+        if changed:
+            booking.status = to_status
+            for name, value in fields.items():
+                setattr(booking, name, value)
+            SIDE_EFFECTS[to_status](booking)
+            # The UPDATE above skips post_save
+            bump_calendars([booking.booked_by_id, booking.booked_for_id])
+            announce([booking.pk])
+    return changed
+
+
+def confirm_booking(booking):
+    return transition(booking, BookingStatus.CONFIRMED)
+
+
+def cancel_booking(booking, reason):
+    return transition(booking, BookingStatus.CANCELLED, cancel_reason=reason)
+
+
+def complete_booking(booking):
+    return transition(booking, BookingStatus.COMPLETED, cancel_reason=None)
+
+
+def complete_bookings(provider, booking_ids):
+    """
+    Complete many of ``provider``'s confirmed bookings at once, e.g. every
+    attendee of a group session.
+
+    The bookings move to completed with one UPDATE, the wallets are settled
+    with one charge per payer and one credit to the provider, and slots,
+    occurrences, calendars and the provider's stats are refreshed once for
+    the batch. Bookings that are not confirmed bookings of ``provider`` are
+    left alone. Returns the ids that were completed.
+    """
+    with transaction.atomic():
+        bookings = list(
+            Booking.objects.select_for_update()
+            .filter(pk__in=booking_ids, booked_for=provider, status=BookingStatus.CONFIRMED)
+            .only('id', 'booked_by_id', 'duration', 'availability_id')
+            .order_by('pk')
+        )
+        if not bookings:
+            return []
+        Booking.objects.filter(pk__in=[booking.pk for booking in bookings]).update(status=BookingStatus.COMPLETED, cancel_reason=None)
+        process_bulk_booking_completion(provider, bookings)
+
+        AvailabilitySlot.objects.filter(pk__in={booking.availability_id for booking in bookings if booking.availability_id}).update(is_booked=False)
+        refresh_provider(provider.pk)
+        bump_calendars({booking.booked_by_id for booking in bookings} | {provider.pk})
+        announce(booking.pk for booking in bookings)
+        transaction.on_commit(lambda: update_user_stats(provider))
+    return [booking.pk for booking in bookings]
+
+
+EXPIRED_REASON = "Expired"
+
+
+def expire_pending_bookings(batch_size=2000, cutoff=None):
+    """
+    Cancel every pending booking whose start time has passed (before
+    ``cutoff``, default now) and free its slot.
+
+    Bookings are read off booking_pending_time_idx and handled
+    ``batch_size`` at a time: one UPDATE for the bookings, one for their
+    slots and one for the providers' occurrences per batch. Pending
+    bookings hold no wallet minutes, so there is nothing to release. Each
+    batch inserts its payers' notifications in the same transaction, so a
+    run stopped part way never leaves an expiry unannounced.
+    Returns the number of bookings expired.
+    """
+    cutoff = cutoff or now()
+    expired = 0
+    while True:
+        with transaction.atomic():
+            # skip_locked: rows someone is confirming right now are left for the next run
+            rows = list(
+                Booking.objects.filter(PENDING_STATUS, scheduled_time__lt=cutoff)
+                .order_by('scheduled_time')
+                .select_for_update(skip_locked=True)
+                .values_list('id', 'booked_by_id', 'booked_for_id', 'availability_id', 'scheduled_time')[:batch_size]
+            )
+            if not rows:
+                break
+            Booking.objects.filter(pk__in=[row[0] for row in rows]).update(
+                status=BookingStatus.CANCELLED, cancel_reason=EXPIRED_REASON,
+            )
+            slot_ids = {row[3] for row in rows if row[3] is not None}
+            AvailabilitySlot.objects.filter(pk__in=slot_ids).update(is_booked=False)
+            refresh_booked(AvailabilityOccurrence.objects.filter(provider_id__in={row[2] for row in rows}, end__gt=now()))
+            bump_calendars({row[1] for row in rows} | {row[2] for row in rows})
+            announce(row[0] for row in rows)
+            Notification.objects.bulk_create([
+                Notification(
+                    user_id=booked_by_id,
+                    type='booking_status',
+                    content=f"Your booking request for {scheduled_time:%Y-%m-%d %H:%M} expired before it was confirmed.",
+                )
+                for _, booked_by_id, _, _, scheduled_time in rows
+            ])
+
+        expired += len(rows)
+        if len(rows) < batch_size:
+            break
+    return expired
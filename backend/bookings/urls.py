@@ -1,6 +1,6 @@
 # booking/urls.py
 from django.urls import path
-from .views import AvailabilitySlotDetailView, AvailabilitySlotListCreateView, BookingCreateView, BookingDetailView, BookingListView, BookingConfirmView, BookingCancelView, BookingCompleteView, BookingRescheduleView, MyBookingsView, SubmitReviewView, UserAvailabilityView, ReviewListView
+from .views import AvailabilitySlotBulkCreateView, AvailabilitySlotDetailView, AvailabilitySlotListCreateView, BookingBulkCompleteView, BookingCreateView, CalendarFeedLinkView, CalendarFeedView, BookingDetailView, BookingListView, BookingConfirmView, BookingCancelView, BookingCompleteView, BookingRescheduleView, AvailabilityFreeAtView, AvailabilityOverlapView, FreeSlotSearchView, MyBookingsView, SkillRatingView, SubmitReviewView, UserAvailabilityView, UserRatingView, UserAvailabilityOccurrencesView, ReviewListView
 
 app_name = 'bookings'
 
@@ -13,10 +13,20 @@ urlpatterns = [
     path('<int:pk>/confirm/', BookingConfirmView.as_view(), name='booking-confirm'),
     path('<int:pk>/cancel/', BookingCancelView.as_view(), name='booking-cancel'),
     path('<int:pk>/complete/', BookingCompleteView.as_view(), name='booking-complete'),
+    path('complete/bulk/', BookingBulkCompleteView.as_view(), name='booking-bulk-complete'),
     path('<int:pk>/review/', SubmitReviewView.as_view(), name='submit-review'),
     path('reviews/', ReviewListView.as_view(), name='review-list'),
+    path('ratings/user/<int:user_id>/', UserRatingView.as_view(), name='user-rating'),
+    path('ratings/skill/<int:skill_id>/', SkillRatingView.as_view(), name='skill-rating'),
+    path('calendar/', CalendarFeedLinkView.as_view(), name='calendar-feed-link'),
+    path('calendar/<str:token>.ics', CalendarFeedView.as_view(), name='calendar-feed'),
     path('availability/', AvailabilitySlotListCreateView.as_view(), name='availability'),
     path('availability/', AvailabilitySlotListCreateView.as_view(), name='availability-list-create'),
+    path('availability/bulk/', AvailabilitySlotBulkCreateView.as_view(), name='availability-bulk-create'),
+    path('availability/search/', FreeSlotSearchView.as_view(), name='availability-search'),
+    path('availability/free-at/', AvailabilityFreeAtView.as_view(), name='availability-free-at'),
+    path('availability/overlap/<int:user_id>/', AvailabilityOverlapView.as_view(), name='availability-overlap'),
     path('availability/<int:pk>/', AvailabilitySlotDetailView.as_view(), name='availability-detail'),
     path('availability/user/<int:user_id>/', UserAvailabilityView.as_view(), name='user-availability'),
+    path('availability/user/<int:user_id>/occurrences/', UserAvailabilityOccurrencesView.as_view(), name='user-availability-occurrences'),
 ]
\ No newline at end of file
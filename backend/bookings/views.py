@@ -1,17 +1,83 @@
-from django.shortcuts import render
-from leaderboard.services import update_user_stats
+from django.shortcuts import get_object_or_404, render
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.views import View
 from rest_framework import generics
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.exceptions import PermissionDenied, ValidationError
 from rest_framework.response import Response
-from django.db import models
+from rest_framework.pagination import CursorPagination
+from contextlib import contextmanager
+from datetime import timedelta
+from itertools import islice
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import models, transaction
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import now
 from rest_framework.views import APIView
 from rest_framework.generics import RetrieveAPIView, UpdateAPIView
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
-from .models import AvailabilitySlot, Booking, BookingStatus, Review
-from .serializers import AvailabilitySlotSerializer, BookingCancelSerializer, BookingCreateSerializer, BookingActionSerializer, BookingDetailSerializer, BookingRescheduleSerializer, BookingStatusOnlySerializer, ReviewSerializer
-from wallet.utils import process_booking_confirmation, process_booking_completion
+from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework.utils.urls import replace_query_param
+from skills.models import Skill
+from .models import AvailabilityOccurrence, AvailabilitySlot, Booking, CalendarFeed, Review, SkillRating, UserRating
+from .serializers import AvailabilityBulkCreateSerializer, AvailabilityOccurrenceSerializer, AvailabilitySlotSerializer, FreeAtSerializer, FreeSlotSearchSerializer, BookingCancelSerializer, BookingCreateSerializer, BookingActionSerializer, BookingBulkCompleteSerializer, BookingDetailSerializer, BookingRescheduleSerializer, BookingStatusOnlySerializer, RatingSerializer, ReviewSerializer
+from utils.idempotency import idempotent
+from .transitions import cancel_booking, complete_booking, complete_bookings, confirm_booking
+from .availability import free_start_times
+from .bitmaps import free_at, get_bitmaps, to_intervals
+from .calendar import etag, get_feed_body
+from .filters import BookingFilter
+
+
+@contextmanager
+def map_wallet_errors():
+    """Report wallet errors (e.g. insufficient balance) as 400s instead of 500s."""
+    try:
+        yield
+    except DjangoValidationError as e:
+        raise ValidationError(e.messages)
+
+
+# Keyset pagination on (scheduled_time, id): deep pages cost the same as the
+# first one and bookings added meanwhile do not shift the pages
+class BookingPagination(CursorPagination):
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-scheduled_time', '-id')
+
+
+# A user's availability occurrences in start order, keyset paginated like bookings
+class OccurrencePagination(CursorPagination):
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    ordering = ('start', 'id')
+
+
+class UserBookingsListView(generics.ListAPIView):
+    """
+    Base for the lists of bookings the caller made or received, filtered
+    with BookingFilter. Only the booking columns the serializer reads are
+    loaded; related rows a subclass select_related()s are loaded whole.
+    """
+    permission_classes = [IsAuthenticated]
+    pagination_class = BookingPagination
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = BookingFilter
+
+    def get_queryset(self):
+        user = self.request.user
+        # Each side of the OR is served by its own index:
+        # (booked_by, scheduled_time) and (booked_for, status, scheduled_time)
+        return Booking.objects.filter(models.Q(booked_by=user) | models.Q(booked_for=user)).only(*self.read_columns())
+
+    def read_columns(self):
+        """Booking fields the serializer reads, derived from it so the two cannot drift apart."""
+        fields = self.get_serializer_class()().fields.values()
+        return {field.source.split('.')[0] for field in fields if not field.write_only and field.source != '*'}
 
 
 class BookingCreateView(generics.CreateAPIView):
@@ -20,58 +86,52 @@ class BookingCreateView(generics.CreateAPIView):
     permission_classes = [IsAuthenticated]
 
     def perform_create(self, serializer):
-        availability_id = self.request.data.get('availability_id')
-        try:
-            availability = AvailabilitySlot.objects.get(id=availability_id, is_booked=False)
-        except AvailabilitySlot.DoesNotExist:
-            raise ValidationError("Invalid or already booked availability slot.")
+        # The serializer has already checked the slot is free, and Booking.save marks it booked
+        serializer.save(booked_by=self.request.user)
 
-        serializer.save(booked_by=self.request.user, availability=availability)
-        availability.is_booked = True
-        availability.save()
-    
     @swagger_auto_schema(
         operation_description="Create a new booking.",
         responses={201: BookingCreateSerializer(), 400: "Validation error"}
     )
+    @idempotent
     def post(self, request, *args, **kwargs):
         return super().post(request, *args, **kwargs)
 
 
-class BookingListView(generics.ListAPIView):
+class BookingListView(UserBookingsListView):
     serializer_class = BookingCreateSerializer
-    permission_classes = [IsAuthenticated]
 
     @swagger_auto_schema(
-        operation_description="List all bookings related to the authenticated user.",
+        operation_description="List the bookings related to the authenticated user, latest first, optionally filtered "
+                              "by role, status, skill, counterpart and scheduled time. Follow `next` for older bookings.",
         responses={200: BookingCreateSerializer(many=True)}
     )
     def get(self, request, *args, **kwargs):
         return super().get(request, *args, **kwargs)
 
-    def get_queryset(self):
-        user = self.request.user
-        return Booking.objects.filter(models.Q(booked_by=user) | models.Q(booked_for=user))
-
 
 class BookingConfirmView(generics.UpdateAPIView):
     queryset = Booking.objects.all()
     serializer_class = BookingStatusOnlySerializer
     permission_classes = [IsAuthenticated]
 
+    @idempotent
+    def put(self, request, *args, **kwargs):
+        return super().put(request, *args, **kwargs)
+
+    @idempotent
+    def patch(self, request, *args, **kwargs):
+        return super().patch(request, *args, **kwargs)
+
     def perform_update(self, serializer):
-        booking = self.get_object()
+        booking = serializer.instance
         if self.request.user != booking.booked_for:
             raise PermissionDenied("Only booked_for can confirm the booking.")
-        if booking.status != BookingStatus.PENDING:
-            raise ValidationError("Booking must be pending to confirm.")
 
-        process_booking_confirmation(booking)
-        serializer.save(status=BookingStatus.CONFIRMED)
-        
-        # Wallet deduction (booked_by pays at confirmation)
-        process_booking_confirmation(booking)
-        serializer.save(status=BookingStatus.CONFIRMED)
+        # The hold on booked_by's wallet is placed by the transition itself
+        with map_wallet_errors():
+            if not confirm_booking(booking):
+                raise ValidationError("Booking must be pending to confirm.")
 
 
 class BookingCancelView(UpdateAPIView):
@@ -79,17 +139,21 @@ class BookingCancelView(UpdateAPIView):
     serializer_class = BookingCancelSerializer
     permission_classes = [IsAuthenticated]
 
+    @idempotent
+    def put(self, request, *args, **kwargs):
+        return super().put(request, *args, **kwargs)
+
+    @idempotent
+    def patch(self, request, *args, **kwargs):
+        return super().patch(request, *args, **kwargs)
+
     def perform_update(self, serializer):
-        booking = self.get_object()
+        booking = serializer.instance
         if self.request.user not in [booking.booked_by, booking.booked_for]:
             raise PermissionDenied("Only booked_by or booked_for can cancel.")
-        if booking.status in [BookingStatus.CANCELLED, BookingStatus.COMPLETED]:
-            raise ValidationError("Cannot cancel completed or already cancelled bookings.")
 
-        serializer.save(status=BookingStatus.CANCELLED)
-        if booking.availability:
-            booking.availability.is_booked = False
-            booking.availability.save()
+        if not cancel_booking(booking, serializer.validated_data['cancel_reason']):
+            raise ValidationError("Cannot cancel completed or already cancelled bookings.")
 
 
 class BookingCompleteView(UpdateAPIView):
@@ -97,34 +161,62 @@ class BookingCompleteView(UpdateAPIView):
     serializer_class = BookingStatusOnlySerializer
     permission_classes = [IsAuthenticated]
 
+    @idempotent
+    def put(self, request, *args, **kwargs):
+        return super().put(request, *args, **kwargs)
+
+    @idempotent
+    def patch(self, request, *args, **kwargs):
+        return super().patch(request, *args, **kwargs)
+
     def perform_update(self, serializer):
-        booking = self.get_object()
+        booking = serializer.instance
         if self.request.user != booking.booked_for:
             raise PermissionDenied("Only booked_for can complete the session.")
-        if booking.status != BookingStatus.CONFIRMED:
-            raise ValidationError("Booking must be confirmed before completing.")
-
-        process_booking_completion(booking)
-        serializer.save(status=BookingStatus.COMPLETED)
-        if booking.availability:
-            booking.availability.is_booked = False
-            booking.availability.save()
-        update_user_stats(booking.booked_for)#Update user stats
 
+        with map_wallet_errors():
+            if not complete_booking(booking):
+                raise ValidationError("Booking must be confirmed before completing.")
 
 
-class MyBookingsView(APIView):
+class BookingBulkCompleteView(APIView):
     permission_classes = [IsAuthenticated]
 
     @swagger_auto_schema(
-        operation_description="Get all bookings where the user is booked_by or booked_for.",
+        operation_description="Complete many of the provider's confirmed bookings at once (e.g. a group session). "
+                              "All payments are settled in one transaction; if any attendee cannot pay, nothing "
+                              "is completed. Bookings that are not confirmed bookings of the caller are skipped.",
+        request_body=BookingBulkCompleteSerializer,
+        responses={200: openapi.Response(description="Completed and skipped booking ids"), 400: "Validation error"}
+    )
+    @idempotent
+    def post(self, request):
+        serializer = BookingBulkCompleteSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        requested = list(dict.fromkeys(serializer.validated_data['booking_ids']))
+
+        with map_wallet_errors():
+            completed = complete_bookings(request.user, requested)
+        done = set(completed)
+        return Response({
+            "completed": completed,
+            "skipped": [booking_id for booking_id in requested if booking_id not in done],
+        })
+
+
+class MyBookingsView(UserBookingsListView):
+    serializer_class = BookingDetailSerializer
+
+    @swagger_auto_schema(
+        operation_description="Get the bookings where the user is booked_by or booked_for, latest first, optionally "
+                              "filtered by role, status, skill, counterpart and scheduled time. Follow `next` for older bookings.",
         responses={200: BookingDetailSerializer(many=True)}
     )
-    def get(self, request):
-        user = request.user
-        bookings = Booking.objects.filter(models.Q(booked_by=user) | models.Q(booked_for=user)).order_by('-scheduled_time')
-        serializer = BookingDetailSerializer(bookings, many=True)
-        return Response(serializer.data)
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+    def get_queryset(self):
+        return super().get_queryset().select_related('skill', 'booked_by', 'booked_for')
 
 
 class BookingDetailView(RetrieveAPIView):
@@ -187,7 +279,9 @@ class SubmitReviewView(generics.CreateAPIView):
         if hasattr(booking, 'review'):
             raise ValidationError("This booking already has a review.")
 
-        serializer.save(reviewer=self.request.user, booking=booking)
+        # The review and its rating aggregates are committed together
+        with transaction.atomic():
+            serializer.save(reviewer=self.request.user, booking=booking)
 
 class AvailabilitySlotListCreateView(generics.ListCreateAPIView):
     permission_classes = [IsAuthenticated]
@@ -195,7 +289,28 @@ class AvailabilitySlotListCreateView(generics.ListCreateAPIView):
 
     def get_queryset(self):
         return AvailabilitySlot.objects.filter(booked_for=self.request.user)
-    
+
+
+class AvailabilitySlotBulkCreateView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_description="Create many availability slots at once, from a list of slots or a recurrence template "
+                              "(e.g. weekdays [0..4], 09:00-12:00, slot_minutes 30). Overlapping slots are rejected; "
+                              "slots that already exist are skipped.",
+        request_body=AvailabilityBulkCreateSerializer,
+        responses={201: AvailabilitySlotSerializer(many=True), 400: "Validation error"}
+    )
+    def post(self, request):
+        serializer = AvailabilityBulkCreateSerializer(data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        slots = serializer.save()
+        return Response({
+            "created": len(slots),
+            "skipped": serializer.validated_data['skipped'],
+            "slots": AvailabilitySlotSerializer(slots, many=True).data,
+        }, status=201)
+
 
 class AvailabilitySlotDetailView(generics.RetrieveUpdateDestroyAPIView):
     permission_classes = [IsAuthenticated]
@@ -217,6 +332,125 @@ class UserAvailabilityView(generics.ListAPIView):
         return AvailabilitySlot.objects.filter(booked_for__id=user_id)
 
 
+class UserAvailabilityOccurrencesView(generics.ListAPIView):
+    permission_classes = [AllowAny]
+    serializer_class = AvailabilityOccurrenceSerializer
+    pagination_class = OccurrencePagination
+
+    @swagger_auto_schema(
+        operation_description="Concrete availability (UTC) of a user between `start` and `end` (default: the next 7 days), "
+                              "within the materialized horizon, ordered by start; follow `next` for more.",
+        manual_parameters=[
+            openapi.Parameter('start', openapi.IN_QUERY, type=openapi.TYPE_STRING, format='date-time'),
+            openapi.Parameter('end', openapi.IN_QUERY, type=openapi.TYPE_STRING, format='date-time'),
+        ],
+        responses={200: AvailabilityOccurrenceSerializer(many=True)}
+    )
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+    def get_queryset(self):
+        start = parse_datetime(self.request.query_params.get('start') or '') or now()
+        end = parse_datetime(self.request.query_params.get('end') or '') or start + timedelta(days=7)
+        return AvailabilityOccurrence.objects.filter(
+            provider_id=self.kwargs['user_id'], start__lt=end, end__gt=start,
+        )
+
+
+class FreeSlotSearchView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_description="Find concrete free start times across all providers offering a skill (by name) or tag. "
+                              "Weekly availability is expanded over the window and pending/confirmed bookings are "
+                              "subtracted. Results are ordered by start time; follow `next` for more.",
+        query_serializer=FreeSlotSearchSerializer,
+        responses={200: "Free start times", 400: "Validation error"}
+    )
+    def get(self, request):
+        params = FreeSlotSearchSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        data = params.validated_data
+        duration = timedelta(minutes=data['duration'])
+        page_size = data['page_size']
+        tag = data.get('tag')
+
+        skills = Skill.objects.filter(is_offered=True, is_visible=True, user__isnull=False)
+        if data.get('skill'):
+            skills = skills.filter(name__iexact=data['skill'])
+
+        # provider -> the skill to book them for
+        provider_skills = {}
+        for user_id, skill_id, tags in skills.values_list('user_id', 'id', 'tags').iterator(chunk_size=5000):
+            # Tags are filtered in Python as elsewhere: SQLite cannot query inside JSON lists
+            if tag and (not isinstance(tags, list) or tag not in tags):
+                continue
+            provider_skills.setdefault(user_id, skill_id)
+        providers = list(provider_skills) if tag else skills.values('user_id')
+
+        window_start = data['start']
+        after = data.get('after')
+        if after:
+            window_start = max(window_start, after[0])
+        times = free_start_times(providers, window_start, data['end'], duration, timedelta(minutes=data['step']))
+        if after:
+            times = (item for item in times if item > after)
+        page = list(islice(times, page_size + 1))
+
+        next_url = None
+        if len(page) > page_size:
+            start, provider_id = page[page_size - 1]
+            next_url = replace_query_param(request.build_absolute_uri(), 'after', f"{start.isoformat()}_{provider_id}")
+
+        page = page[:page_size]
+        # One lookup of the denormalized aggregates for the providers on this page
+        ratings = UserRating.objects.only('user_id', 'count', 'total').in_bulk({provider_id for _, provider_id in page}, field_name='user_id')
+        unrated = UserRating()
+        return Response({
+            "next": next_url,
+            "results": [
+                {
+                    "provider": provider_id, "skill": provider_skills[provider_id], "start": start, "end": start + duration,
+                    "rating": ratings.get(provider_id, unrated).average, "rating_count": ratings.get(provider_id, unrated).count,
+                }
+                for start, provider_id in page
+            ],
+        })
+
+
+class AvailabilityFreeAtView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_description="Return which of the given providers' weekly availability covers `at` for `duration` "
+                              "minutes. Answered from the cached availability bitmaps; bookings are not considered.",
+        request_body=FreeAtSerializer,
+        responses={200: "Free providers", 400: "Validation error"}
+    )
+    def post(self, request):
+        serializer = FreeAtSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        providers = list(dict.fromkeys(data['providers']))
+        return Response({"free": free_at(providers, data['at'], timedelta(minutes=data['duration']))})
+
+
+class AvailabilityOverlapView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_description="Weekly times (UTC) when both the authenticated user and the given user are available.",
+        responses={200: "Shared availability"}
+    )
+    def get(self, request, user_id):
+        bitmaps = get_bitmaps([request.user.id, user_id])
+        shared = bitmaps[request.user.id] & bitmaps[user_id]
+        return Response([
+            {"weekday": weekday, "start_time": start_time, "end_time": end_time}
+            for weekday, start_time, end_time in to_intervals(shared)
+        ])
+
+
 class ReviewListView(generics.ListAPIView):
     queryset = Review.objects.all()
     serializer_class = ReviewSerializer
@@ -234,3 +468,71 @@ class ReviewListView(generics.ListAPIView):
     )
     def get(self, request, *args, **kwargs):
         return super().get(request, *args, **kwargs)
+
+
+class CalendarFeedLinkView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_description="The private URL of the authenticated user's iCalendar feed (bookings and weekly availability).",
+        responses={200: "Feed URL"}
+    )
+    def get(self, request):
+        feed, _ = CalendarFeed.objects.get_or_create(user=request.user)
+        return Response({"url": request.build_absolute_uri(f"/bookings/calendar/{feed.token}.ics")})
+
+    @swagger_auto_schema(
+        operation_description="Replace the feed URL, e.g. after it was shared by mistake. The old URL stops working.",
+        responses={200: "New feed URL"}
+    )
+    def post(self, request):
+        feed, _ = CalendarFeed.objects.get_or_create(user=request.user)
+        feed.token = CalendarFeed._meta.get_field('token').get_default()
+        feed.save(update_fields=['token'])
+        return Response({"url": request.build_absolute_uri(f"/bookings/calendar/{feed.token}.ics")})
+
+
+class CalendarFeedView(View):
+    """
+    The .ics feed itself. Calendar clients cannot send JWTs, so the secret
+    token in the URL identifies the user. Polls whose If-None-Match is still
+    current get a 304 without touching bookings. No Last-Modified is sent:
+    its one-second resolution cannot tell apart versions bumped within the
+    same second, so If-Modified-Since alone could be answered with a stale 304.
+    """
+
+    def get(self, request, token):
+        feed = get_object_or_404(CalendarFeed.objects.only('id', 'user_id', 'version', 'updated_at'), token=token)
+        feed_etag = etag(feed)
+
+        response = get_conditional_response(request, etag=feed_etag)
+        if response is None:
+            response = HttpResponse(get_feed_body(feed), content_type='text/calendar; charset=utf-8')
+        response['ETag'] = feed_etag
+        # Always revalidate: the feed changes whenever a booking does
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
+class UserRatingView(APIView):
+    permission_classes = [AllowAny]
+
+    @swagger_auto_schema(
+        operation_description="Rating summary of a provider: review count, average and 1-5 star histogram.",
+        responses={200: RatingSerializer()}
+    )
+    def get(self, request, user_id):
+        rating = UserRating.objects.filter(user_id=user_id).first() or UserRating(user_id=user_id)
+        return Response(RatingSerializer(rating).data)
+
+
+class SkillRatingView(APIView):
+    permission_classes = [AllowAny]
+
+    @swagger_auto_schema(
+        operation_description="Rating summary of a skill: review count, average and 1-5 star histogram.",
+        responses={200: RatingSerializer()}
+    )
+    def get(self, request, skill_id):
+        rating = SkillRating.objects.filter(skill_id=skill_id).first() or SkillRating(skill_id=skill_id)
+        return Response(RatingSerializer(rating).data)
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='notification',
+            name='type',
+            field=models.CharField(choices=[('booking_request', 'Booking Request'), ('booking_status', 'Booking Accepted/Rejected'), ('message', 'New Message'), ('review', 'Review Received'), ('reminder', 'Session Reminder')], max_length=30),
+        ),
+    ]
@@ -9,6 +9,7 @@ class Notification(models.Model):
         ('booking_status', 'Booking Accepted/Rejected'),
         ('message', 'New Message'),
         ('review', 'Review Received'),
+        ('reminder', 'Session Reminder'),
     ]
 
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
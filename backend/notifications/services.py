@@ -1,3 +1,5 @@
+from django.conf import settings
+from django.core.mail import send_mass_mail
 from .models import Notification
 from .utils import send_notification_email
 
@@ -13,3 +15,21 @@ def notify_user(user, notif_type, content, send_email=True, email_subject=None):
             email_subject or f"{notif_type.capitalize()} Notification",
             content
         )
+
+
+def notify_users(notifications, notif_type, send_email=True, email_subject=None):
+    """
+    Batch version of notify_user for ``notifications``, a list of
+    (user, content) pairs: one INSERT for the rows and one mail connection
+    for the e-mails.
+    """
+    rows = Notification.objects.bulk_create(
+        [Notification(user=user, type=notif_type, content=content) for user, content in notifications]
+    )
+    if send_email:
+        subject = email_subject or f"{notif_type.capitalize()} Notification"
+        send_mass_mail(
+            [(subject, content, settings.DEFAULT_FROM_EMAIL, [user.email]) for user, content in notifications],
+            fail_silently=True,
+        )
+    return rows
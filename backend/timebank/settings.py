@@ -283,6 +283,25 @@ REST_FRAMEWORK = {
 }
 
 
+# Wallet: append transfers to the double-entry ledger instead of updating
+# Wallet.balance in place (run `manage.py snapshot_ledger` periodically)
+WALLET_LEDGER_JOURNAL = env.bool('WALLET_LEDGER_JOURNAL', default=False)
+
+# Idempotency-Key support on mutating wallet and booking endpoints: how long a
+# stored response can be replayed, and how long an in-flight request holds its key
+IDEMPOTENCY_KEY_TTL = env.int('IDEMPOTENCY_KEY_TTL', default=24 * 60 * 60)
+IDEMPOTENCY_LOCK_TIMEOUT = env.int('IDEMPOTENCY_LOCK_TIMEOUT', default=60)
+IDEMPOTENCY_CACHE = 'idempotency'
+
+# Bookings: how many weeks of concrete availability occurrences to keep
+# materialized (rolled forward daily by `manage.py roll_availability`)
+AVAILABILITY_HORIZON_WEEKS = env.int('AVAILABILITY_HORIZON_WEEKS', default=8)
+
+# Session reminders (`manage.py reminder_scheduler`): how many minutes before a
+# confirmed booking starts its participants are reminded
+BOOKING_REMINDER_LEAD_MINUTES = env.int('BOOKING_REMINDER_LEAD_MINUTES', default=60)
+
+
 # Email settings
 EMAIL_HOST_USER = env('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = env('EMAIL_HOST_PASSWORD')
@@ -364,3 +383,11 @@ else:
             'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'
         }
     }
+
+# Idempotency keys have to be seen by every worker, so unlike the default
+# cache they never fall back to local memory: without Redis they live in a
+# database table (created by `manage.py createcachetable`)
+CACHES['idempotency'] = CACHES['default'] if 'redis' in CACHES['default']['BACKEND'] else {
+    'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+    'LOCATION': 'idempotency_keys',
+}
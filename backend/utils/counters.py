@@ -0,0 +1,23 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+
+def increment(model, lookup, delta):
+    """
+    Add ``delta`` (field name -> amount) to the ``model`` row matching
+    ``lookup`` with one F() UPDATE, creating the row when there is none yet.
+    A delta with a negative amount never creates a row: there is nothing
+    to take it away from.
+    """
+    rows = model.objects.filter(**lookup)
+    increments = {field: F(field) + value for field, value in delta.items()}
+    if rows.update(**increments):
+        return
+    if any(value < 0 for value in delta.values()):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **delta)
+    except IntegrityError:
+        # Another writer created the row first
+        rows.update(**increments)
@@ -0,0 +1,113 @@
+import hashlib
+import json
+from functools import wraps
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.response import Response
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyKeyInUse(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'A request with this Idempotency-Key is still being processed.'
+    default_code = 'idempotency_key_in_use'
+
+
+class IdempotencyKeyMismatch(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = 'This Idempotency-Key was already used with a different request.'
+    default_code = 'idempotency_key_mismatch'
+
+
+def _store():
+    store = caches[settings.IDEMPOTENCY_CACHE]
+    if isinstance(store, (LocMemCache, DummyCache)):
+        # A retry landing on another worker would not see the key and run again
+        raise ImproperlyConfigured(
+            f"The '{settings.IDEMPOTENCY_CACHE}' cache must be shared by all workers (e.g. Redis or the database cache)."
+        )
+    return store
+
+
+def _cache_key(request, key):
+    # Keys are scoped per user so clients cannot read each other's responses
+    digest = hashlib.sha256(key.encode()).hexdigest()
+    return f"idempotency:{request.user.pk}:{digest}"
+
+
+def _fingerprint(request, args, kwargs):
+    data = request.data
+    if hasattr(data, 'lists'):
+        data = dict(data.lists())
+    payload = json.dumps([request.method, request.path, kwargs, data], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _replay(stored, fingerprint):
+    if stored['fingerprint'] != fingerprint:
+        raise IdempotencyKeyMismatch()
+    if stored.get('pending'):
+        raise IdempotencyKeyInUse()
+    response = Response(stored['data'], status=stored['status'])
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(handler):
+    """
+    Make a view handler safe to retry with an Idempotency-Key header.
+
+    The first request with a key runs the handler and, if it succeeds (a 2xx
+    response), stores the response; retries with the same key and body get
+    it back without touching the database. A request that fails, by raising
+    or by returning an error response, stores nothing and frees the key so it
+    can be retried. Keys live in the IDEMPOTENCY_CACHE cache, which has to be
+    shared by all workers. Requests without the header run as usual.
+    """
+    @wraps(handler)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return handler(self, request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            raise ValidationError({HEADER: f"Must be at most {MAX_KEY_LENGTH} characters."})
+
+        store = _store()
+        cache_key = _cache_key(request, key)
+        fingerprint = _fingerprint(request, args, kwargs)
+
+        stored = store.get(cache_key)
+        if stored is not None:
+            return _replay(stored, fingerprint)
+
+        # add() only succeeds for the first of several concurrent requests
+        if not store.add(cache_key, {'fingerprint': fingerprint, 'pending': True}, settings.IDEMPOTENCY_LOCK_TIMEOUT):
+            stored = store.get(cache_key)
+            if stored is not None:
+                return _replay(stored, fingerprint)
+            raise IdempotencyKeyInUse()
+
+        try:
+            response = handler(self, request, *args, **kwargs)
+        except Exception:
+            store.delete(cache_key)
+            raise
+
+        if not status.is_success(response.status_code) or not hasattr(response, 'data'):
+            store.delete(cache_key)
+        else:
+            store.set(cache_key, {
+                'fingerprint': fingerprint,
+                'status': response.status_code,
+                'data': response.data,
+            }, settings.IDEMPOTENCY_KEY_TTL)
+        return response
+
+    return wrapper
@@ -0,0 +1,60 @@
+"""
+Streaming exports of wallet transactions.
+
+Rows are read with ``QuerySet.iterator(chunk_size=...)`` over ``values_list``
+(a server-side cursor on PostgreSQL, no model instances), so memory use
+stays flat however long the history is.
+"""
+import csv
+import json
+from django.core.serializers.json import DjangoJSONEncoder
+
+EXPORT_FIELDS = [
+    ('id', 'id'),
+    ('created_at', 'created_at'),
+    ('transaction_type', 'transaction_type'),
+    ('amount_minutes', 'amount'),
+    ('status', 'status'),
+    ('reason', 'reason'),
+    ('sender', 'sender__username'),
+    ('receiver', 'receiver__username'),
+    ('booking_id', 'booking_id'),
+]
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+class Echo:
+    """File-like object whose write() hands the line back to the caller."""
+
+    def write(self, value):
+        return value
+
+
+def export_rows(queryset, chunk_size=2000):
+    columns = [column for _, column in EXPORT_FIELDS]
+    rows = queryset.order_by('created_at', 'id').values_list(*columns)
+    return rows.iterator(chunk_size=chunk_size)
+
+
+def stream_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow([name for name, _ in EXPORT_FIELDS])
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def stream_ndjson(rows):
+    names = [name for name, _ in EXPORT_FIELDS]
+    for row in rows:
+        yield json.dumps(dict(zip(names, row)), cls=DjangoJSONEncoder) + "\n"
+
+
+def stream_export(queryset, export_format, chunk_size=2000):
+    rows = export_rows(queryset, chunk_size=chunk_size)
+    if export_format == 'ndjson':
+        return stream_ndjson(rows)
+    return stream_csv(rows)
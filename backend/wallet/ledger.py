@@ -0,0 +1,97 @@
+"""
+Double-entry journal for wallet balances.
+
+In journal mode (``settings.WALLET_LEDGER_JOURNAL``) a transfer appends an
+immutable pair of LedgerEntry rows instead of updating both Wallet rows.
+A wallet's balance is its latest BalanceSnapshot plus the entries written
+after it; ``roll_snapshots`` (the ``snapshot_ledger`` command) moves the
+snapshots forward in bulk and keeps ``Wallet.balance`` in step with them.
+"""
+import uuid
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Max, OuterRef, Subquery, Sum
+from django.utils.timezone import now
+from .models import BalanceSnapshot, LedgerEntry, Wallet
+
+
+def ledger_balance(wallet_id):
+    # Read the opening balance before looking for a snapshot: if a roll commits
+    # in between we see its snapshot and the (already synced) opening is ignored.
+    opening = Wallet.objects.values_list('balance', flat=True).get(pk=wallet_id)
+    snapshot = (
+        BalanceSnapshot.objects.filter(wallet_id=wallet_id)
+        .order_by('-last_entry_id')
+        .values_list('balance', 'last_entry_id')
+        .first()
+    )
+    base, since = snapshot if snapshot else (opening, 0)
+    delta = LedgerEntry.objects.filter(wallet_id=wallet_id, id__gt=since).aggregate(total=Sum('amount'))['total']
+    return base + (delta or 0)
+
+
+def post_transfer(sender_wallet_id, receiver_wallet_id, amount, debit=None, credit=None):
+    """Append the debit/credit pair for one transfer. Must run inside the caller's atomic block."""
+    return post_transfers([(sender_wallet_id, receiver_wallet_id, amount, debit, credit)])
+
+
+def post_transfers(transfers):
+    """
+    Append entry pairs for many transfers with one INSERT. Each item is
+    ``(sender_wallet_id, receiver_wallet_id, amount, debit, credit)``.
+    """
+    entries = []
+    for sender_wallet_id, receiver_wallet_id, amount, debit, credit in transfers:
+        transfer_id = uuid.uuid4()
+        entries.append(LedgerEntry(wallet_id=sender_wallet_id, transfer_id=transfer_id, amount=-amount, transaction=debit))
+        entries.append(LedgerEntry(wallet_id=receiver_wallet_id, transfer_id=transfer_id, amount=amount, transaction=credit))
+    return LedgerEntry.objects.bulk_create(entries)
+
+
+def roll_snapshots(settle_seconds=60, batch_size=1000, prune=False):
+    """
+    Snapshot every wallet that has ledger activity since the previous roll.
+
+    Only entries older than ``settle_seconds`` are folded in, so rows from
+    transactions that were still open when the cutoff was taken are picked
+    up by the next roll rather than skipped. Returns ``(snapshots, cutoff)``.
+    """
+    previous = BalanceSnapshot.objects.aggregate(last=Max('last_entry_id'))['last'] or 0
+    cutoff = (
+        LedgerEntry.objects.filter(id__gt=previous, created_at__lte=now() - timedelta(seconds=settle_seconds))
+        .aggregate(last=Max('id'))['last']
+    )
+    if cutoff is None:
+        return 0, previous
+
+    deltas = list(
+        LedgerEntry.objects.filter(id__gt=previous, id__lte=cutoff)
+        .values('wallet_id')
+        .annotate(delta=Sum('amount'))
+        .order_by('wallet_id')
+    )
+
+    written = 0
+    for start in range(0, len(deltas), batch_size):
+        chunk = {row['wallet_id']: row['delta'] for row in deltas[start:start + batch_size]}
+        latest = BalanceSnapshot.objects.filter(wallet=OuterRef('pk')).order_by('-last_entry_id')
+
+        with transaction.atomic():
+            wallets = list(
+                Wallet.objects.filter(pk__in=chunk)
+                .annotate(snapshot_balance=Subquery(latest.values('balance')[:1]))
+                .order_by('pk')
+            )
+            snapshots = []
+            for wallet in wallets:
+                base = wallet.balance if wallet.snapshot_balance is None else wallet.snapshot_balance
+                wallet.balance = base + chunk[wallet.pk]
+                snapshots.append(BalanceSnapshot(wallet=wallet, balance=wallet.balance, last_entry_id=cutoff))
+
+            BalanceSnapshot.objects.bulk_create(snapshots)
+            Wallet.objects.bulk_update(wallets, ['balance'])
+            if prune:
+                BalanceSnapshot.objects.filter(wallet__in=wallets, last_entry_id__lt=cutoff).delete()
+        written += len(snapshots)
+
+    return written, cutoff
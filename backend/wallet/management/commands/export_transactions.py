@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from wallet.exports import EXPORT_FORMATS, stream_export
+from wallet.models import Transaction
+
+
+class Command(BaseCommand):
+    help = "Stream wallet transactions to a file (or stdout) as CSV or NDJSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', dest='export_format', choices=sorted(EXPORT_FORMATS), default='csv')
+        parser.add_argument('--user', type=int, help="Only export this user's wallet.")
+        parser.add_argument('--output', help="File to write to (default: stdout).")
+        parser.add_argument('--chunk-size', type=int, default=2000, help="Rows fetched per database round trip.")
+
+    def handle(self, *args, **options):
+        queryset = Transaction.objects.all()
+        if options['user']:
+            queryset = queryset.filter(wallet__user_id=options['user'])
+
+        chunks = stream_export(queryset, options['export_format'], chunk_size=options['chunk_size'])
+        if not options['output']:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+
+        try:
+            with open(options['output'], 'w', newline='') as out:
+                lines = 0
+                for chunk in chunks:
+                    out.write(chunk)
+                    lines += 1
+        except OSError as e:
+            raise CommandError(f"Cannot write {options['output']}: {e}")
+
+        rows = lines - 1 if options['export_format'] == 'csv' else lines
+        self.stdout.write(self.style.SUCCESS(f"Exported {rows} transactions to {options['output']}."))
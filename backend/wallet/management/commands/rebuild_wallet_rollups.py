@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from wallet.models import Wallet
+from wallet.reconciliation import wallet_id_ranges
+from wallet.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily and monthly wallet rollups from the transaction history."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help="Wallets rebuilt per transaction.")
+        parser.add_argument('--wallet', type=int, action='append', help="Only rebuild these wallet ids.")
+
+    def handle(self, *args, **options):
+        if options['wallet']:
+            chunks = [options['wallet']]
+        else:
+            chunks = (
+                list(Wallet.objects.filter(id__gte=low, id__lt=high).values_list('id', flat=True))
+                for low, high in wallet_id_ranges(options['chunk_size'])
+            )
+
+        wallets = rows = 0
+        for wallet_ids in chunks:
+            if wallet_ids:
+                rows += rebuild_rollups(wallet_ids)
+                wallets += len(wallet_ids)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} rollup rows for {wallets} wallets."))
@@ -0,0 +1,49 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from wallet.reconciliation import init_worker, reconcile_range, repair, wallet_id_ranges
+from wallet.units import minutes_to_hours
+
+
+class Command(BaseCommand):
+    help = "Compare every wallet balance with its transaction history and report (or repair) drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=10000, help="Wallet ids per aggregate query.")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help="Worker processes (1 runs everything in this process).")
+        parser.add_argument('--repair', action='store_true', help="Reset drifted balances to the expected value.")
+        parser.add_argument('--limit', type=int, default=50, help="Drifted wallets to list in the output.")
+
+    def handle(self, *args, **options):
+        if options['repair'] and getattr(settings, 'WALLET_LEDGER_JOURNAL', False):
+            raise CommandError("--repair is not supported in ledger journal mode; fix the ledger instead.")
+
+        ranges = wallet_id_ranges(options['chunk_size'])
+        if options['workers'] > 1 and len(ranges) > 1:
+            # Children must open their own database connections
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=options['workers'], initializer=init_worker) as pool:
+                results = list(pool.map(reconcile_range, ranges))
+        else:
+            results = [reconcile_range(bounds) for bounds in ranges]
+
+        checked = sum(count for count, _ in results)
+        drift = [row for _, rows in results for row in rows]
+
+        for wallet_id, balance, expected in drift[:options['limit']]:
+            self.stdout.write(
+                f"Wallet {wallet_id}: balance {minutes_to_hours(balance)}h, "
+                f"history says {minutes_to_hours(expected)}h ({balance - expected:+} min)"
+            )
+        if len(drift) > options['limit']:
+            self.stdout.write(f"... and {len(drift) - options['limit']} more")
+
+        summary = f"Checked {checked} wallets in {len(ranges)} ranges: {len(drift)} drifted."
+        self.stdout.write(self.style.WARNING(summary) if drift else self.style.SUCCESS(summary))
+
+        if options['repair'] and drift:
+            repaired = repair(drift)
+            self.stdout.write(self.style.SUCCESS(f"Repaired {repaired} wallets."))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from wallet.ledger import roll_snapshots
+
+
+class Command(BaseCommand):
+    help = "Roll wallet balance snapshots forward over the ledger entries written since the last run."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--settle-seconds', type=int, default=60,
+                            help="Ignore entries younger than this so in-flight transfers are not skipped.")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Wallets snapshotted per transaction.")
+        parser.add_argument('--prune', action='store_true', help="Delete snapshots superseded by this run.")
+
+    def handle(self, *args, **options):
+        written, cutoff = roll_snapshots(
+            settle_seconds=options['settle_seconds'],
+            batch_size=options['batch_size'],
+            prune=options['prune'],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} snapshots up to ledger entry #{cutoff}."))
@@ -0,0 +1,161 @@
+import itertools
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import timedelta
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection
+from django.db.models import Sum
+from django.utils.timezone import now
+from bookings.models import Booking, BookingStatus
+from skills.models import Skill
+from wallet.ledger import ledger_balance
+from wallet.models import Wallet
+from wallet.utils import process_booking_completion, process_booking_confirmation, transfer_time
+
+User = get_user_model()
+
+DEADLOCK_MARKERS = ('deadlock',)
+RETRYABLE_MARKERS = DEADLOCK_MARKERS + ('database is locked', 'database table is locked', 'could not serialize', 'lock timeout')
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed wallets and hammer them with concurrent transfers and booking completions through the "
+        "same code paths as the API, then report throughput, latency, retries and balance conservation."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wallets', type=int, default=50, help="Wallets to seed.")
+        parser.add_argument('--workers', type=int, default=8, help="Concurrent worker threads.")
+        parser.add_argument('--operations', type=int, default=200, help="Operations per worker.")
+        parser.add_argument('--booking-ratio', type=float, default=0.3,
+                            help="Share of operations that confirm and complete a booking instead of a plain transfer.")
+        parser.add_argument('--max-minutes', type=int, default=60, help="Largest amount moved by one operation.")
+        parser.add_argument('--max-retries', type=int, default=5, help="Retries for deadlocks and lock timeouts.")
+        parser.add_argument('--seed', type=int, help="Random seed for a reproducible run.")
+        parser.add_argument('--keep', action='store_true', help="Keep the seeded users afterwards.")
+
+    def handle(self, *args, **options):
+        run = uuid.uuid4().hex[:8]
+        users = self.seed(run, options['wallets'])
+        skills = {user.pk: Skill.objects.create(user=user, name="Load test", location='remote', is_offered=True) for user in users}
+        # Bookings get consecutive, non-overlapping times so they never trip the overlap check
+        self.booking_times = itertools.count()
+        self.booking_start = now() + timedelta(days=1)
+        self.booking_spacing = options['max_minutes']
+        wallet_ids = list(Wallet.objects.filter(user__in=users).values_list('id', flat=True))
+        before = self.total_balance(wallet_ids)
+
+        stats = {'latencies': [], 'retries': 0, 'deadlocks': 0, 'rejected': 0, 'errors': Counter()}
+        lock = threading.Lock()
+        rng = random.Random(options['seed'])
+        seeds = [rng.random() for _ in range(options['workers'])]
+
+        def worker(seed):
+            local = random.Random(seed)
+            try:
+                for _ in range(options['operations']):
+                    sender, receiver = local.sample(users, 2)
+                    if local.random() < options['booking_ratio']:
+                        duration = local.randint(15, options['max_minutes'])
+                        op = lambda: self.complete_booking(sender, receiver, skills[receiver.pk], duration)
+                    else:
+                        amount = local.randint(1, options['max_minutes'])
+                        op = lambda: transfer_time(sender, receiver, amount, reason="Load test")
+                    self.run_operation(op, options['max_retries'], stats, lock)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(seed,)) for seed in seeds]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        after = self.total_balance(wallet_ids)
+        self.report(stats, elapsed, before, after, options)
+
+        if not options['keep']:
+            User.objects.filter(pk__in=[user.pk for user in users]).delete()
+
+    def seed(self, run, count):
+        User.objects.bulk_create([
+            User(username=f"loadtest_{run}_{i}", email=f"loadtest_{run}_{i}@example.com") for i in range(count)
+        ])
+        users = list(User.objects.filter(username__startswith=f"loadtest_{run}_"))
+        # bulk_create skips the post_save signal that normally creates wallets
+        Wallet.objects.bulk_create([Wallet(user=user) for user in users], ignore_conflicts=True)
+        return users
+
+    def complete_booking(self, client, provider, skill, duration):
+        booking = Booking.objects.create(
+            skill=skill, booked_by=client, booked_for=provider, status=BookingStatus.CONFIRMED,
+            scheduled_time=self.booking_start + timedelta(minutes=next(self.booking_times) * self.booking_spacing), duration=duration,
+        )
+        process_booking_confirmation(booking)
+        process_booking_completion(booking)
+
+    def run_operation(self, op, max_retries, stats, lock):
+        started = time.perf_counter()
+        retries = deadlocks = 0
+        outcome = 'ok'
+        while True:
+            try:
+                op()
+            except ValidationError:
+                outcome = 'rejected'
+            except OperationalError as e:
+                message = str(e).lower()
+                if any(marker in message for marker in RETRYABLE_MARKERS) and retries < max_retries:
+                    retries += 1
+                    deadlocks += any(marker in message for marker in DEADLOCK_MARKERS)
+                    time.sleep(0.005 * 2 ** retries * random.random())
+                    continue
+                outcome = f"{type(e).__name__}: {e}"
+            except Exception as e:
+                outcome = f"{type(e).__name__}: {e}"
+            break
+        elapsed = time.perf_counter() - started
+
+        with lock:
+            stats['latencies'].append(elapsed)
+            stats['retries'] += retries
+            stats['deadlocks'] += deadlocks
+            if outcome == 'rejected':
+                stats['rejected'] += 1
+            elif outcome != 'ok':
+                stats['errors'][outcome] += 1
+
+    def total_balance(self, wallet_ids):
+        if getattr(settings, 'WALLET_LEDGER_JOURNAL', False):
+            return sum(ledger_balance(wallet_id) for wallet_id in wallet_ids)
+        return Wallet.objects.filter(id__in=wallet_ids).aggregate(total=Sum('balance'))['total'] or 0
+
+    def report(self, stats, elapsed, before, after, options):
+        latencies = sorted(stats['latencies'])
+
+        def percentile(q):
+            return latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000 if latencies else 0.0
+
+        ops = len(latencies)
+        self.stdout.write(f"Database:     {connection.vendor}")
+        self.stdout.write(f"Workers:      {options['workers']} x {options['operations']} operations on {options['wallets']} wallets")
+        self.stdout.write(f"Operations:   {ops} in {elapsed:.2f}s ({ops / elapsed if elapsed else 0:.1f} ops/s)")
+        self.stdout.write(f"Latency:      p50 {percentile(0.50):.1f} ms, p95 {percentile(0.95):.1f} ms, p99 {percentile(0.99):.1f} ms")
+        self.stdout.write(f"Retries:      {stats['retries']} ({stats['deadlocks']} deadlocks)")
+        self.stdout.write(f"Rejected:     {stats['rejected']} (insufficient balance)")
+        self.stdout.write(f"Errors:       {sum(stats['errors'].values())}")
+        for message, count in stats['errors'].most_common():
+            self.stdout.write(f"  {count} x {message}")
+        if before == after:
+            self.stdout.write(self.style.SUCCESS(f"Conservation: OK ({before} minutes before and after)"))
+        else:
+            self.stdout.write(self.style.ERROR(f"Conservation: FAILED ({before} minutes before, {after} after)"))
@@ -0,0 +1,77 @@
+# Store wallet balances and amounts as whole minutes instead of decimal hours.
+
+from django.db import migrations, models
+from django.db.models import F
+from django.db.models.functions import Round
+
+# (model, field) pairs that hold an amount of time
+AMOUNT_FIELDS = [
+    ('Wallet', 'balance'),
+    ('Transaction', 'amount'),
+    ('LedgerEntry', 'amount'),
+    ('BalanceSnapshot', 'balance'),
+]
+
+
+def hours_to_minutes(apps, schema_editor):
+    for model_name, field in AMOUNT_FIELDS:
+        model = apps.get_model('wallet', model_name)
+        model.objects.update(**{field: Round(F(field) * 60)})
+
+
+def minutes_to_hours(apps, schema_editor):
+    for model_name, field in AMOUNT_FIELDS:
+        model = apps.get_model('wallet', model_name)
+        model.objects.update(**{field: F(field) / 60.0})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0005_transaction_wallet_history_idx'),
+    ]
+
+    operations = [
+        # Widen first so amounts expressed in minutes fit (Transaction.amount was max_digits=5)
+        migrations.AlterField(
+            model_name='wallet',
+            name='balance',
+            field=models.DecimalField(decimal_places=2, default=10.0, max_digits=14),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='amount',
+            field=models.DecimalField(decimal_places=2, max_digits=14),
+        ),
+        migrations.AlterField(
+            model_name='ledgerentry',
+            name='amount',
+            field=models.DecimalField(decimal_places=2, max_digits=14),
+        ),
+        migrations.AlterField(
+            model_name='balancesnapshot',
+            name='balance',
+            field=models.DecimalField(decimal_places=2, max_digits=14),
+        ),
+        migrations.RunPython(hours_to_minutes, minutes_to_hours),
+        migrations.AlterField(
+            model_name='wallet',
+            name='balance',
+            field=models.BigIntegerField(default=600, help_text='Balance in minutes'),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='amount',
+            field=models.PositiveIntegerField(help_text='Amount in minutes'),
+        ),
+        migrations.AlterField(
+            model_name='ledgerentry',
+            name='amount',
+            field=models.BigIntegerField(help_text='Signed amount in minutes'),
+        ),
+        migrations.AlterField(
+            model_name='balancesnapshot',
+            name='balance',
+            field=models.BigIntegerField(help_text='Balance in minutes'),
+        ),
+    ]
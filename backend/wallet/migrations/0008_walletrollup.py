@@ -0,0 +1,30 @@
+# Generated by Django 5.2 on 2026-10-17 22:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0007_wallet_holds'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WalletRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('day', 'Day'), ('month', 'Month')], max_length=5)),
+                ('period_start', models.DateField()),
+                ('earned', models.BigIntegerField(default=0, help_text='Minutes credited')),
+                ('earned_count', models.PositiveIntegerField(default=0)),
+                ('spent', models.BigIntegerField(default=0, help_text='Minutes debited')),
+                ('spent_count', models.PositiveIntegerField(default=0)),
+                ('wallet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='wallet.wallet')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('wallet', 'period', 'period_start'), name='wallet_rollup_unique_period')],
+            },
+        ),
+    ]
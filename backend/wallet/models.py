@@ -1,35 +1,100 @@
 from django.db import models
+from django.db.models import F, Q
+from django.core.exceptions import ValidationError
 from django.conf import settings
-from decimal import Decimal
+from django.utils.functional import cached_property
 from django.utils.timezone import now
+from .units import minutes_to_hours
 
 User = settings.AUTH_USER_MODEL
 
+
+class WalletQuerySet(models.QuerySet):
+    def debit(self, amount):
+        """
+        Subtract ``amount`` minutes with a single conditional UPDATE.
+        Returns False (and changes nothing) when the available balance
+        (balance minus open holds) is too low.
+        """
+        amount = int(amount)
+        updated = self.filter(balance__gte=F('held') + amount).update(balance=F('balance') - amount, updated_at=now())
+        return updated > 0
+
+    def credit(self, amount):
+        """Add ``amount`` minutes with a single UPDATE. Returns True if a wallet was updated."""
+        amount = int(amount)
+        updated = self.update(balance=F('balance') + amount, updated_at=now())
+        return updated > 0
+
+    def hold(self, amount):
+        """Reserve ``amount`` minutes if they are available. Returns True on success."""
+        amount = int(amount)
+        updated = self.filter(balance__gte=F('held') + amount).update(held=F('held') + amount, updated_at=now())
+        return updated > 0
+
+    def release(self, amount):
+        """Give back ``amount`` reserved minutes."""
+        updated = self.update(held=F('held') - int(amount), updated_at=now())
+        return updated > 0
+
+    def capture(self, held_amount, amount):
+        """
+        Settle a hold of ``held_amount`` minutes by charging ``amount`` minutes
+        (they differ when a booking's duration changed after confirmation).
+        """
+        held_amount, amount = int(held_amount), int(amount)
+        updated = self.filter(balance__gte=F('held') - held_amount + amount).update(
+            balance=F('balance') - amount, held=F('held') - held_amount, updated_at=now()
+        )
+        return updated > 0
+
+
 class Wallet(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='wallet')
-    balance = models.DecimalField(max_digits=10, decimal_places=2, default=10.00)
+    balance = models.BigIntegerField(default=600, help_text="Balance in minutes")
+    held = models.BigIntegerField(default=0, help_text="Minutes reserved by open holds")
     created_at = models.DateTimeField(default=now)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = WalletQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.CheckConstraint(condition=Q(balance__gte=0), name='wallet_balance_non_negative'),
+            models.CheckConstraint(condition=Q(held__gte=0), name='wallet_held_non_negative'),
+        ]
+
     def has_sufficient_balance(self, amount):
-        return self.balance >= amount
+        return self.available_balance >= amount
 
 
     def deduct(self, amount):
-        amount = Decimal(str(amount))
-        if not self.has_sufficient_balance(amount):
+        if not Wallet.objects.filter(pk=self.pk).debit(amount):
             raise ValueError("Insufficient balance")
-        
-        self.balance -= amount
-        self.save()
+        self.refresh_from_db(fields=['balance', 'updated_at'])
 
     def credit(self, amount):
-        amount = Decimal(str(amount))
-        self.balance += amount
-        self.save()
+        Wallet.objects.filter(pk=self.pk).credit(amount)
+        self.refresh_from_db(fields=['balance', 'updated_at'])
+
+    def refresh_from_db(self, *args, **kwargs):
+        self.__dict__.pop('current_balance', None)
+        super().refresh_from_db(*args, **kwargs)
+
+    @cached_property
+    def current_balance(self):
+        """Balance as the rest of the app should see it (ledger-derived in journal mode)."""
+        if getattr(settings, 'WALLET_LEDGER_JOURNAL', False):
+            from .ledger import ledger_balance
+            return ledger_balance(self.pk)
+        return self.balance
+
+    @property
+    def available_balance(self):
+        return self.current_balance - self.held
 
     def __str__(self):
-        return f"{self.user.username} - Balance: {self.balance}h"
+        return f"{self.user.username} - Balance: {minutes_to_hours(self.balance)}h"
 
 
 class Transaction(models.Model):
@@ -37,11 +102,108 @@ class Transaction(models.Model):
     sender = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='sent_transactions')
     receiver = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='received_transactions')
     transaction_type = models.CharField(max_length=10, choices=[('debit', 'Debit'), ('credit', 'Credit')], default='debit')
-    amount = models.DecimalField(max_digits=5, decimal_places=2)
+    amount = models.PositiveIntegerField(help_text="Amount in minutes")
     reason = models.CharField(max_length=255, blank=True)
     status = models.CharField(max_length=10, choices=[('pending', 'Pending'), ('completed', 'Completed'), ('failed', 'Failed')], default='completed')
     booking = models.ForeignKey('bookings.Booking', on_delete=models.SET_NULL, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['wallet', 'created_at', 'id'], name='transaction_wallet_history_idx'),
+        ]
+
+    def __str__(self):
+        return f"Transaction from {self.sender.username} to {self.receiver.username} : {minutes_to_hours(self.amount)}hr"
+
+
+class LedgerEntry(models.Model):
+    """
+    Immutable journal line. Every transfer writes a pair of entries sharing
+    ``transfer_id`` whose signed amounts sum to zero.
+    """
+    wallet = models.ForeignKey(Wallet, on_delete=models.CASCADE, related_name='ledger_entries')
+    transfer_id = models.UUIDField(db_index=True)
+    amount = models.BigIntegerField(help_text="Signed amount in minutes")
+    transaction = models.ForeignKey(Transaction, on_delete=models.SET_NULL, null=True, blank=True, related_name='ledger_entries')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['wallet', 'id'], name='ledger_wallet_id_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            raise ValidationError("Ledger entries are immutable.")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValidationError("Ledger entries are immutable.")
+
+    def __str__(self):
+        return f"{self.wallet_id} {self.amount:+}min ({self.transfer_id})"
+
+
+class BalanceSnapshot(models.Model):
+    """Wallet balance including every ledger entry with ``id <= last_entry_id``."""
+    wallet = models.ForeignKey(Wallet, on_delete=models.CASCADE, related_name='snapshots')
+    balance = models.BigIntegerField(help_text="Balance in minutes")
+    last_entry_id = models.BigIntegerField(default=0, db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['wallet', '-last_entry_id'], name='snapshot_wallet_latest_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.wallet_id} - {minutes_to_hours(self.balance)}h @ entry {self.last_entry_id}"
+
+
+class WalletHold(models.Model):
+    """Minutes reserved on the payer's wallet between booking confirmation and completion."""
+    HELD = 'held'
+    CAPTURED = 'captured'
+    RELEASED = 'released'
+    STATUS_CHOICES = [
+        (HELD, 'Held'),
+        (CAPTURED, 'Captured'),
+        (RELEASED, 'Released'),
+    ]
+
+    wallet = models.ForeignKey(Wallet, on_delete=models.CASCADE, related_name='holds')
+    booking = models.OneToOneField('bookings.Booking', on_delete=models.CASCADE, related_name='wallet_hold')
+    amount = models.PositiveIntegerField(help_text="Amount in minutes")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=HELD)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Hold of {minutes_to_hours(self.amount)}h for booking {self.booking_id} ({self.status})"
+
+
+class WalletRollup(models.Model):
+    """Per-wallet earned/spent totals for one day or one month, kept up to date as transactions are written."""
+    DAY = 'day'
+    MONTH = 'month'
+    PERIOD_CHOICES = [
+        (DAY, 'Day'),
+        (MONTH, 'Month'),
+    ]
+
+    wallet = models.ForeignKey(Wallet, on_delete=models.CASCADE, related_name='rollups')
+    period = models.CharField(max_length=5, choices=PERIOD_CHOICES)
+    period_start = models.DateField()
+    earned = models.BigIntegerField(default=0, help_text="Minutes credited")
+    earned_count = models.PositiveIntegerField(default=0)
+    spent = models.BigIntegerField(default=0, help_text="Minutes debited")
+    spent_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['wallet', 'period', 'period_start'], name='wallet_rollup_unique_period'),
+        ]
+
     def __str__(self):
-        return f"Transaction from {self.sender.username} to {self.receiver.username} : {self.amount}hr"
+        return f"{self.wallet_id} {self.period} {self.period_start}: +{self.earned} / -{self.spent} min"
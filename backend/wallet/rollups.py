@@ -0,0 +1,70 @@
+"""
+Daily and monthly earned/spent rollups per wallet.
+
+``apply_transactions`` folds new Transaction rows into their WalletRollup
+rows with F() increments once the writing transaction commits (the
+post_save signal handles single rows, bulk writers call it directly).
+``rebuild_rollups`` recomputes them from the raw history in wallet-id
+chunks, which also repairs increments lost to a crash right after commit.
+"""
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import Count, DateField, Q, Sum
+from django.db.models.functions import TruncDate, TruncMonth
+from django.utils import timezone
+from utils.counters import increment
+from .models import Transaction, WalletRollup
+
+ROLLUP_TYPES = {'credit': ('earned', 'earned_count'), 'debit': ('spent', 'spent_count')}
+
+
+def period_starts(created_at):
+    day = timezone.localdate(created_at)
+    return ((WalletRollup.DAY, day), (WalletRollup.MONTH, day.replace(day=1)))
+
+
+def apply_transactions(transactions):
+    deltas = defaultdict(lambda: defaultdict(int))
+    for row in transactions:
+        if row.status != 'completed' or row.transaction_type not in ROLLUP_TYPES:
+            continue
+        amount_field, count_field = ROLLUP_TYPES[row.transaction_type]
+        for period, start in period_starts(row.created_at):
+            delta = deltas[(row.wallet_id, period, start)]
+            delta[amount_field] += row.amount
+            delta[count_field] += 1
+
+    if deltas:
+        # Applied after the transfer commits, so transfers do not hold locks
+        # on a wallet's (day, month) rollup rows for the rest of their transaction
+        transaction.on_commit(lambda: _apply_deltas(deltas))
+
+
+def _apply_deltas(deltas):
+    # Sorted so concurrent writers touch rollup rows in the same order
+    for (wallet_id, period, start), delta in sorted(deltas.items()):
+        increment(WalletRollup, {'wallet_id': wallet_id, 'period': period, 'period_start': start}, delta)
+
+
+def rebuild_rollups(wallet_ids, batch_size=1000):
+    """Recompute every rollup row for ``wallet_ids`` from their completed transactions."""
+    rollups = []
+    for period, trunc in ((WalletRollup.DAY, TruncDate), (WalletRollup.MONTH, TruncMonth)):
+        rows = (
+            Transaction.objects.filter(wallet_id__in=wallet_ids, status='completed')
+            .annotate(period_start=trunc('created_at', output_field=DateField()))
+            .values('wallet_id', 'period_start')
+            .annotate(
+                earned=Sum('amount', filter=Q(transaction_type='credit'), default=0),
+                earned_count=Count('id', filter=Q(transaction_type='credit')),
+                spent=Sum('amount', filter=Q(transaction_type='debit'), default=0),
+                spent_count=Count('id', filter=Q(transaction_type='debit')),
+            )
+            .order_by()
+        )
+        rollups.extend(WalletRollup(period=period, **row) for row in rows)
+
+    with transaction.atomic():
+        WalletRollup.objects.filter(wallet_id__in=wallet_ids).delete()
+        WalletRollup.objects.bulk_create(rollups, batch_size=batch_size)
+    return len(rollups)
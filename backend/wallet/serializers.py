@@ -1,16 +1,59 @@
 from rest_framework import serializers
-from .models import Wallet, Transaction
+from .models import Wallet, Transaction, WalletRollup
+from .units import hours_to_minutes, minutes_to_hours
+
+
+class HoursField(serializers.DecimalField):
+    """Reads and writes hours over the API for values stored as whole minutes."""
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('max_digits', 12)
+        kwargs.setdefault('decimal_places', 2)
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        return super().to_representation(minutes_to_hours(value))
+
+    def to_internal_value(self, data):
+        return hours_to_minutes(super().to_internal_value(data))
+
 
 class WalletSerializer(serializers.ModelSerializer):
+    balance = HoursField(source='current_balance', read_only=True)
+    balance_minutes = serializers.IntegerField(source='current_balance', read_only=True)
+    held = HoursField(read_only=True)
+    available_balance = HoursField(read_only=True)
+
     class Meta:
         model = Wallet
-        fields = ['id', 'user', 'balance']
+        fields = ['id', 'user', 'balance', 'balance_minutes', 'held', 'available_balance']
 
 class TransactionSerializer(serializers.ModelSerializer):
     sender_username = serializers.CharField(source='sender.username', read_only=True)
     receiver_username = serializers.CharField(source='receiver.username', read_only=True)
+    amount = HoursField(read_only=True)
+    amount_minutes = serializers.IntegerField(source='amount', read_only=True)
 
     class Meta:
         model = Transaction
-        fields = ['id', 'sender', 'sender_username', 'receiver', 'receiver_username', 'amount', 'reason', 'created_at']
-        read_only_fields = ['sender']
\ No newline at end of file
+        fields = ['id', 'sender', 'sender_username', 'receiver', 'receiver_username', 'amount', 'amount_minutes', 'reason', 'created_at']
+        read_only_fields = ['sender']
+
+
+class BulkTransferEntrySerializer(serializers.Serializer):
+    receiver_id = serializers.IntegerField()
+    amount = HoursField(min_value=0)
+    reason = serializers.CharField(max_length=255, required=False, allow_blank=True, default='')
+
+
+class BulkTransferSerializer(serializers.Serializer):
+    transfers = BulkTransferEntrySerializer(many=True, allow_empty=False, max_length=1000)
+
+
+class WalletRollupSerializer(serializers.ModelSerializer):
+    earned = HoursField(read_only=True)
+    spent = HoursField(read_only=True)
+
+    class Meta:
+        model = WalletRollup
+        fields = ['period', 'period_start', 'earned', 'earned_count', 'spent', 'spent_count']
@@ -1,9 +1,11 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, pre_delete
 from django.dispatch import receiver
 from django.core.mail import send_mail
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from .models import Wallet, Transaction
+from .models import Wallet, Transaction, WalletHold
+from .units import minutes_to_hours
+from .rollups import apply_transactions
 
 User = get_user_model()
 
@@ -13,14 +15,29 @@ def create_user_wallet(sender, instance, created, **kwargs):
     if created and not hasattr(instance, 'wallet'):
         Wallet.objects.create(user=instance)
 
+# Keep the daily/monthly rollups in step with new transactions
+@receiver(post_save, sender=Transaction)
+def update_wallet_rollups(sender, instance, created, **kwargs):
+    if created:
+        apply_transactions([instance])
+
+# Give the payer back an open hold whose booking is being deleted (directly or
+# through its provider, client or skill), so Wallet.held does not stay reserved
+@receiver(pre_delete, sender=WalletHold)
+def release_deleted_hold(sender, instance, **kwargs):
+    # Flip the status conditionally so a concurrent capture/release cannot also apply it
+    if WalletHold.objects.filter(pk=instance.pk, status=WalletHold.HELD).update(status=WalletHold.RELEASED):
+        Wallet.objects.filter(pk=instance.wallet_id).release(instance.amount)
+
 # Send email notification when a new transaction is created
 @receiver(post_save, sender=Transaction)
 def send_transfer_notification(sender, instance, created, **kwargs):
-    if created and instance.receiver and instance.sender:
-        subject = f"Time Transfer Notification: {instance.amount} hours"
+    if created and instance.transaction_type == 'credit' and instance.receiver and instance.sender:
+        hours = minutes_to_hours(instance.amount)
+        subject = f"Time Transfer Notification: {hours} hours"
         message = (
             f"Dear {instance.receiver.username},\n\n"
-            f"You have received {instance.amount} hours from {instance.sender.username} "
+            f"You have received {hours} hours from {instance.sender.username} "
             f"for the reason: {instance.reason or 'No reason provided'}.\n\n"
             f"Regards,\nYour App Team"
         )
@@ -1,3 +1,354 @@
-from django.test import TestCase
+import json
+from io import StringIO
+from unittest.mock import patch
+from django.core.cache import cache
+from django.core.management import call_command
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from rest_framework.exceptions import ValidationError as DRFValidationError
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework.views import APIView
+from utils.idempotency import idempotent
+from .ledger import ledger_balance, roll_snapshots
+from .reconciliation import reconcile_range, repair, wallet_id_ranges
+from datetime import timedelta
+from django.utils.timezone import now
+from bookings.models import Booking, BookingStatus
+from skills.models import Skill
+from .models import BalanceSnapshot, LedgerEntry, Wallet, WalletHold, WalletRollup, Transaction
+from .views import WalletSummaryView
+from .utils import bulk_transfer_time, place_hold, process_booking_cancellation, process_booking_completion, transfer_time
 
-# Create your tests here.
+User = get_user_model()
+
+
+class WalletBalanceTestCase(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username="alice", email="alice@example.com", password="testpass")
+        self.bob = User.objects.create_user(username="bob", email="bob@example.com", password="testpass")
+
+    def test_conditional_debit(self):
+        """debit() only succeeds when the balance covers the amount"""
+        wallets = Wallet.objects.filter(user=self.alice)
+        self.assertTrue(wallets.debit(240))
+        self.assertFalse(wallets.debit(6000))
+        self.assertEqual(wallets.get().balance, 360)
+
+    def test_balance_check_constraint(self):
+        """The database refuses negative balances"""
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Wallet.objects.filter(user=self.alice).update(balance=-1)
+
+    def test_transfer_time(self):
+        """transfer_time moves balance and records both sides"""
+        transfer_time(self.alice, self.bob, 120, reason="Thanks")
+        self.assertEqual(Wallet.objects.get(user=self.alice).balance, 480)
+        self.assertEqual(Wallet.objects.get(user=self.bob).balance, 720)
+        self.assertEqual(Transaction.objects.count(), 2)
+
+    def test_wallet_api_reports_hours(self):
+        client = APIClient()
+        client.force_authenticate(user=self.alice)
+        response = client.get("/wallet/wallet/")
+        self.assertEqual(response.json()["balance"], "10.00")
+        self.assertEqual(response.json()["balance_minutes"], 600)
+
+    def test_transfer_time_insufficient_balance(self):
+        """A failed debit leaves both wallets untouched"""
+        with self.assertRaises(ValidationError):
+            transfer_time(self.alice, self.bob, 3000)
+        self.assertEqual(Wallet.objects.get(user=self.bob).balance, 600)
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_reconcile_wallets(self):
+        """Drift between balance and history is reported and repaired"""
+        transfer_time(self.alice, self.bob, 120)
+        Wallet.objects.filter(user=self.bob).update(balance=1000)
+
+        out = StringIO()
+        call_command("reconcile_wallets", "--workers", "1", "--repair", stdout=out)
+        self.assertIn("2 wallets in 1 ranges: 1 drifted", out.getvalue())
+        self.assertEqual(Wallet.objects.get(user=self.bob).balance, 720)
+
+    def test_repair_recomputes_expected_balance(self):
+        """A transfer committed between the check and the repair is kept, not overwritten"""
+        Wallet.objects.filter(user=self.bob).update(balance=1000)
+        _, drift = reconcile_range(wallet_id_ranges(100)[0])
+        self.assertEqual([(balance, expected) for _, balance, expected in drift], [(1000, 600)])
+
+        transfer_time(self.alice, self.bob, 60)
+        self.assertEqual(repair(drift), 1)
+        self.assertEqual(Wallet.objects.get(user=self.bob).balance, 660)
+        self.assertEqual(reconcile_range(wallet_id_ranges(100)[0])[1], [])
+
+
+
+class WalletLoadTestCommandTestCase(TransactionTestCase):
+    def test_loadtest_conserves_balance(self):
+        """Concurrent transfers and completions neither create nor destroy time"""
+        out = StringIO()
+        call_command("wallet_loadtest", "--wallets", "4", "--workers", "2", "--operations", "10", "--seed", "1", stdout=out)
+        self.assertIn("Operations:   20", out.getvalue())
+        self.assertIn("Conservation: OK", out.getvalue())
+        self.assertFalse(User.objects.filter(username__startswith="loadtest_").exists())
+
+
+class WalletHoldTestCase(TestCase):
+    def setUp(self):
+        self.client_user = User.objects.create_user(username="client", email="client@example.com", password="testpass")
+        self.provider = User.objects.create_user(username="provider", email="provider@example.com", password="testpass")
+        self.skill = Skill.objects.create(user=self.provider, name="Guitar", location="remote", is_offered=True)
+
+    def make_booking(self, duration):
+        return Booking.objects.create(
+            skill=self.skill, booked_by=self.client_user, booked_for=self.provider,
+            status=BookingStatus.CONFIRMED, scheduled_time=now() + timedelta(days=1), duration=duration,
+        )
+
+    def test_holds_limit_confirmations(self):
+        """Confirmed bookings cannot reserve more than the wallet holds"""
+        place_hold(self.make_booking(400))
+        with self.assertRaises(ValidationError):
+            place_hold(self.make_booking(300))
+        wallet = Wallet.objects.get(user=self.client_user)
+        self.assertEqual((wallet.held, wallet.available_balance), (400, 200))
+
+    def test_completion_captures_hold(self):
+        booking = self.make_booking(90)
+        place_hold(booking)
+        process_booking_completion(booking)
+        payer = Wallet.objects.get(user=self.client_user)
+        self.assertEqual((payer.balance, payer.held), (510, 0))
+        self.assertEqual(Wallet.objects.get(user=self.provider).balance, 690)
+        self.assertEqual(WalletHold.objects.get(booking=booking).status, WalletHold.CAPTURED)
+
+    def test_cancellation_releases_hold(self):
+        booking = self.make_booking(90)
+        place_hold(booking)
+        self.assertTrue(process_booking_cancellation(booking))
+        self.assertFalse(process_booking_cancellation(booking))
+        self.assertEqual(Wallet.objects.get(user=self.client_user).held, 0)
+
+    def test_deleting_provider_releases_hold(self):
+        """A hold cascaded away with its booking gives the minutes back"""
+        place_hold(self.make_booking(120))
+        self.assertEqual(Wallet.objects.get(user=self.client_user).held, 120)
+        self.provider.delete()
+        self.assertEqual(Wallet.objects.get(user=self.client_user).held, 0)
+
+
+class BulkTransferAPITestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create_superuser(username="admin", email="admin@example.com", password="testpass")
+        self.client.force_authenticate(user=self.admin)
+        self.receivers = [
+            User.objects.create_user(username=f"user{i}", email=f"user{i}@example.com", password="testpass")
+            for i in range(3)
+        ]
+
+    def test_bulk_transfer(self):
+        """Entries are applied in order while the balance lasts"""
+        payload = {"transfers": [
+            {"receiver_id": self.receivers[0].id, "amount": "4", "reason": "Stipend"},
+            {"receiver_id": self.receivers[1].id, "amount": "4"},
+            {"receiver_id": 999999, "amount": "1"},
+            {"receiver_id": self.receivers[2].id, "amount": "4"},
+        ]}
+        response = self.client.post("/wallet/transfer/bulk/", payload, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["completed"], 2)
+        self.assertEqual([r["status"] for r in response.json()["results"]], ["completed", "completed", "failed", "failed"])
+
+        self.assertEqual(Wallet.objects.get(user=self.admin).balance, 120)
+        self.assertEqual(Wallet.objects.get(user=self.receivers[1]).balance, 840)
+        self.assertEqual(Wallet.objects.get(user=self.receivers[2]).balance, 600)
+        self.assertEqual(Transaction.objects.count(), 4)
+
+    def test_bulk_transfer_requires_admin(self):
+        self.client.force_authenticate(user=self.receivers[0])
+        response = self.client.post("/wallet/transfer/bulk/", {"transfers": []}, format="json")
+        self.assertEqual(response.status_code, 403)
+
+    def test_bulk_transfer_idempotency_key(self):
+        """A retried request replays the stored response instead of paying twice"""
+        cache.clear()
+        payload = {"transfers": [{"receiver_id": self.receivers[0].id, "amount": "2"}]}
+        first = self.client.post("/wallet/transfer/bulk/", payload, format="json", HTTP_IDEMPOTENCY_KEY="stipend-1")
+        replay = self.client.post("/wallet/transfer/bulk/", payload, format="json", HTTP_IDEMPOTENCY_KEY="stipend-1")
+        self.assertEqual(replay.json(), first.json())
+        self.assertEqual(replay["Idempotent-Replayed"], "true")
+        self.assertEqual(Wallet.objects.get(user=self.receivers[0]).balance, 720)
+
+        payload["transfers"][0]["amount"] = "3"
+        response = self.client.post("/wallet/transfer/bulk/", payload, format="json", HTTP_IDEMPOTENCY_KEY="stipend-1")
+        self.assertEqual(response.status_code, 422)
+
+
+class IdempotencyTestCase(TestCase):
+    """Only successful responses are stored; any failure frees the key for a retry"""
+
+    class View(APIView):
+        permission_classes = [AllowAny]
+        outcomes = []
+
+        @idempotent
+        def post(self, request):
+            outcome = self.outcomes.pop(0)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return Response({"outcome": outcome}, status=outcome)
+
+    def post(self, *outcomes):
+        self.View.outcomes = list(outcomes)
+        request = APIRequestFactory().post("/", {"amount": 1}, format="json", HTTP_IDEMPOTENCY_KEY="retry-1")
+        return self.View.as_view()(request)
+
+    def test_error_response_is_not_replayed(self):
+        self.assertEqual(self.post(400).status_code, 400)
+        retry = self.post(200)
+        self.assertEqual(retry.status_code, 200)
+        self.assertFalse(retry.has_header("Idempotent-Replayed"))
+        self.assertEqual(self.post().data, {"outcome": 200})
+
+    def test_raised_error_is_not_replayed(self):
+        self.assertEqual(self.post(DRFValidationError("Invalid")).status_code, 400)
+        self.assertEqual(self.post(201).status_code, 201)
+        self.assertEqual(self.post()["Idempotent-Replayed"], "true")
+
+    @override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+                               "idempotency": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+    def test_process_local_cache_is_refused(self):
+        """Keys kept per process would let a retry on another worker run again"""
+        self.assertEqual(self.post(200).status_code, 500)
+        self.assertEqual(self.View.outcomes, [200])
+
+
+class TransactionHistoryAPITestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.alice = User.objects.create_user(username="alice", email="alice@example.com", password="testpass")
+        self.bob = User.objects.create_user(username="bob", email="bob@example.com", password="testpass")
+        self.client.force_authenticate(user=self.alice)
+        # Rollups are applied once the transfers commit
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(7):
+                transfer_time(self.alice, self.bob, 30)
+
+    def test_history_is_scoped_and_cursor_paginated(self):
+        """Only the caller's wallet rows are listed, newest first, page by page"""
+        first = self.client.get("/wallet/transactions/").json()
+        self.assertEqual(len(first["results"]), 5)
+        self.assertNotIn("count", first)
+        second = self.client.get(first["next"]).json()
+        self.assertEqual(len(second["results"]), 2)
+        self.assertIsNone(second["next"])
+
+        ids = [row["id"] for row in first["results"] + second["results"]]
+        expected = Transaction.objects.filter(wallet__user=self.alice).order_by("-created_at", "-id")
+        self.assertEqual(ids, list(expected.values_list("id", flat=True)))
+
+    def test_export_streams_csv_and_ndjson(self):
+        response = self.client.get("/wallet/transactions/export/")
+        self.assertEqual(response.status_code, 200)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(",")[:3], ["id", "created_at", "transaction_type"])
+        self.assertEqual(len(lines), 8)
+
+        response = self.client.get("/wallet/transactions/export/?export_format=ndjson")
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+        self.assertEqual({row["receiver"] for row in rows}, {"bob"})
+
+    def test_export_rejects_non_integer_user_id(self):
+        self.alice.is_staff = True
+        self.alice.save()
+        response = self.client.get("/wallet/transactions/export/?user_id=bob")
+        self.assertEqual(response.status_code, 400)
+
+    def test_history_type_filter(self):
+        spent = self.client.get("/wallet/transactions/?type=spent&page_size=20").json()["results"]
+        earned = self.client.get("/wallet/transactions/?type=earned&page_size=20").json()["results"]
+        self.assertEqual((len(spent), len(earned)), (7, 0))
+
+    def test_summary_reads_rollups(self):
+        """Rollups are maintained incrementally and match a full rebuild"""
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_transfer_time(self.bob, [{"receiver_id": self.alice.id, "amount": 45}])
+        summary = self.client.get("/wallet/summary/?period=day").json()
+        self.assertEqual((summary["spent"], summary["earned"]), ("3.50", "0.75"))
+        self.assertEqual(summary["periods"][0]["spent_count"], 7)
+
+        before = sorted(WalletRollup.objects.values_list("wallet_id", "period", "earned", "earned_count", "spent", "spent_count"))
+        call_command("rebuild_wallet_rollups", stdout=StringIO())
+        after = sorted(WalletRollup.objects.values_list("wallet_id", "period", "earned", "earned_count", "spent", "spent_count"))
+        self.assertEqual(before, after)
+
+    def test_summary_totals_are_not_capped(self):
+        """Only the periods list is capped; the totals cover every rollup in range"""
+        wallet = Wallet.objects.get(user=self.alice)
+        WalletRollup.objects.filter(wallet=wallet).delete()
+        start = now().date()
+        WalletRollup.objects.bulk_create(
+            WalletRollup(wallet=wallet, period=WalletRollup.DAY, period_start=start - timedelta(days=day), earned=60)
+            for day in range(3)
+        )
+        with patch.object(WalletSummaryView, "max_periods", 2):
+            summary = self.client.get("/wallet/summary/?period=day").json()
+        self.assertEqual(len(summary["periods"]), 2)
+        self.assertEqual((summary["earned"], summary["net"]), ("3.00", "3.00"))
+
+    def test_history_query_count_is_constant(self):
+        with self.assertNumQueries(1):
+            self.client.get("/wallet/transactions/?page_size=20")
+
+
+@override_settings(WALLET_LEDGER_JOURNAL=True)
+class LedgerJournalTestCase(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username="alice", email="alice@example.com", password="testpass")
+        self.bob = User.objects.create_user(username="bob", email="bob@example.com", password="testpass")
+
+    def test_transfer_writes_entry_pair(self):
+        """Journal transfers append a balanced pair and leave Wallet.balance alone"""
+        transfer_time(self.alice, self.bob, 180)
+        self.assertEqual(LedgerEntry.objects.count(), 2)
+        self.assertEqual(sum(e.amount for e in LedgerEntry.objects.all()), 0)
+        self.assertEqual(Wallet.objects.get(user=self.bob).balance, 600)
+        self.assertEqual(ledger_balance(self.bob.wallet.pk), 780)
+
+    def test_transfer_leaves_rollups_until_commit(self):
+        """Journal transfers do not lock rollup rows inside their transaction"""
+        with self.captureOnCommitCallbacks() as callbacks:
+            transfer_time(self.alice, self.bob, 180)
+            self.assertFalse(WalletRollup.objects.exists())
+        for callback in callbacks:
+            callback()
+        self.assertEqual(WalletRollup.objects.get(wallet__user=self.bob, period=WalletRollup.DAY).earned, 180)
+
+    def test_insufficient_ledger_balance(self):
+        transfer_time(self.alice, self.bob, 480)
+        with self.assertRaises(ValidationError):
+            transfer_time(self.alice, self.bob, 300)
+
+    def test_bulk_transfer_posts_ledger_pairs(self):
+        results = bulk_transfer_time(self.alice, [{"receiver_id": self.bob.id, "amount": 360}, {"receiver_id": self.bob.id, "amount": 360}])
+        self.assertEqual([r["status"] for r in results], ["completed", "failed"])
+        self.assertEqual(LedgerEntry.objects.filter(transaction__isnull=False).count(), 2)
+        self.assertEqual(ledger_balance(self.alice.wallet.pk), 240)
+
+    def test_roll_snapshots(self):
+        """Rolling snapshots folds entries in without changing the derived balance"""
+        transfer_time(self.alice, self.bob, 180)
+        written, cutoff = roll_snapshots(settle_seconds=0)
+        self.assertEqual(written, 2)
+        self.assertEqual(BalanceSnapshot.objects.get(wallet__user=self.bob).balance, 780)
+        self.assertEqual(Wallet.objects.get(user=self.alice).balance, 420)
+
+        transfer_time(self.bob, self.alice, 60)
+        self.assertEqual(ledger_balance(self.bob.wallet.pk), 720)
+        self.assertEqual(roll_snapshots(settle_seconds=0)[0], 2)
+        self.assertEqual(ledger_balance(self.alice.wallet.pk), 480)
@@ -0,0 +1,19 @@
+"""
+Wallet amounts are stored as whole minutes. The API still speaks hours, so
+conversion happens only at the edges (serializers, request parsing, e-mails).
+"""
+from decimal import Decimal, ROUND_HALF_UP
+
+MINUTES_PER_HOUR = 60
+HOURS_QUANTUM = Decimal('0.01')
+
+
+def hours_to_minutes(hours):
+    """Convert an hours value (number or numeric string) to whole minutes."""
+    minutes = Decimal(str(hours)) * MINUTES_PER_HOUR
+    return int(minutes.quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+
+def minutes_to_hours(minutes):
+    """Convert whole minutes to hours rounded to two decimal places."""
+    return (Decimal(minutes) / MINUTES_PER_HOUR).quantize(HOURS_QUANTUM, rounding=ROUND_HALF_UP)
@@ -1,10 +1,13 @@
 from django.urls import path
-from .views import WalletView, TransactionHistoryView
+from .views import WalletView, TransactionHistoryView, AdminBulkTransferView, TransactionExportView, WalletSummaryView
 
 app_name = 'wallet'
 
 urlpatterns = [
     path('wallet/', WalletView.as_view(), name='wallet'),
+    path('summary/', WalletSummaryView.as_view(), name='wallet_summary'),
     # path('transfer/', AdminTransferTimeView.as_view(), name='transfer_time'),
+    path('transfer/bulk/', AdminBulkTransferView.as_view(), name='bulk_transfer_time'),
     path('transactions/', TransactionHistoryView.as_view(), name='transaction_history'),
+    path('transactions/export/', TransactionExportView.as_view(), name='transaction_export'),
 ]
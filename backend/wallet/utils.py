@@ -1,46 +1,353 @@
-from decimal import Decimal
-from .models import Wallet, Transaction
+from collections import defaultdict
+from django.conf import settings
+from django.db import transaction
+from django.utils.timezone import now
+from django.db.models import BigIntegerField, Case, F, Value, When
+from .models import Wallet, WalletHold, Transaction
+from . import ledger
+from .rollups import apply_transactions
 from django.core.exceptions import ValidationError
 
-def process_booking_confirmation(booking):
-    wallet = Wallet.objects.get(user=booking.booked_by)
-    required_hours = Decimal(str(booking.duration / 60))
-    
-    print(f"Wallet Balance: {wallet.balance}, Required: {required_hours}")
-    
-    if not wallet.has_sufficient_balance(required_hours):
-        raise ValidationError("Insufficient balance.")
-
-    Transaction.objects.create(
-        wallet=wallet,
-        amount=required_hours,
-        transaction_type="pending",
-        reason="Booking confirmed",
-        booking=booking
+def transfer_time(sender, receiver, amount, reason="", booking=None, debit_reason=None, credit_reason=None):
+    """
+    Move ``amount`` minutes from ``sender``'s wallet to ``receiver``'s wallet.
+
+    Both balances are changed with single UPDATE statements (the debit is
+    conditional on the balance covering it), so no wallet row is read and
+    locked up front. In journal mode the balances are left alone and a
+    ledger entry pair is appended instead. Raises ValidationError if the
+    sender cannot pay.
+    """
+    amount = int(amount)
+    if amount <= 0:
+        raise ValueError("Amount must be positive.")
+    wallet_ids = dict(
+        Wallet.objects.filter(user__in=[sender, receiver]).values_list('user_id', 'id')
     )
 
-def process_booking_completion(booking):
-    booked_by_wallet = Wallet.objects.get(user=booking.booked_by)
-    booked_for_wallet = Wallet.objects.get(user=booking.booked_for)
-    
-    required_hours = Decimal(str(booking.duration / 60))
+    journal = getattr(settings, 'WALLET_LEDGER_JOURNAL', False)
+
+    with transaction.atomic():
+        if journal:
+            # Only the paying wallet is locked, so debits from one wallet are
+            # serialized while credits to busy wallets never wait on a row
+            if _locked_available_balance(wallet_ids[sender.pk]) < amount:
+                raise ValidationError("Insufficient balance.")
+        else:
+            # Touch the wallets in ascending primary-key order so two opposite
+            # transfers can never hold one row each and wait on the other
+            sender_first = wallet_ids[sender.pk] <= wallet_ids[receiver.pk]
+            if not sender_first:
+                Wallet.objects.filter(pk=wallet_ids[receiver.pk]).credit(amount)
+            if not Wallet.objects.filter(pk=wallet_ids[sender.pk]).debit(amount):
+                raise ValidationError("Insufficient balance.")
+            if sender_first:
+                Wallet.objects.filter(pk=wallet_ids[receiver.pk]).credit(amount)
+
+        return _record_transfer(
+            sender, receiver, wallet_ids[sender.pk], wallet_ids[receiver.pk], amount,
+            booking=booking, debit_reason=debit_reason or reason, credit_reason=credit_reason or reason,
+        )
+
 
-    booked_by_wallet.deduct(required_hours)
+def _locked_available_balance(wallet_id):
+    """Journal mode: lock the paying wallet and return its ledger balance minus open holds."""
+    held = Wallet.objects.select_for_update(no_key=True).values_list('held', flat=True).get(pk=wallet_id)
+    return ledger.ledger_balance(wallet_id) - held
 
-    booked_for_wallet.credit(required_hours)
 
-    Transaction.objects.create(
-        wallet=booked_by_wallet,
-        amount=required_hours,
+def _record_transfer(sender, receiver, sender_wallet_id, receiver_wallet_id, amount, booking=None, debit_reason="", credit_reason=""):
+    debit = Transaction.objects.create(
+        wallet_id=sender_wallet_id,
+        amount=amount,
         transaction_type="debit",
-        reason="Booking completed - Deducted",
+        reason=debit_reason,
+        sender=sender,
+        receiver=receiver,
         booking=booking
     )
-
-    Transaction.objects.create(
-        wallet=booked_for_wallet,
-        amount=required_hours,
+    credit = Transaction.objects.create(
+        wallet_id=receiver_wallet_id,
+        amount=amount,
         transaction_type="credit",
-        reason="Booking completed - Credited",
+        reason=credit_reason,
+        sender=sender,
+        receiver=receiver,
         booking=booking
-    )
\ No newline at end of file
+    )
+    if getattr(settings, 'WALLET_LEDGER_JOURNAL', False):
+        ledger.post_transfer(sender_wallet_id, receiver_wallet_id, amount, debit=debit, credit=credit)
+    return debit, credit
+
+
+def bulk_transfer_time(sender, entries):
+    """
+    Pay many receivers from ``sender``'s wallet in one database transaction.
+
+    ``entries`` is a list of dicts with ``receiver_id``, ``amount`` (minutes) and an
+    optional ``reason``. Every wallet involved is locked up front in
+    ascending primary-key order, entries are accepted in order while the
+    balance lasts, and the accepted ones are applied with one debit, one
+    multi-row credit UPDATE and a single ``bulk_create`` of Transaction rows
+    (so no per-row transfer e-mails are sent). Returns one result per entry.
+    """
+    results = []
+    for index, entry in enumerate(entries):
+        result = {'index': index, 'receiver_id': entry.get('receiver_id'), 'status': 'failed'}
+        try:
+            result['amount'] = int(entry.get('amount'))
+        except (TypeError, ValueError):
+            result['error'] = "Invalid amount."
+        else:
+            if result['amount'] <= 0:
+                result['error'] = "Amount must be positive."
+        results.append(result)
+
+    receiver_ids = {r['receiver_id'] for r in results if 'error' not in r}
+    journal = getattr(settings, 'WALLET_LEDGER_JOURNAL', False)
+
+    with transaction.atomic():
+        wallets = {
+            wallet.user_id: wallet
+            for wallet in Wallet.objects.select_for_update(no_key=True)
+            .filter(user_id__in=receiver_ids | {sender.pk})
+            .order_by('pk')
+        }
+        sender_wallet = wallets[sender.pk]
+        remaining = (ledger.ledger_balance(sender_wallet.pk) if journal else sender_wallet.balance) - sender_wallet.held
+
+        credits = {}
+        accepted = []
+        for result in results:
+            if 'error' in result:
+                continue
+            receiver_wallet = wallets.get(result['receiver_id'])
+            if receiver_wallet is None:
+                result['error'] = "Receiver not found."
+            elif receiver_wallet is sender_wallet:
+                result['error'] = "Cannot transfer to yourself."
+            elif result['amount'] > remaining:
+                result['error'] = "Insufficient balance."
+            else:
+                remaining -= result['amount']
+                credits[receiver_wallet.pk] = credits.get(receiver_wallet.pk, 0) + result['amount']
+                result['status'] = 'completed'
+                accepted.append((result, receiver_wallet))
+
+        if not accepted:
+            return results
+
+        total = sum(credits.values())
+        if not journal:
+            Wallet.objects.filter(pk=sender_wallet.pk).debit(total)
+            Wallet.objects.filter(pk__in=credits).update(
+                balance=F('balance') + Case(
+                    *[When(pk=pk, then=Value(amount)) for pk, amount in credits.items()],
+                    output_field=BigIntegerField(),
+                )
+            )
+
+        rows = []
+        for result, receiver_wallet in accepted:
+            reason = entries[result['index']].get('reason', '')
+            for wallet, transaction_type in ((sender_wallet, 'debit'), (receiver_wallet, 'credit')):
+                rows.append(Transaction(
+                    wallet=wallet,
+                    amount=result['amount'],
+                    transaction_type=transaction_type,
+                    reason=reason,
+                    sender=sender,
+                    receiver_id=receiver_wallet.user_id,
+                ))
+        rows = Transaction.objects.bulk_create(rows)
+        # bulk_create skips post_save, so fold the rows into the rollups here
+        apply_transactions(rows)
+
+        if journal:
+            ledger.post_transfers([
+                (sender_wallet.pk, receiver_wallet.pk, result['amount'], rows[2 * i], rows[2 * i + 1])
+                for i, (result, receiver_wallet) in enumerate(accepted)
+            ])
+
+    return results
+
+
+def place_hold(booking):
+    """
+    Reserve the booking's cost on the payer's wallet. The hold is taken with
+    one conditional UPDATE of ``Wallet.held``, so confirmed-but-unpaid
+    bookings can never add up to more than the wallet holds.
+    """
+    existing = WalletHold.objects.filter(booking=booking).first()
+    if existing is not None:
+        return existing
+
+    amount = booking.duration
+    wallet_id = Wallet.objects.values_list('id', flat=True).get(user=booking.booked_by)
+
+    with transaction.atomic():
+        if getattr(settings, 'WALLET_LEDGER_JOURNAL', False):
+            if _locked_available_balance(wallet_id) < amount:
+                raise ValidationError("Insufficient balance.")
+            Wallet.objects.filter(pk=wallet_id).update(held=F('held') + amount)
+        elif not Wallet.objects.filter(pk=wallet_id).hold(amount):
+            raise ValidationError("Insufficient balance.")
+        return WalletHold.objects.create(wallet_id=wallet_id, booking=booking, amount=amount)
+
+
+def release_hold(booking):
+    """Give a booking's held minutes back to the payer. Returns False if nothing was held."""
+    with transaction.atomic():
+        hold = WalletHold.objects.filter(booking=booking, status=WalletHold.HELD).first()
+        if hold is None:
+            return False
+        # Flip the hold's status conditionally so a concurrent capture/release cannot also apply it
+        if not WalletHold.objects.filter(pk=hold.pk, status=WalletHold.HELD).update(status=WalletHold.RELEASED):
+            return False
+        Wallet.objects.filter(pk=hold.wallet_id).release(hold.amount)
+    return True
+
+
+def capture_hold(booking, debit_reason="", credit_reason=""):
+    """
+    Settle the booking's hold: charge the payer, credit the provider and
+    record both Transaction rows. Returns None if the booking had no open hold.
+    """
+    amount = booking.duration
+    with transaction.atomic():
+        hold = WalletHold.objects.filter(booking=booking, status=WalletHold.HELD).first()
+        if hold is None or not WalletHold.objects.filter(pk=hold.pk, status=WalletHold.HELD).update(status=WalletHold.CAPTURED):
+            return None
+
+        receiver_wallet_id = Wallet.objects.values_list('id', flat=True).get(user=booking.booked_for)
+        if getattr(settings, 'WALLET_LEDGER_JOURNAL', False):
+            if _locked_available_balance(hold.wallet_id) + hold.amount < amount:
+                raise ValidationError("Insufficient balance.")
+            Wallet.objects.filter(pk=hold.wallet_id).update(held=F('held') - hold.amount)
+        else:
+            sender_first = hold.wallet_id <= receiver_wallet_id
+            if not sender_first:
+                Wallet.objects.filter(pk=receiver_wallet_id).credit(amount)
+            if not Wallet.objects.filter(pk=hold.wallet_id).capture(hold.amount, amount):
+                raise ValidationError("Insufficient balance.")
+            if sender_first:
+                Wallet.objects.filter(pk=receiver_wallet_id).credit(amount)
+
+        return _record_transfer(
+            booking.booked_by, booking.booked_for, hold.wallet_id, receiver_wallet_id, amount,
+            booking=booking, debit_reason=debit_reason, credit_reason=credit_reason,
+        )
+
+
+def capture_holds(provider, bookings, debit_reason="", credit_reason=""):
+    """
+    Pay ``provider`` for many bookings in one database transaction, e.g.
+    every attendee of a group session.
+
+    ``bookings`` need ``pk``, ``booked_by_id`` and ``duration``. Open holds
+    are captured and bookings confirmed before holds existed are charged
+    directly. Each payer's wallet is charged with one UPDATE and the
+    provider is credited once with the total (wallets touched in ascending
+    primary-key order), then the Transaction rows are bulk created. Raises
+    ValidationError if a payer cannot pay, leaving everything unchanged.
+    """
+    if not bookings:
+        return []
+    journal = getattr(settings, 'WALLET_LEDGER_JOURNAL', False)
+
+    with transaction.atomic():
+        holds = {
+            booking_id: (hold_id, wallet_id, amount)
+            for booking_id, hold_id, wallet_id, amount in WalletHold.objects.select_for_update()
+            .filter(booking__in=[booking.pk for booking in bookings], status=WalletHold.HELD)
+            .values_list('booking_id', 'id', 'wallet_id', 'amount')
+        }
+        WalletHold.objects.filter(pk__in=[hold[0] for hold in holds.values()]).update(status=WalletHold.CAPTURED, updated_at=now())
+
+        wallet_ids = dict(
+            Wallet.objects.filter(user_id__in={booking.booked_by_id for booking in bookings} | {provider.pk}).values_list('user_id', 'id')
+        )
+        receiver_wallet_id = wallet_ids[provider.pk]
+        payer_wallets = {}
+        # payer wallet -> [held minutes to release, minutes to charge]
+        charges = defaultdict(lambda: [0, 0])
+        for booking in bookings:
+            hold = holds.get(booking.pk)
+            payer_wallets[booking.pk] = hold[1] if hold else wallet_ids[booking.booked_by_id]
+            charge = charges[payer_wallets[booking.pk]]
+            charge[0] += hold[2] if hold else 0
+            charge[1] += booking.duration
+        total = sum(amount for _, amount in charges.values())
+
+        if journal:
+            for wallet_id in sorted(charges):
+                held, amount = charges[wallet_id]
+                if _locked_available_balance(wallet_id) + held < amount:
+                    raise ValidationError("Insufficient balance.")
+                if held:
+                    Wallet.objects.filter(pk=wallet_id).update(held=F('held') - held)
+        else:
+            for wallet_id in sorted(set(charges) | {receiver_wallet_id}):
+                if wallet_id == receiver_wallet_id:
+                    Wallet.objects.filter(pk=wallet_id).credit(total)
+                if wallet_id in charges and not Wallet.objects.filter(pk=wallet_id).capture(*charges[wallet_id]):
+                    raise ValidationError("Insufficient balance.")
+
+        rows = []
+        for booking in bookings:
+            for wallet_id, transaction_type, reason in (
+                (payer_wallets[booking.pk], 'debit', debit_reason),
+                (receiver_wallet_id, 'credit', credit_reason),
+            ):
+                rows.append(Transaction(
+                    wallet_id=wallet_id,
+                    amount=booking.duration,
+                    transaction_type=transaction_type,
+                    reason=reason,
+                    sender_id=booking.booked_by_id,
+                    receiver_id=provider.pk,
+                    booking_id=booking.pk,
+                ))
+        rows = Transaction.objects.bulk_create(rows)
+        # bulk_create skips post_save, so fold the rows into the rollups here
+        apply_transactions(rows)
+
+        if journal:
+            ledger.post_transfers([
+                (payer_wallets[booking.pk], receiver_wallet_id, booking.duration, rows[2 * i], rows[2 * i + 1])
+                for i, booking in enumerate(bookings)
+            ])
+    return rows
+
+
+def process_booking_confirmation(booking):
+    return place_hold(booking)
+
+
+def process_booking_cancellation(booking):
+    return release_hold(booking)
+
+
+def process_booking_completion(booking):
+    debit_reason = "Booking completed - Deducted"
+    credit_reason = "Booking completed - Credited"
+
+    captured = capture_hold(booking, debit_reason=debit_reason, credit_reason=credit_reason)
+    if captured is not None:
+        return captured
+
+    # Bookings confirmed before holds existed are paid directly
+    return transfer_time(
+        booking.booked_by,
+        booking.booked_for,
+        booking.duration,
+        booking=booking,
+        debit_reason=debit_reason,
+        credit_reason=credit_reason,
+    )
+
+
+def process_bulk_booking_completion(provider, bookings):
+    return capture_holds(
+        provider, bookings, debit_reason="Booking completed - Deducted", credit_reason="Booking completed - Credited",
+    )
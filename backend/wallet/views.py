@@ -1,26 +1,36 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, permissions
-from django.db import transaction
-from rest_framework.pagination import PageNumberPagination
+from django.core.exceptions import ValidationError
+from decimal import InvalidOperation
+from rest_framework.pagination import CursorPagination
+from django.db.models import Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils.dateparse import parse_date
+from django.http import StreamingHttpResponse
 from rest_framework.generics import ListAPIView
 from rest_framework.permissions import IsAdminUser
-from .models import Wallet, Transaction
-from .serializers import WalletSerializer, TransactionSerializer
+from .models import Wallet, Transaction, WalletRollup
+from .serializers import WalletSerializer, TransactionSerializer, BulkTransferSerializer, WalletRollupSerializer
 from .permissions import IsSender
-from django.conf import settings
-from django.core.mail import send_mail
+from .utils import transfer_time, bulk_transfer_time
+from .exports import EXPORT_FORMATS, stream_export
+from .units import hours_to_minutes, minutes_to_hours
+from django.contrib.auth import get_user_model
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
+from utils.idempotency import idempotent
 
 
-User = settings.AUTH_USER_MODEL
+User = get_user_model()
 
-# Pagination for transaction history
-class TransactionPagination(PageNumberPagination):
+# Pagination for transaction history: keyset on (created_at, id) so deep pages
+# cost the same as the first one (no COUNT(*) or OFFSET)
+class TransactionPagination(CursorPagination):
     page_size = 5
     page_size_query_param = 'page_size'
     max_page_size = 100
+    ordering = ('-created_at', '-id')
 
 # Wallet View to show the user's wallet balance
 class WalletView(APIView):
@@ -47,7 +57,7 @@ class AdminTransferTimeView(APIView):
             required=['receiver_id', 'amount'],
             properties={
                 'receiver_id': openapi.Schema(type=openapi.TYPE_INTEGER, description='ID of the receiver user'),
-                'amount': openapi.Schema(type=openapi.TYPE_NUMBER, format='float', description='Amount to transfer'),
+                'amount': openapi.Schema(type=openapi.TYPE_NUMBER, format='float', description='Amount of hours to transfer'),
                 'reason': openapi.Schema(type=openapi.TYPE_STRING, description='Reason for transfer', default="")
             }
         ),
@@ -58,7 +68,7 @@ class AdminTransferTimeView(APIView):
             500: openapi.Response(description="Transaction failed")
         }
     )
-
+    @idempotent
     def post(self, request):
         sender = request.user
         receiver_id = request.data.get('receiver_id')
@@ -72,30 +82,45 @@ class AdminTransferTimeView(APIView):
             return Response({"error": "Receiver not found."}, status=status.HTTP_404_NOT_FOUND)
 
 
-        # Transaction is wrapped in atomic to ensure consistency
+        # Balances are changed with conditional UPDATEs inside transfer_time,
+        # so no wallet rows are locked while the request is processed
         try:
-            with transaction.atomic():
-                 # Lock sender and receiver wallets for update
-                sender_wallet = Wallet.objects.select_for_update().get(user=sender)
-                receiver_wallet = Wallet.objects.select_for_update().get(user=receiver)
-                
-                amount = float(amount)
-                if not sender_wallet.has_sufficient_balance(amount):
-                    return Response({"error": "Insufficient balance."}, status=status.HTTP_400_BAD_REQUEST)
-
-                # Udate the Wallet balances and Perform the transfer
-                sender_wallet.deduct(amount)
-                receiver_wallet.credit(amount)
-
-                # Create a new transaction record
-                Transaction.objects.create(wallet=sender_wallet, amount=amount, transaction_type='debit', reason=reason, sender=sender, receiver=receiver)
-                Transaction.objects.create(wallet=receiver_wallet, amount=amount, transaction_type='credit', reason=reason, sender=sender, receiver=receiver)
-
+            transfer_time(sender, receiver, hours_to_minutes(amount), reason=reason)
+        except (TypeError, ValueError, InvalidOperation):
+            return Response({"error": "Invalid amount."}, status=status.HTTP_400_BAD_REQUEST)
+        except ValidationError:
+            return Response({"error": "Insufficient balance."}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response({"error": "Transaction failed.", "details": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
         return Response({"message": "Time transferred successfully."}, status=status.HTTP_200_OK)
 
+# Bulk Transfer View (stipend payouts to many users in one transaction)
+class AdminBulkTransferView(APIView):
+    permission_classes = [IsAdminUser]
+
+    @swagger_auto_schema(
+        operation_description="Transfer time from the admin to many users at once. Entries are applied in order "
+                              "while the balance lasts; the response reports the outcome of every entry.",
+        request_body=BulkTransferSerializer,
+        responses={
+            200: openapi.Response(description="Per-entry transfer results"),
+            400: openapi.Response(description="Invalid input")
+        }
+    )
+    @idempotent
+    def post(self, request):
+        serializer = BulkTransferSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        results = bulk_transfer_time(request.user, serializer.validated_data['transfers'])
+        completed = sum(1 for result in results if result['status'] == 'completed')
+        return Response({
+            "completed": completed,
+            "failed": len(results) - completed,
+            "results": results,
+        }, status=status.HTTP_200_OK)
+
 # Transaction History View (with pagination and filters)
 class TransactionHistoryView(ListAPIView):
     queryset = Transaction.objects.all().order_by('-created_at')
@@ -118,9 +143,91 @@ class TransactionHistoryView(ListAPIView):
         return super().get(request, *args, **kwargs)
 
     def get_queryset(self):
+        # Resolve the caller's wallet id first so the history is read straight
+        # off the (wallet, created_at, id) index
+        wallet_id = Wallet.objects.filter(user=self.request.user).values('id')[:1]
+        queryset = Transaction.objects.filter(wallet_id=Subquery(wallet_id)).select_related('sender', 'receiver')
+
+        # Amounts are always positive; the direction is the transaction type
         filter_type = self.request.query_params.get('type', None)
         if filter_type == 'earned':
-            return Transaction.objects.filter(amount__gt=0)
+            return queryset.filter(transaction_type='credit')
         elif filter_type == 'spent':
-            return Transaction.objects.filter(amount__lt=0)
-        return Transaction.objects.all()
+            return queryset.filter(transaction_type='debit')
+        return queryset
+
+
+# Transaction Export View (streams the full history as CSV or NDJSON)
+class TransactionExportView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_description="Stream the authenticated user's full transaction history as CSV or NDJSON. "
+                              "Staff may export another user's history with 'user_id'.",
+        manual_parameters=[
+            openapi.Parameter('export_format', openapi.IN_QUERY, description="'csv' (default) or 'ndjson'", type=openapi.TYPE_STRING),
+            openapi.Parameter('user_id', openapi.IN_QUERY, description="Staff only: user whose history to export", type=openapi.TYPE_INTEGER),
+        ],
+        responses={200: openapi.Response(description="Streamed export"), 400: "Invalid format or user_id"}
+    )
+    def get(self, request):
+        export_format = request.query_params.get('export_format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            return Response({"error": "export_format must be 'csv' or 'ndjson'."}, status=status.HTTP_400_BAD_REQUEST)
+
+        user_id = request.user.id
+        if request.user.is_staff and request.query_params.get('user_id'):
+            try:
+                user_id = int(request.query_params['user_id'])
+            except ValueError:
+                return Response({"error": "user_id must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = Transaction.objects.filter(wallet__user_id=user_id)
+        response = StreamingHttpResponse(stream_export(queryset, export_format), content_type=EXPORT_FORMATS[export_format])
+        response['Content-Disposition'] = f'attachment; filename="transactions-{user_id}.{export_format}"'
+        return response
+
+
+# Wallet Summary View (earned/spent totals read from the pre-aggregated rollups)
+class WalletSummaryView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+    # Most recent periods listed under "periods"
+    max_periods = 400
+
+    @swagger_auto_schema(
+        operation_description="Earned/spent totals per day or month for the authenticated user's wallet.",
+        manual_parameters=[
+            openapi.Parameter('period', openapi.IN_QUERY, description="'month' (default) or 'day'", type=openapi.TYPE_STRING),
+            openapi.Parameter('start', openapi.IN_QUERY, description="First period to include (YYYY-MM-DD)", type=openapi.TYPE_STRING),
+            openapi.Parameter('end', openapi.IN_QUERY, description="Last period to include (YYYY-MM-DD)", type=openapi.TYPE_STRING),
+        ],
+        responses={200: WalletRollupSerializer(many=True), 400: "Invalid parameters"}
+    )
+    def get(self, request):
+        period = request.query_params.get('period', WalletRollup.MONTH)
+        if period not in (WalletRollup.DAY, WalletRollup.MONTH):
+            return Response({"error": "period must be 'day' or 'month'."}, status=status.HTTP_400_BAD_REQUEST)
+
+        rollups = WalletRollup.objects.filter(wallet__user=request.user, period=period)
+        for param, lookup in (('start', 'period_start__gte'), ('end', 'period_start__lte')):
+            value = request.query_params.get(param)
+            if value:
+                try:
+                    day = parse_date(value)
+                except ValueError:
+                    day = None
+                if day is None:
+                    return Response({"error": f"{param} must be a date (YYYY-MM-DD)."}, status=status.HTTP_400_BAD_REQUEST)
+                rollups = rollups.filter(**{lookup: day})
+
+        # Totals cover the whole range; only the per-period breakdown is capped
+        totals = rollups.aggregate(earned=Coalesce(Sum('earned'), 0), spent=Coalesce(Sum('spent'), 0))
+        earned, spent = totals['earned'], totals['spent']
+        rollups = rollups.order_by('-period_start')[:self.max_periods]
+        return Response({
+            "period": period,
+            "earned": str(minutes_to_hours(earned)),
+            "spent": str(minutes_to_hours(spent)),
+            "net": str(minutes_to_hours(earned - spent)),
+            "periods": WalletRollupSerializer(rollups, many=True).data,
+        })
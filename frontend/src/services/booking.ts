@@ -25,11 +25,24 @@ export const createBooking = async (
   }
 };
 
+interface CursorPage<T> {
+  next: string | null;
+  previous: string | null;
+  results: T[];
+}
+
 export const fetchMyBookings = async (): Promise<Booking<Skill>[]> => {
   try {
-    const response = await apiClient.get("/bookings/my/bookings/");
-    console.log("Fetch my bookings response:", response.data);
-    return response.data;
+    // The endpoint is cursor-paginated (latest first); follow `next` to collect every page
+    const bookings: Booking<Skill>[] = [];
+    let url: string | null = "/bookings/my/bookings/";
+    while (url) {
+      const response: { data: CursorPage<Booking<Skill>> } = await apiClient.get(url, { params: { page_size: 100 } });
+      bookings.push(...response.data.results);
+      url = response.data.next;
+    }
+    console.log("Fetch my bookings response:", bookings);
+    return bookings;
   } catch (error) {
     console.error("Error fetching my bookings:", error);
     throw error;